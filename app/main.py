@@ -7,6 +7,8 @@ from logger import log
 from sqlalchemy.orm import Session
 from database import Base, engine, get_db
 from models.models import Customer
+from services.ad_events import METRICS_SINK, start_background_compaction, stop_background_compaction
+from services.ad_counters import start_background_fold, stop_background_fold
 
 descripcion = "Enterate: API REST"
     
@@ -38,6 +40,14 @@ def init_db():
             conn.exec_driver_sql(f"CREATE SCHEMA IF NOT EXISTS {schema}")
     # Crear tablas si no existen (al cargar el módulo)
     Base.metadata.create_all(bind=engine)
+    if METRICS_SINK == "log":
+        start_background_compaction()
+    start_background_fold()
+
+@app.on_event("shutdown")
+def close_event_log():
+    stop_background_compaction()
+    stop_background_fold()
 
 @app.get("/", include_in_schema=False)
 def redirigir():
@@ -1,4 +1,4 @@
-from sqlalchemy import TIMESTAMP, CheckConstraint, Column, Float, Integer, String, Text
+from sqlalchemy import TIMESTAMP, BigInteger, CheckConstraint, Column, Float, Integer, String, Text
 from database import Base
 from pydantic import BaseModel, Field, conlist, validator, field_validator
 from typing import Literal, List, Optional
@@ -42,6 +42,10 @@ class Incident(Base):
     city = Column(String(100), nullable=False)
     street = Column(String(1000), nullable=True)
     street_number = Column(String(20), nullable=True)
+    # intervalo de portales (i-DE): "2-40 pares" -> 2, 40, "par"
+    street_number_from = Column(BigInteger, nullable=True)
+    street_number_to = Column(BigInteger, nullable=True)
+    street_number_parity = Column(String(10), nullable=True)
     lat = Column(Float, nullable=True)
     lon = Column(Float, nullable=True)
     start_ts_utc = Column(TIMESTAMP(timezone=True), nullable=False)
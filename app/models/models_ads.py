@@ -62,3 +62,29 @@ class AdStatsDaily(Base):
     clicks = Column(Integer, nullable=False, default=0)
 
     ad = relationship("Ad", back_populates="stats")
+
+class AdEventSegment(Base):
+    # Segmentos del log de eventos ya plegados en ads/ad_stats_daily (idempotencia de la compactación)
+    __tablename__ = "ad_event_segments"
+    __table_args__ = {"schema": "public"}
+    name = Column(String(200), primary_key=True)
+    events = Column(Integer, nullable=False, default=0)
+    compacted_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+class AdCounterShard(Base):
+    # Contadores de totales repartidos en N filas por anuncio para evitar el lock de la fila de ads
+    __tablename__ = "ad_counter_shards"
+    __table_args__ = {"schema": "public"}
+    ad_id = Column(Integer, ForeignKey("public.ads.id"), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    impressions = Column(Integer, nullable=False, default=0)
+    clicks = Column(Integer, nullable=False, default=0)
+
+class AdStatsDailyShard(Base):
+    __tablename__ = "ad_stats_daily_shards"
+    __table_args__ = {"schema": "public"}
+    ad_id = Column(Integer, ForeignKey("public.ads.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    impressions = Column(Integer, nullable=False, default=0)
+    clicks = Column(Integer, nullable=False, default=0)
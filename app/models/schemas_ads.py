@@ -1,6 +1,7 @@
 # schemas_ads.py
-from pydantic import BaseModel, Field, HttpUrl, EmailStr
-from datetime import datetime, date
+import os
+from pydantic import BaseModel, Field, HttpUrl, EmailStr, field_validator
+from datetime import datetime, date, timedelta
 from typing import Optional, Literal
 
 AdStatus = Literal["draft", "active", "paused", "archived"]
@@ -54,6 +55,33 @@ class ServeAdOut(BaseModel):
     ttl_seconds: int = 60
 
 # ---- Métricas
+AdEventType = Literal["impression", "click"]
+# ventana admitida para el ts del cliente (beacons retrasados / relojes desajustados): fuera de
+# ella el evento podría reescribir las estadísticas de cualquier día
+EVENT_MAX_AGE = timedelta(hours=float(os.getenv("ADS_EVENT_MAX_AGE_HOURS", "24")))
+EVENT_MAX_SKEW = timedelta(minutes=float(os.getenv("ADS_EVENT_MAX_SKEW_MINUTES", "5")))
+
+class AdEventIn(BaseModel):
+    ad_id: int
+    type: AdEventType
+    ts: datetime
+    client_id: Optional[str] = Field(None, max_length=128)
+    nonce: Optional[str] = Field(None, max_length=128)
+
+    @field_validator("ts")
+    @classmethod
+    def ts_near_server_time(cls, v: datetime) -> datetime:
+        # sin zona: hora local del servidor, como en routes_ads._event_day
+        now = datetime.now(v.tzinfo) if v.tzinfo else datetime.now()
+        if not now - EVENT_MAX_AGE <= v <= now + EVENT_MAX_SKEW:
+            raise ValueError(f"ts fuera de la ventana admitida ({EVENT_MAX_AGE} atrás, {EVENT_MAX_SKEW} adelante)")
+        return v
+
+class AdEventBatchOut(BaseModel):
+    accepted: int
+    rejected: int
+    duplicates: int = 0
+
 class StatsOut(BaseModel):
     ad_id: int
     date: date
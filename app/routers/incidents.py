@@ -1,11 +1,12 @@
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Path, Query, status
 from pydantic import BaseModel, Field
-from sqlalchemy import Enum
+from sqlalchemy import Enum, and_, or_
 from database import get_db
 from sqlalchemy.orm import Session
 from models.models import Incident
 import hashlib
+import re
 from datetime import datetime, timezone
 
 from schemas.schemas import IncidentSchema, IncidentCreate
@@ -86,6 +87,7 @@ def filter_incidents(
     category: str = Query(None, enum=["gas", "road", "road_works", "electricity", "water"], description="Filter by incident category"),
     status: str = Query(None, enum=["planned", "active", "unplanned"], description="Filter by incident status"),
     street: str = Query(None, description="Filter by street name (partial match)"),
+    street_number: str = Query(None, description="Filter by street number, including incidents whose range covers it"),
     db: Session = Depends(get_db)
 ):
     """
@@ -96,6 +98,7 @@ def filter_incidents(
     - **category**: The type/category of the incident
     - **status**: Current status of the incident
     - **street**: Street name (supports partial matches)
+    - **street_number**: Street number ("12", "12 B"); matches single numbers and ranges such as "2-40 pares"
     
     Returns a list of incidents matching the specified filters.
     """
@@ -109,10 +112,33 @@ def filter_incidents(
         query = query.filter(Incident.status == status)
     if street:
         query = query.filter(Incident.street.ilike(f"%{street}%"))
+    if street_number:
+        query = query.filter(_number_matches(street_number))
     
     return query.all()
 
 
+_PORTAL = re.compile(r"^\s*(\d+)")
+
+def _number_matches(street_number: str):
+    """Portal dentro del intervalo (desde/hasta/paridad) o, sin intervalo, igual al número."""
+    m = _PORTAL.match(street_number)
+    if not m:
+        return Incident.street_number.ilike(street_number.strip())
+    n = int(m.group(1))
+    in_range = and_(
+        Incident.street_number_from <= n,
+        Incident.street_number_to >= n,
+        or_(Incident.street_number_parity.is_(None),
+            Incident.street_number_parity.in_(["todos", "par" if n % 2 == 0 else "impar"])),
+    )
+    point = and_(
+        Incident.street_number_from.is_(None),
+        or_(Incident.street_number == str(n), Incident.street_number.ilike(f"{n} %")),
+    )
+    return or_(in_range, point)
+
+
 def _norm(s: Optional[str]) -> str:
     return (s or "").strip().lower()
 
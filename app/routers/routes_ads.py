@@ -1,8 +1,11 @@
 # routes_ads.py
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import select, update, func
 from datetime import date
+from collections import Counter
+from contextlib import contextmanager
+import os
 import random
 
 from database import get_db, engine  # get_db viene de tu módulo
@@ -10,8 +13,15 @@ from models.models_ads import Plan, Advertiser, Ad, AdStatsDaily, AdStatusEnum,
 from models.schemas_ads import (
     PlanCreate, PlanOut,
     AdvertiserCreate, AdvertiserOut,
-    AdCreate, AdOut, ServeAdOut, StatsOut
+    AdCreate, AdOut, ServeAdOut, StatsOut,
+    AdEventIn, AdEventBatchOut
 )
+from services.ad_events import event_log, METRICS_SINK
+from services import ad_counters
+from services.ad_cache import ad_ids
+from services.click_dedup import click_dedup
+
+BATCH_MAX_EVENTS = int(os.getenv("ADS_BATCH_MAX_EVENTS", "1000"))
 
 router = APIRouter(prefix="", tags=["ads"])
 
@@ -94,7 +104,7 @@ def serve_ad(
     ad_id, title, media_url, target_url = random.choice(active_ads)
 
     # registrar 1 impresión (totales + diario)
-    _increment_metric(db, ad_id, metric="impressions", amount=1)
+    _record_metric(db, ad_id, metric="impressions")
 
     return ServeAdOut(ad_id=ad_id, title=title, media_url=media_url, target_url=target_url)
 
@@ -115,6 +125,7 @@ def create_ad(payload: AdCreate, db: Session = Depends(get_db)):
     db.add(ad)
     db.commit()
     db.refresh(ad)
+    ad_ids.invalidate()
     return _ad_to_out(ad)
 
 @router.get("/ads", response_model=list[AdOut])
@@ -126,14 +137,15 @@ def list_ads(
     if status:
         stmt = stmt.where(Ad.status == status)
     ads = db.execute(stmt.order_by(Ad.id)).scalars().all()
-    return [_ad_to_out(a) for a in ads]
+    pending = ad_counters.shard_totals(db, [a.id for a in ads])
+    return [_ad_to_out(a, pending.get(a.id)) for a in ads]
 
 @router.get("/ads/{ad_id}", response_model=AdOut)
 def get_ad(ad_id: int, db: Session = Depends(get_db)):
     ad = db.get(Ad, ad_id)
     if not ad:
         raise HTTPException(404, "Anuncio no existe")
-    return _ad_to_out(ad)
+    return _ad_to_out(ad, ad_counters.shard_totals(db, [ad_id]).get(ad_id))
 
 @router.post("/ads/{ad_id}/activate", response_model=AdOut)
 def activate_ad(ad_id: int, db: Session = Depends(get_db)):
@@ -150,67 +162,135 @@ def _set_status(ad_id: int, new_status: AdStatusEnum, db: Session) -> AdOut:
     ad.status = new_status
     db.commit()
     db.refresh(ad)
-    return _ad_to_out(ad)
+    return _ad_to_out(ad, ad_counters.shard_totals(db, [ad_id]).get(ad_id))
 
 # ---------------- MÉTRICAS ----------------
 @router.post("/ads/{ad_id}/impression")
 def register_impression(ad_id: int, db: Session = Depends(get_db)):
     _ensure_ad_exists(db, ad_id)
-    _increment_metric(db, ad_id, metric="impressions", amount=1)
+    _record_metric(db, ad_id, metric="impressions")
     return {"ok": True}
 
 @router.post("/ads/{ad_id}/click")
-def register_click(ad_id: int, db: Session = Depends(get_db)):
+def register_click(
+    ad_id: int,
+    client_id: str | None = Query(None, max_length=128, description="Id del dispositivo (para descartar reintentos)"),
+    nonce: str | None = Query(None, max_length=128, description="Id único del clic en el cliente"),
+    db: Session = Depends(get_db)
+):
     _ensure_ad_exists(db, ad_id)
-    _increment_metric(db, ad_id, metric="clicks", amount=1)
+    keys = [(ad_id, client_id, nonce)] if client_id and nonce else []
+    if keys and not click_dedup.reserve(*keys[0]):
+        return {"ok": True, "duplicate": True}
+    with _counting(keys):
+        _record_metric(db, ad_id, metric="clicks")
     return {"ok": True}
 
+@router.post("/ads/events/batch", response_model=AdEventBatchOut)
+def register_events_batch(
+    events: list[AdEventIn] = Body(..., max_length=BATCH_MAX_EVENTS),
+    db: Session = Depends(get_db)
+):
+    # Beacon agrupado de la app: valida contra la caché de ids y aplica todo en una transacción.
+    # Los eventos de anuncios inexistentes se descartan (no se rechaza el lote entero).
+    known = ad_ids.ids(db, {e.ad_id for e in events})
+    valid = [e for e in events if e.ad_id in known]
+    fresh, clicks = [], []
+    for e in valid:
+        key = _click_key(e)
+        if key is not None:
+            # reserva atómica: ni repetidos del lote ni reintentos en vuelo pasan dos veces
+            if not click_dedup.reserve(*key):
+                continue
+            clicks.append(key)
+        fresh.append(e)
+    with _counting(clicks):
+        _record_metrics(db, fresh)
+    return AdEventBatchOut(accepted=len(fresh), rejected=len(events) - len(valid),
+                           duplicates=len(valid) - len(fresh))
+
 # ---------------- REPORTES ----------------
 @router.get("/reports/ads/{ad_id}/daily", response_model=list[StatsOut])
 def get_daily_stats(ad_id: int, db: Session = Depends(get_db)):
     _ensure_ad_exists(db, ad_id)
     rows = db.execute(
-        select(AdStatsDaily.ad_id, AdStatsDaily.day, AdStatsDaily.impressions, AdStatsDaily.clicks)
+        select(AdStatsDaily.day, AdStatsDaily.impressions, AdStatsDaily.clicks)
         .where(AdStatsDaily.ad_id == ad_id)
         .order_by(AdStatsDaily.day.desc())
         .limit(31)
     ).all()
-    return [StatsOut(ad_id=r[0], date=r[1], impressions=r[2], clicks=r[3]) for r in rows]
+    # suma lo que aún está en los shards (sin plegar)
+    days = {r[0]: [r[1], r[2]] for r in rows}
+    for day, (imp, clk) in ad_counters.shard_daily(db, ad_id).items():
+        cur = days.setdefault(day, [0, 0])
+        cur[0] += imp
+        cur[1] += clk
+    return [StatsOut(ad_id=ad_id, date=d, impressions=days[d][0], clicks=days[d][1])
+            for d in sorted(days, reverse=True)[:31]]
 
 # ---------------- Helpers ----------------
 def _ensure_ad_exists(db: Session, ad_id: int):
     if not db.get(Ad, ad_id):
         raise HTTPException(404, "Anuncio no existe")
 
-def _increment_metric(db: Session, ad_id: int, metric: str, amount: int):
-    ad = db.get(Ad, ad_id)
-    if not ad:
-        raise HTTPException(404, "Anuncio no existe")
-
-    if metric == "impressions":
-        ad.total_impressions += amount
+def _record_metric(db: Session, ad_id: int, metric: str):
+    # Por defecto va al log de eventos (lo pliega services.ad_events.compact); con
+    # ADS_METRICS_SINK=db se hace commit en Postgres en la propia petición
+    if METRICS_SINK == "log":
+        event_log.append(ad_id, metric)
     else:
-        ad.total_clicks += amount
+        _increment_metric(db, ad_id, metric=metric, amount=1)
 
-    today = date.today()
-    stats = db.get(AdStatsDaily, {"ad_id": ad_id, "day": today})
-    if not stats:
-        stats = AdStatsDaily(ad_id=ad_id, day=today, impressions=0, clicks=0)
-        db.add(stats)
+@contextmanager
+def _counting(keys: list[tuple[int, str, str]]):
+    # clics reservados: se confirman si se cuentan; si falla el registro se liberan y el
+    # reintento del cliente cuenta
+    try:
+        yield
+    except BaseException:
+        for key in keys:
+            click_dedup.release(*key)
+        raise
+    for key in keys:
+        click_dedup.commit(*key)
 
-    if metric == "impressions":
-        stats.impressions += amount
-    else:
-        stats.clicks += amount
+def _click_key(e: AdEventIn) -> tuple[int, str, str] | None:
+    # (ad_id, client_id, nonce) de un clic deduplicable; None para el resto de eventos
+    if e.type == "click" and e.client_id and e.nonce:
+        return e.ad_id, e.client_id, e.nonce
+    return None
+
+def _event_day(e: AdEventIn) -> date:
+    # mismo criterio que date.today(): día en hora local del servidor
+    return e.ts.astimezone().date() if e.ts.tzinfo else e.ts.date()
+
+def _record_metrics(db: Session, events: list[AdEventIn]):
+    if not events:
+        return
+    if METRICS_SINK == "log":
+        for e in events:
+            event_log.append(e.ad_id, f"{e.type}s", ts=e.ts, day=_event_day(e))
+        return
+    grouped = Counter((e.ad_id, _event_day(e), f"{e.type}s") for e in events)
+    for (ad_id, day, metric), amount in grouped.items():
+        ad_counters.increment(db, ad_id, day, metric, amount)
+    db.commit()
+
+def _increment_metric(db: Session, ad_id: int, metric: str, amount: int):
+    if not db.get(Ad, ad_id):
+        raise HTTPException(404, "Anuncio no existe")
 
+    # UPSERT en el shard (ad_id, shard) de totales y diario; ads/ad_stats_daily los
+    # actualiza ad_counters.fold()
+    ad_counters.increment(db, ad_id, date.today(), metric, amount)
     db.commit()
-    # no hace falta refresh aquí
 
-def _ad_to_out(a: Ad) -> AdOut:
+def _ad_to_out(a: Ad, pending: tuple[int, int] | None = None) -> AdOut:
+    imp, clk = pending or (0, 0)
     return AdOut(
         id=a.id, user_id=a.user_id, title=a.title,
         media_url=a.media_url, target_url=a.target_url,
         status=a.status.value if hasattr(a.status, "value") else a.status,
-        created_at=a.created_at, total_impressions=a.total_impressions,
-        total_clicks=a.total_clicks
+        created_at=a.created_at, total_impressions=a.total_impressions + imp,
+        total_clicks=a.total_clicks + clk
     )
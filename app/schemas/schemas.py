@@ -10,6 +10,9 @@ class IncidentSchema(BaseModel):
     city: str = Field(description="City where the incident occurred")
     street: Optional[str] = Field(None, description="Street name where the incident is located")
     street_number: Optional[str] = Field(None, description="Street number of the incident location")
+    street_number_from: Optional[int] = Field(None, description="First street number of the affected range")
+    street_number_to: Optional[int] = Field(None, description="Last street number of the affected range")
+    street_number_parity: Optional[str] = Field(None, description="Side of the range: todos, par or impar")
     lat: Optional[float] = Field(description="Latitude coordinate of the incident")
     lon: Optional[float] = Field(description="Longitude coordinate of the incident")
     start_ts_utc: Optional[datetime] = Field(None, description="Start timestamp of the incident in UTC")
@@ -0,0 +1,41 @@
+# ad_cache.py
+# Conjunto de ids de anuncios en memoria (por worker) para validar eventos sin hacer
+# un db.get(Ad, ...) por evento. Se refresca por TTL y, como mucho una vez cada
+# MIN_REFRESH segundos, cuando llega un id desconocido (anuncio creado en otro worker).
+import os
+import time
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models.models_ads import Ad
+
+TTL = float(os.getenv("ADS_ID_CACHE_TTL", "30"))
+MIN_REFRESH = float(os.getenv("ADS_ID_CACHE_MIN_REFRESH", "1"))
+
+
+class AdIdCache:
+    def __init__(self, ttl: float = TTL, min_refresh: float = MIN_REFRESH):
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self._ids: frozenset[int] = frozenset()
+        self._loaded_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def _refresh(self, db: Session) -> None:
+        with self._lock:
+            self._ids = frozenset(db.execute(select(Ad.id)).scalars())
+            self._loaded_at = time.monotonic()
+
+    def ids(self, db: Session, wanted: set[int] | None = None) -> frozenset[int]:
+        age = time.monotonic() - self._loaded_at
+        if age >= self.ttl or (wanted and not wanted <= self._ids and age >= self.min_refresh):
+            self._refresh(db)
+        return self._ids
+
+    def invalidate(self) -> None:
+        self._loaded_at = float("-inf")
+
+
+ad_ids = AdIdCache()
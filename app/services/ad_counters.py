@@ -0,0 +1,152 @@
+# ad_counters.py
+# Contadores de impresiones/clics repartidos en shards: cada incremento es un UPSERT sobre
+# (ad_id, shard) en vez de un UPDATE sobre la fila de ads, así que varios workers no se
+# serializan en el mismo lock. Las lecturas suman los shards y fold() los pliega en
+# ads.total_* / ad_stats_daily periódicamente.
+import os
+import random
+import threading
+from datetime import date
+from collections import defaultdict
+
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+from logger import log
+from models.models_ads import Ad, AdStatsDaily, AdCounterShard, AdStatsDailyShard
+
+SHARDS = max(1, int(os.getenv("ADS_COUNTER_SHARDS", "8")))
+SHARD_STRATEGY = os.getenv("ADS_SHARD_STRATEGY", "worker").strip().lower()   # "worker" | "random"
+FOLD_INTERVAL = float(os.getenv("ADS_COUNTER_FOLD_INTERVAL", "60"))        # 0 desactiva el job
+
+
+def pick_shard() -> int:
+    if SHARD_STRATEGY == "random":
+        return random.randrange(SHARDS)
+    return os.getpid() % SHARDS
+
+
+def _insert(db: Session):
+    return postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+
+def increment(db: Session, ad_id: int, day: date, metric: str, amount: int, shard: int | None = None) -> None:
+    """UPSERT aditivo sobre el shard de totales y el shard diario (no hace commit)."""
+    shard = pick_shard() if shard is None else shard
+    imp, clk = (amount, 0) if metric == "impressions" else (0, amount)
+    insert = _insert(db)
+    for model, keys in (
+        (AdCounterShard, {"ad_id": ad_id, "shard": shard}),
+        (AdStatsDailyShard, {"ad_id": ad_id, "day": day, "shard": shard}),
+    ):
+        stmt = insert(model).values(**keys, impressions=imp, clicks=clk)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={
+                "impressions": model.impressions + stmt.excluded.impressions,
+                "clicks": model.clicks + stmt.excluded.clicks,
+            },
+        )
+        db.execute(stmt)
+
+
+def shard_totals(db: Session, ad_ids: list[int] | None = None) -> dict[int, tuple[int, int]]:
+    stmt = select(AdCounterShard.ad_id, func.sum(AdCounterShard.impressions), func.sum(AdCounterShard.clicks))
+    if ad_ids is not None:
+        stmt = stmt.where(AdCounterShard.ad_id.in_(ad_ids))
+    return {r[0]: (int(r[1] or 0), int(r[2] or 0)) for r in db.execute(stmt.group_by(AdCounterShard.ad_id))}
+
+
+def shard_daily(db: Session, ad_id: int) -> dict[date, tuple[int, int]]:
+    rows = db.execute(
+        select(AdStatsDailyShard.day, func.sum(AdStatsDailyShard.impressions), func.sum(AdStatsDailyShard.clicks))
+        .where(AdStatsDailyShard.ad_id == ad_id)
+        .group_by(AdStatsDailyShard.day)
+    )
+    return {r[0]: (int(r[1] or 0), int(r[2] or 0)) for r in rows}
+
+
+def fold(db: Session) -> dict:
+    """Pliega los shards en ads/ad_stats_daily en una transacción.
+
+    Resta a cada shard lo que se ha plegado en lugar de borrarlo, y salta filas
+    bloqueadas por incrementos en curso (se pliegan en la siguiente pasada).
+    """
+    totals = defaultdict(lambda: [0, 0])
+    daily = defaultdict(lambda: [0, 0])
+    shards = db.execute(
+        select(AdCounterShard).where((AdCounterShard.impressions != 0) | (AdCounterShard.clicks != 0))
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    for s in shards:
+        totals[s.ad_id][0] += s.impressions
+        totals[s.ad_id][1] += s.clicks
+        db.execute(
+            update(AdCounterShard)
+            .where(AdCounterShard.ad_id == s.ad_id, AdCounterShard.shard == s.shard)
+            .values(impressions=AdCounterShard.impressions - s.impressions,
+                    clicks=AdCounterShard.clicks - s.clicks)
+        )
+    day_shards = db.execute(
+        select(AdStatsDailyShard).where((AdStatsDailyShard.impressions != 0) | (AdStatsDailyShard.clicks != 0))
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    for s in day_shards:
+        daily[(s.ad_id, s.day)][0] += s.impressions
+        daily[(s.ad_id, s.day)][1] += s.clicks
+        db.execute(
+            update(AdStatsDailyShard)
+            .where(AdStatsDailyShard.ad_id == s.ad_id, AdStatsDailyShard.day == s.day,
+                   AdStatsDailyShard.shard == s.shard)
+            .values(impressions=AdStatsDailyShard.impressions - s.impressions,
+                    clicks=AdStatsDailyShard.clicks - s.clicks)
+        )
+    for ad_id, (imp, clk) in totals.items():
+        db.execute(
+            update(Ad).where(Ad.id == ad_id)
+            .values(total_impressions=Ad.total_impressions + imp, total_clicks=Ad.total_clicks + clk)
+        )
+    for (ad_id, day), (imp, clk) in daily.items():
+        stats = db.get(AdStatsDaily, {"ad_id": ad_id, "day": day})
+        if not stats:
+            stats = AdStatsDaily(ad_id=ad_id, day=day, impressions=0, clicks=0)
+            db.add(stats)
+        stats.impressions += imp
+        stats.clicks += clk
+    db.commit()
+    return {"ads": len(totals), "days": len(daily)}
+
+
+# ---------------- Job periódico ----------------
+_stop = threading.Event()
+
+
+def _fold_loop(interval: float) -> None:
+    from database import SessionLocal
+    while not _stop.wait(interval):
+        try:
+            with SessionLocal() as db:
+                fold(db)
+        except Exception:
+            log.exception("Plegado de contadores de anuncios falló")
+
+
+def start_background_fold(interval: float = FOLD_INTERVAL) -> threading.Thread | None:
+    if interval <= 0:
+        return None
+    _stop.clear()
+    t = threading.Thread(target=_fold_loop, args=(interval,), name="ad-counters-fold", daemon=True)
+    t.start()
+    return t
+
+
+def stop_background_fold() -> None:
+    _stop.set()
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    with SessionLocal() as db:
+        print(fold(db))
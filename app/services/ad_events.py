@@ -0,0 +1,303 @@
+# ad_events.py
+# Log de eventos de anuncios (impresiones/clics) en NDJSON segmentado, sólo de escritura.
+# Las peticiones sólo hacen append; un job de compactación pliega los segmentos cerrados
+# en ads.total_* y ad_stats_daily, y los segmentos archivados permiten re-agregar el histórico.
+import os
+import json
+import time
+import shutil
+import threading
+from pathlib import Path
+from datetime import datetime, timezone, date
+from collections import defaultdict
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.orm import Session
+
+from logger import log
+from models.models_ads import Ad, AdStatsDaily, AdEventSegment
+
+# "log": append al log de eventos y compactación periódica; "db": commit en Postgres por petición
+METRICS_SINK = os.getenv("ADS_METRICS_SINK", "log").strip().lower()
+
+EVENT_LOG_DIR = Path(os.getenv("ADS_EVENT_LOG_DIR", Path(__file__).resolve().parents[1] / "ad_events"))
+FSYNC_EVERY = int(os.getenv("ADS_EVENT_LOG_FSYNC_EVERY", "200"))          # eventos por fsync
+FSYNC_INTERVAL = float(os.getenv("ADS_EVENT_LOG_FSYNC_INTERVAL", "1.0"))   # segundos máx. sin fsync
+SEGMENT_MAX_BYTES = int(os.getenv("ADS_EVENT_LOG_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+SEGMENT_MAX_AGE = float(os.getenv("ADS_EVENT_LOG_SEGMENT_AGE", "60"))      # segundos hasta sellar
+COMPACT_INTERVAL = float(os.getenv("ADS_COMPACT_INTERVAL", "30"))          # 0 desactiva el job
+
+OPEN_SUFFIX = ".ndjson.open"
+SEALED_SUFFIX = ".ndjson"
+ARCHIVE_DIR = "archive"
+
+_METRIC_BY_TYPE = {"impression": "impressions", "click": "clicks"}
+_TYPE_BY_METRIC = {v: k for k, v in _METRIC_BY_TYPE.items()}
+
+
+class AdEventLog:
+    """Writer de segmentos NDJSON con fsync por lotes.
+
+    Cada proceso (worker de uvicorn) escribe en su propio segmento ``*.ndjson.open``;
+    al superar tamaño o antigüedad se sella renombrándolo a ``*.ndjson``. Sólo los
+    segmentos sellados se compactan.
+    """
+
+    def __init__(self, directory: Path | str = EVENT_LOG_DIR, fsync_every: int = FSYNC_EVERY,
+                 fsync_interval: float = FSYNC_INTERVAL, segment_max_bytes: int = SEGMENT_MAX_BYTES,
+                 segment_max_age: float = SEGMENT_MAX_AGE):
+        self.directory = Path(directory)
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self._lock = threading.Lock()
+        self._fh = None
+        self._path: Path | None = None
+        self._opened_at = 0.0
+        self._last_sync = 0.0
+        self._pending = 0
+        self._seq = 0
+
+    @property
+    def current_segment(self) -> Path | None:
+        return self._path
+
+    def append(self, ad_id: int, metric: str, ts: datetime | None = None, day: date | None = None) -> None:
+        ts = ts or datetime.now(timezone.utc)
+        rec = {
+            "ad_id": int(ad_id),
+            "type": _TYPE_BY_METRIC[metric],
+            "ts": ts.isoformat(),
+            "day": (day or date.today()).isoformat(),
+        }
+        line = json.dumps(rec, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._fh is None:
+                self._open_segment()
+            self._fh.write(line)
+            self._pending += 1
+            now = time.monotonic()
+            if self._pending >= self.fsync_every or (now - self._last_sync) >= self.fsync_interval:
+                self._sync()
+            if self._fh.tell() >= self.segment_max_bytes or (now - self._opened_at) >= self.segment_max_age:
+                self._seal()
+
+    def tick(self) -> None:
+        """fsync de lo pendiente y sellado del segmento si ha caducado (para tráfico bajo)."""
+        with self._lock:
+            if self._fh is None:
+                return
+            if self._pending:
+                self._sync()
+            if (time.monotonic() - self._opened_at) >= self.segment_max_age:
+                self._seal()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._seal()
+
+    def _open_segment(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._seq += 1
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self._path = self.directory / f"events-{stamp}-{os.getpid()}-{self._seq:06d}{OPEN_SUFFIX}"
+        self._fh = open(self._path, "a", encoding="utf-8")
+        self._opened_at = self._last_sync = time.monotonic()
+        self._pending = 0
+
+    def _sync(self) -> None:
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def _seal(self) -> None:
+        self._sync()
+        self._fh.close()
+        sealed = self._path.with_name(self._path.name[: -len(OPEN_SUFFIX)] + SEALED_SUFFIX)
+        if self._path.stat().st_size:
+            os.replace(self._path, sealed)
+        else:
+            self._path.unlink()
+        self._fh = None
+        self._path = None
+
+
+event_log = AdEventLog()
+
+
+# ---------------- Compactación ----------------
+def _read_segment(path: Path):
+    totals = defaultdict(lambda: [0, 0])
+    daily = defaultdict(lambda: [0, 0])
+    n = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                ev = json.loads(line)
+                idx = 0 if ev["type"] == "impression" else 1
+                ad_id = int(ev["ad_id"])
+                day = date.fromisoformat(ev["day"])
+            except (ValueError, KeyError, TypeError):
+                # línea truncada (caída antes del fsync) o corrupta
+                continue
+            totals[ad_id][idx] += 1
+            daily[(ad_id, day)][idx] += 1
+            n += 1
+    return totals, daily, n
+
+
+def _sealed_segments(directory: Path, stale_after: float) -> list[Path]:
+    if not directory.exists():
+        return []
+    out = sorted(directory.glob(f"*{SEALED_SUFFIX}"))
+    # segmentos ".open" de procesos muertos: se tratan como sellados cuando llevan tiempo sin tocarse
+    now = time.time()
+    for p in sorted(directory.glob(f"*{OPEN_SUFFIX}")):
+        if p != event_log.current_segment and (now - p.stat().st_mtime) > stale_after:
+            out.append(p)
+    return out
+
+
+def _apply_deltas(db: Session, totals: dict, daily: dict) -> None:
+    if not totals:
+        return
+    known = set(db.execute(select(Ad.id).where(Ad.id.in_(list(totals)))).scalars())
+    for ad_id, (imp, clk) in totals.items():
+        if ad_id not in known:
+            continue
+        db.execute(
+            update(Ad).where(Ad.id == ad_id)
+            .values(total_impressions=Ad.total_impressions + imp, total_clicks=Ad.total_clicks + clk)
+        )
+    for (ad_id, day), (imp, clk) in daily.items():
+        if ad_id not in known:
+            continue
+        stats = db.get(AdStatsDaily, {"ad_id": ad_id, "day": day})
+        if not stats:
+            stats = AdStatsDaily(ad_id=ad_id, day=day, impressions=0, clicks=0)
+            db.add(stats)
+        stats.impressions += imp
+        stats.clicks += clk
+
+
+def compact(db: Session, directory: Path | str | None = None) -> dict:
+    """Pliega los segmentos sellados en ads/ad_stats_daily y los mueve a ``archive/``.
+
+    Cada segmento se aplica en su propia transacción junto con su fila en
+    ``ad_event_segments``, así que reintentar tras una caída no cuenta dos veces.
+    """
+    directory = Path(directory) if directory else event_log.directory
+    archive = directory / ARCHIVE_DIR
+    stale_after = max(10 * event_log.segment_max_age, 60.0)
+    stats = {"segments": 0, "events": 0, "skipped": 0}
+    for seg in _sealed_segments(directory, stale_after):
+        name = seg.name[: -len(OPEN_SUFFIX)] + SEALED_SUFFIX if seg.name.endswith(OPEN_SUFFIX) else seg.name
+        if db.get(AdEventSegment, name) is None:
+            totals, daily, n = _read_segment(seg)
+            try:
+                _apply_deltas(db, totals, daily)
+                db.add(AdEventSegment(name=name, events=n))
+                db.commit()
+            except Exception:
+                db.rollback()
+                log.exception(f"Compactación: fallo aplicando {name}")
+                continue
+            stats["segments"] += 1
+            stats["events"] += n
+        else:
+            stats["skipped"] += 1
+        archive.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(seg), str(archive / name))
+    return stats
+
+
+def replay(db: Session, since: date | None = None, directory: Path | str | None = None) -> dict:
+    """Re-agrega el histórico archivado: reconstruye ad_stats_daily (desde ``since``) y
+    recalcula ads.total_* como suma de ad_stats_daily.
+
+    Sólo tiene sentido cuando el log es la única fuente de métricas (``ADS_METRICS_SINK=log``).
+    """
+    directory = Path(directory) if directory else event_log.directory
+    daily = defaultdict(lambda: [0, 0])
+    n = 0
+    for seg in sorted((directory / ARCHIVE_DIR).glob(f"*{SEALED_SUFFIX}")):
+        _, seg_daily, seg_n = _read_segment(seg)
+        n += seg_n
+        for key, (imp, clk) in seg_daily.items():
+            if since is None or key[1] >= since:
+                daily[key][0] += imp
+                daily[key][1] += clk
+    known = set(db.execute(select(Ad.id)).scalars())
+    stmt = delete(AdStatsDaily)
+    if since is not None:
+        stmt = stmt.where(AdStatsDaily.day >= since)
+    db.execute(stmt)
+    for (ad_id, day), (imp, clk) in daily.items():
+        if ad_id in known:
+            db.add(AdStatsDaily(ad_id=ad_id, day=day, impressions=imp, clicks=clk))
+    db.flush()
+    sums = dict(
+        (r[0], (r[1], r[2])) for r in db.execute(
+            select(AdStatsDaily.ad_id, func.sum(AdStatsDaily.impressions), func.sum(AdStatsDaily.clicks))
+            .group_by(AdStatsDaily.ad_id)
+        )
+    )
+    for ad_id in known:
+        imp, clk = sums.get(ad_id, (0, 0))
+        db.execute(update(Ad).where(Ad.id == ad_id).values(total_impressions=imp or 0, total_clicks=clk or 0))
+    db.commit()
+    return {"events": n, "days": len({k[1] for k in daily})}
+
+
+# ---------------- Job periódico ----------------
+_stop = threading.Event()
+
+
+def _compaction_loop(interval: float) -> None:
+    from database import SessionLocal
+    while not _stop.wait(interval):
+        try:
+            event_log.tick()
+            with SessionLocal() as db:
+                res = compact(db)
+            if res["segments"]:
+                log.info(f"Compactación de eventos de anuncios: {res}")
+        except Exception:
+            log.exception("Compactación de eventos de anuncios falló")
+
+
+def start_background_compaction(interval: float = COMPACT_INTERVAL) -> threading.Thread | None:
+    if interval <= 0:
+        return None
+    _stop.clear()
+    t = threading.Thread(target=_compaction_loop, args=(interval,), name="ad-events-compactor", daemon=True)
+    t.start()
+    return t
+
+
+def stop_background_compaction() -> None:
+    _stop.set()
+    event_log.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import SessionLocal
+
+    p = argparse.ArgumentParser(description="Compactación / re-agregación del log de eventos de anuncios")
+    p.add_argument("command", choices=["compact", "replay"])
+    p.add_argument("--dir", default=None)
+    p.add_argument("--since", default=None, help="YYYY-MM-DD (sólo replay)")
+    args = p.parse_args()
+    with SessionLocal() as db:
+        if args.command == "compact":
+            print(compact(db, args.dir))
+        else:
+            since = date.fromisoformat(args.since) if args.since else None
+            print(replay(db, since, args.dir))
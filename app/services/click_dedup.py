@@ -0,0 +1,98 @@
+# click_dedup.py
+# Filtro de clics duplicados (reintentos de clientes) en memoria, sin consultas SQL.
+#
+# Un Bloom filter por día sobre (ad_id, client_id, nonce); se guardan el de hoy y el de
+# ayer para cubrir reintentos que cruzan medianoche. La memoria está acotada por
+# ADS_CLICK_DEDUP_BYTES (repartida entre los dos filtros).
+#
+# Un clic se reserva (reserve) antes de contarlo y sólo entra en el filtro (commit) cuando se
+# ha contado; si falla se libera (release) y el reintento cuenta. Un reintento que llega
+# mientras el original está en vuelo ve la reserva y se descarta.
+#
+# Límite: el estado es por proceso. Con varios workers de uvicorn, un reintento que cae en
+# otro worker no se detecta; dedupe entre workers necesitaría estado compartido (p. ej. una
+# tabla con clave única o Redis).
+#
+# Tasa de falsos positivos (un clic legítimo descartado) con m bits, n clics/día y k hashes:
+#     p ≈ (1 - e^(-k·n/m))^k,  k = round(m/n · ln 2)
+# Por defecto 2 MiB (1 MiB/día = 8.388.608 bits) y 500.000 clics/día -> k = 12, p ≈ 0,03 %.
+# Con 1 MiB total y la misma carga, p ≈ 1,8 %. Si se supera la capacidad p crece rápido:
+# ajustar ADS_CLICK_DEDUP_CAPACITY al tráfico real.
+import os
+import math
+import hashlib
+import threading
+from datetime import date
+
+MAX_BYTES = int(os.getenv("ADS_CLICK_DEDUP_BYTES", str(2 * 1024 * 1024)))
+CAPACITY = int(os.getenv("ADS_CLICK_DEDUP_CAPACITY", "500000"))   # clics esperados por día
+
+
+class BloomFilter:
+    def __init__(self, size_bytes: int, capacity: int):
+        self.m = max(8, size_bytes * 8)
+        self.k = max(1, round(self.m / max(1, capacity) * math.log(2)))
+        self.capacity = capacity
+        self.bits = bytearray(self.m // 8)
+
+    def _positions(self, key: bytes):
+        d = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        return [(h1 + i * h2) % self.m for i in range(self.k)]
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key: bytes) -> bool:
+        """Añade la clave; devuelve True si (probablemente) ya estaba."""
+        present = True
+        for p in self._positions(key):
+            byte, bit = p >> 3, 1 << (p & 7)
+            if not self.bits[byte] & bit:
+                present = False
+                self.bits[byte] |= bit
+        return present
+
+
+class ClickDeduplicator:
+    def __init__(self, max_bytes: int = MAX_BYTES, capacity: int = CAPACITY):
+        self.filter_bytes = max(1, max_bytes // 2)
+        self.capacity = capacity
+        self._filters: dict[date, BloomFilter] = {}
+        self._pending: set[bytes] = set()
+        self._lock = threading.Lock()
+
+    def _rotate(self, today: date) -> BloomFilter:
+        if today not in self._filters:
+            self._filters = {d: f for d, f in self._filters.items() if (today - d).days == 1}
+            self._filters[today] = BloomFilter(self.filter_bytes, self.capacity)
+        return self._filters[today]
+
+    @staticmethod
+    def _key(ad_id: int, client_id: str, nonce: str) -> bytes:
+        return f"{ad_id}\x1f{client_id}\x1f{nonce}".encode("utf-8")
+
+    def reserve(self, ad_id: int, client_id: str, nonce: str, today: date | None = None) -> bool:
+        """Reserva el clic para contarlo; False si ya se contó (hoy o ayer) o está en vuelo."""
+        key = self._key(ad_id, client_id, nonce)
+        with self._lock:
+            self._rotate(today or date.today())
+            if key in self._pending or any(key in f for f in self._filters.values()):
+                return False
+            self._pending.add(key)
+            return True
+
+    def commit(self, ad_id: int, client_id: str, nonce: str, today: date | None = None) -> None:
+        """El clic reservado ya se ha contado: a partir de ahora es duplicado."""
+        key = self._key(ad_id, client_id, nonce)
+        with self._lock:
+            self._rotate(today or date.today()).add(key)
+            self._pending.discard(key)
+
+    def release(self, ad_id: int, client_id: str, nonce: str) -> None:
+        """No se pudo contar el clic reservado: el reintento debe contar."""
+        with self._lock:
+            self._pending.discard(self._key(ad_id, client_id, nonce))
+
+click_dedup = ClickDeduplicator()
@@ -1,10 +1,13 @@
 import os, re, json
 from pathlib import Path
 from datetime import datetime, timezone
-import requests
 from bs4 import BeautifulSoup
 
+from etl.extract.client import HttpClient, run_sync
+from etl.extract.fetch_state import CHANGED, UNCHANGED, FetchState
+
 URL = "https://oficinavirtual.canaldeisabelsegunda.es/gestiones-on-line/incidencias-en-el-suministro"
+SOURCE = "canal"
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 RAW_DIR = PROJECT_ROOT / "etl" / "data_raw" / "canal"
@@ -13,11 +16,6 @@ DEFAULT_OUT_DIR = (RAW_DIR / TODAYUTC).resolve()
 if os.getenv("DATA_DIR"):
     DEFAULT_OUT_DIR = Path(os.getenv("DATA_DIR")).resolve()
 
-def _fetch_html() -> str:
-    r = requests.get(URL, headers={"User-Agent":"Mozilla/5.0"}, timeout=25)
-    r.raise_for_status()
-    return r.text
-
 def _extract_markers(html: str):
     soup = BeautifulSoup(html, "html.parser")
     script_text = next((s.string for s in soup.find_all("script") if s.string and "var markers" in s.string), None)
@@ -46,15 +44,26 @@ def _to_events(markers):
         })
     return out
 
-def run(output_dir: str | os.PathLike | None = None):
+async def arun(client: HttpClient, output_dir: str | os.PathLike | None = None,
+               state: FetchState | None = None) -> str:
+    r = await client.get(URL, headers=state.validators(SOURCE) if state else None)
+    if state is not None and state.unchanged(SOURCE, r):
+        print("[agua] sin cambios desde la última descarga")
+        return UNCHANGED
     out_dir = Path(output_dir).resolve() if output_dir else DEFAULT_OUT_DIR
     out_dir.mkdir(parents=True, exist_ok=True)
-    html = _fetch_html()
+    html = r.text
     markers = _extract_markers(html)
     events = _to_events(markers)
     out_file = out_dir / "cortes_agua_canalisabelii.json"
     out_file.write_text(json.dumps(events, ensure_ascii=False, indent=2), encoding="utf-8")
     print(f"[agua] {len(events)} cortes -> {out_file.name}")
+    if state is not None:
+        state.record(SOURCE, URL, r.content, r.headers)
+    return CHANGED
+
+def run(output_dir: str | os.PathLike | None = None):
+    run_sync(arun, output_dir)
 
 if __name__ == "__main__":
     run()
@@ -0,0 +1,88 @@
+# etl/extract/browser.py
+# Navegador compartido y orden adaptativo de estrategias para las descargas que necesitan Chrome
+# (i-DE):
+# - BrowserSession: un único driver por ejecución, lanzado al primer uso, reutilizado por todas
+#   las estrategias y sus reintentos, y cerrado siempre al salir (with / close)
+# - StrategyOrder: recuerda qué estrategia funcionó la última vez y cuántas veces seguidas ha
+#   fallado cada una; la ganadora va primero y las que fallan siempre pasan al final
+import os
+import json
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+STRATEGY_STATE = Path(os.getenv("IDE_STRATEGY_STATE", PROJECT_ROOT / "etl" / ".cache" / "ide_strategy.json"))
+
+
+class BrowserSession:
+    def __init__(self, factory: Callable[[], object]):
+        self._factory = factory
+        self._driver = None
+        self.launches = 0
+
+    def __enter__(self) -> "BrowserSession":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def driver(self):
+        """El driver vivo; si el anterior se ha caído, se relanza."""
+        if self._driver is not None and not self._alive():
+            self.close()
+        if self._driver is None:
+            self._driver = self._factory()
+            self.launches += 1
+        return self._driver
+
+    def _alive(self) -> bool:
+        try:
+            self._driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    def close(self) -> None:
+        d, self._driver = self._driver, None
+        if d is not None:
+            try:
+                d.quit()
+            except Exception:
+                pass
+
+
+class StrategyOrder:
+    def __init__(self, path: Path = STRATEGY_STATE):
+        self.path = Path(path)
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            data = {}
+        self.last_ok: Optional[str] = data.get("last_ok")
+        self.stats: Dict[str, Dict] = data.get("strategies") or {}
+
+    def order(self, base: Sequence[str]) -> List[str]:
+        """``base`` reordenada: la última que funcionó, luego por fallos seguidos (menos primero);
+        a igualdad, el orden configurado."""
+        return sorted(base, key=lambda n: (n != self.last_ok, self.stats.get(n, {}).get("fail_streak", 0), base.index(n)))
+
+    def record(self, name: str, ok: bool) -> None:
+        st = self.stats.setdefault(name, {"ok": 0, "fail": 0, "fail_streak": 0})
+        if ok:
+            st["ok"] += 1
+            st["fail_streak"] = 0
+            st["last_ok_utc"] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+            self.last_ok = name
+        else:
+            st["fail"] += 1
+            st["fail_streak"] += 1
+        self.save()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps({"last_ok": self.last_ok, "strategies": self.stats}, indent=1, sort_keys=True),
+                       encoding="utf-8")
+        os.replace(tmp, self.path)
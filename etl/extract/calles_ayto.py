@@ -1,8 +1,14 @@
-import os, json, requests, xml.etree.ElementTree as ET
+import os, json, xml.etree.ElementTree as ET
 from pathlib import Path
+from contextlib import ExitStack
+from typing import Iterable, Iterator
 from datetime import datetime, timezone
 
+from etl.extract.client import HttpClient, run_sync
+from etl.extract.fetch_state import CHANGED, UNCHANGED, FetchState
+
 URL = "https://informo.madrid.es/informo/tmadrid/incid_aytomadrid.xml"
+SOURCE = "ayto"
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 RAW_DIR = PROJECT_ROOT / "etl" / "data_raw" / "ayto"
@@ -10,20 +16,36 @@ TODAYUTC = datetime.now(timezone.utc).strftime("%Y%m%d")
 DEFAULT_OUT_DIR = (RAW_DIR / TODAYUTC).resolve()
 if os.getenv("DATA_DIR"):
     DEFAULT_OUT_DIR = Path(os.getenv("DATA_DIR")).resolve()
+# las filas tal cual vienen del XML sólo hacen falta para depurar; por defecto no se escriben
+WRITE_RAW = os.getenv("AYTO_WRITE_RAW", "0") == "1"
+FEED_CHUNK = 64 * 1024
+EVENTS_FILE = "incid_ayto_events.ndjson"
+RAW_FILE = "incid_ayto_raw.ndjson"
+
+def _xml_text(r) -> str | bytes:
+    # sin charset en la cabecera: el que declare el XML (ElementTree lo lee de los bytes)
+    return r.content if "charset" not in r.headers.get("content-type", "").lower() else r.text
 
-def _fetch_xml() -> str:
-    r = requests.get(URL, timeout=25)
-    r.raise_for_status()
-    r.encoding = r.apparent_encoding or "utf-8"
-    return r.text
+def _xml_chunks(r) -> Iterator[str | bytes]:
+    data = _xml_text(r)
+    for i in range(0, len(data), FEED_CHUNK):
+        yield data[i:i + FEED_CHUNK]
 
-def _xml_rows(xml_text: str):
-    root = ET.fromstring(xml_text)
-    rows = []
-    for inc in root.findall(".//Incidencia"):
-        d = {c.tag: (c.text or "").strip() for c in inc}
-        rows.append(d)
-    return rows
+def _xml_rows(chunks: Iterable[str | bytes]) -> Iterator[dict]:
+    """Filas de las <Incidencia> según se cierran; cada una se libera al leerla, así que el
+    árbol nunca pasa de una incidencia."""
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root = None
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if root is None:
+                root = elem
+            if event == "end" and elem.tag == "Incidencia":
+                yield {c.tag: (c.text or "").strip() for c in elem}
+                elem.clear()
+                root.clear()
+    parser.close()
 
 def _to_bool(x): return str(x or "").strip().upper() in {"S","SI","Y","YES","1","TRUE"}
 
@@ -44,40 +66,63 @@ def _norm_ts(s: str) -> str:
         except:
             return s
 
-def _to_events(rows):
-    out=[]
-    for r in rows:
-        eid = f"tmadrid-{r.get('id_incidencia','').strip() or (r.get('codigo','').replace('/','-'))}"
-        start_ts = _norm_ts(r.get("fh_inicio",""))
-        end_ts   = _norm_ts(r.get("fh_final",""))
-        out.append({
-            "event_id": eid,
-            "tipo": r.get("nom_tipo_incidencia") or r.get("cod_tipo_incidencia"),
-            "programado": _to_bool(r.get("incid_prevista")) or _to_bool(r.get("incid_planificada")),
-            "descripcion": r.get("descripcion") or "",
-            "start_ts": start_ts,
-            "end_ts": end_ts,
-            "municipio": "Madrid",
-            "lat": _safe_float(r.get("latitud")),
-            "lon": _safe_float(r.get("longitud")),
-            "estado": r.get("incid_estado"),
-            "es_obras": _to_bool(r.get("es_obras")),
-            "es_accidente": _to_bool(r.get("es_accidente")),
-            "es_contaminacion": _to_bool(r.get("es_contaminacion")),
-            "codigo": r.get("codigo"),
-            "id_incidencia": r.get("id_incidencia")
-        })
-    return out
+def _to_event(r: dict) -> dict:
+    eid = f"tmadrid-{r.get('id_incidencia','').strip() or (r.get('codigo','').replace('/','-'))}"
+    start_ts = _norm_ts(r.get("fh_inicio",""))
+    end_ts   = _norm_ts(r.get("fh_final",""))
+    return {
+        "event_id": eid,
+        "tipo": r.get("nom_tipo_incidencia") or r.get("cod_tipo_incidencia"),
+        "programado": _to_bool(r.get("incid_prevista")) or _to_bool(r.get("incid_planificada")),
+        "descripcion": r.get("descripcion") or "",
+        "start_ts": start_ts,
+        "end_ts": end_ts,
+        "municipio": "Madrid",
+        "lat": _safe_float(r.get("latitud")),
+        "lon": _safe_float(r.get("longitud")),
+        "estado": r.get("incid_estado"),
+        "es_obras": _to_bool(r.get("es_obras")),
+        "es_accidente": _to_bool(r.get("es_accidente")),
+        "es_contaminacion": _to_bool(r.get("es_contaminacion")),
+        "codigo": r.get("codigo"),
+        "id_incidencia": r.get("id_incidencia")
+    }
 
-def run(output_dir: str | os.PathLike | None = None):
+def _dumps(d: dict) -> str:
+    return json.dumps(d, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+def _write_ndjson(rows: Iterable[dict], events_fp: Path, raw_fp: Path | None = None) -> int:
+    """Eventos (y, si se pide, filas raw) en NDJSON compacto, una línea por incidencia. Se escribe
+    a un .tmp y se renombra: quien lea a la vez nunca ve el fichero a medias."""
+    n = 0
+    outs = [(events_fp, _to_event)] + ([(raw_fp, dict)] if raw_fp else [])
+    tmps = [(fp, fp.with_suffix(".ndjson.tmp"), fn) for fp, fn in outs]
+    with ExitStack() as stack:
+        files = [(stack.enter_context(open(tmp, "w", encoding="utf-8")), fn) for _, tmp, fn in tmps]
+        for r in rows:
+            for f, fn in files:
+                f.write(_dumps(fn(r)))
+            n += 1
+    for fp, tmp, _ in tmps:
+        os.replace(tmp, fp)
+    return n
+
+async def arun(client: HttpClient, output_dir: str | os.PathLike | None = None,
+               state: FetchState | None = None) -> str:
+    r = await client.get(URL, headers=state.validators(SOURCE) if state else None)
+    if state is not None and state.unchanged(SOURCE, r):
+        print("[ayto] sin cambios desde la última descarga")
+        return UNCHANGED
     out_dir = Path(output_dir).resolve() if output_dir else DEFAULT_OUT_DIR
     out_dir.mkdir(parents=True, exist_ok=True)
-    xml_text = _fetch_xml()
-    rows = _xml_rows(xml_text)
-    (out_dir / "incid_ayto_raw.json").write_text(json.dumps(rows, ensure_ascii=False, indent=2), encoding="utf-8")
-    events = _to_events(rows)
-    (out_dir / "incid_ayto_events.json").write_text(json.dumps(events, ensure_ascii=False, indent=2), encoding="utf-8")
-    print(f"[ayto] raw={len(rows)} events={len(events)} -> incid_ayto_events.json")
+    n = _write_ndjson(_xml_rows(_xml_chunks(r)), out_dir / EVENTS_FILE, out_dir / RAW_FILE if WRITE_RAW else None)
+    print(f"[ayto] events={n} -> {EVENTS_FILE}" + (f" (+ {RAW_FILE})" if WRITE_RAW else ""))
+    if state is not None:
+        state.record(SOURCE, URL, r.content, r.headers)
+    return CHANGED
+
+def run(output_dir: str | os.PathLike | None = None):
+    run_sync(arun, output_dir)
 
 if __name__ == "__main__":
     run()
@@ -0,0 +1,101 @@
+# etl/extract/client.py
+# Cliente HTTP compartido por los extractores (asyncio + httpx):
+# - un único pool de conexiones (keep-alive / TLS reutilizado entre peticiones y fuentes)
+# - límite de peticiones simultáneas por host
+# - reintentos con backoff exponencial (y Retry-After) en 429/5xx y errores de red
+import os
+import random
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+from urllib.parse import urlsplit
+
+import httpx
+
+MAX_CONNECTIONS = int(os.getenv("EXTRACT_MAX_CONNECTIONS", "20"))
+PER_HOST = int(os.getenv("EXTRACT_PER_HOST", "4"))
+RETRIES = int(os.getenv("EXTRACT_RETRIES", "3"))
+BACKOFF = float(os.getenv("EXTRACT_BACKOFF", "1.0"))
+BACKOFF_MAX = float(os.getenv("EXTRACT_BACKOFF_MAX", "30"))
+CONNECT_TIMEOUT = float(os.getenv("EXTRACT_CONNECT_TIMEOUT", "20"))
+READ_TIMEOUT = float(os.getenv("EXTRACT_READ_TIMEOUT", "60"))
+USER_AGENT = os.getenv("EXTRACT_USER_AGENT", "Mozilla/5.0")
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+T = TypeVar("T")
+
+
+class HttpClient:
+    """``async with HttpClient() as client: r = await client.get(url)``."""
+
+    def __init__(self, per_host: int = PER_HOST, retries: int = RETRIES, backoff: float = BACKOFF,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.per_host = max(1, per_host)
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = {"requests": 0, "retries": 0}
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            headers={"User-Agent": USER_AGENT},
+            follow_redirects=True,
+            transport=transport,
+        )
+
+    async def __aenter__(self) -> "HttpClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def _host(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return self._hosts[host]
+
+    def _delay(self, attempt: int, resp: Optional[httpx.Response]) -> float:
+        after = resp.headers.get("Retry-After") if resp is not None else None
+        if after and after.strip().isdigit():
+            return min(float(after), BACKOFF_MAX)
+        return min(self.backoff * (2 ** attempt), BACKOFF_MAX) * (0.5 + random.random() / 2)
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Petición con reintentos; lanza ``httpx.HTTPStatusError`` si la respuesta final no es
+        2xx ni 304."""
+        attempt = 0
+        while True:
+            resp = None
+            async with self._host(url):
+                self.stats["requests"] += 1
+                try:
+                    resp = await self._client.request(method, url, **kwargs)
+                except httpx.TransportError:
+                    if attempt >= self.retries:
+                        raise
+                else:
+                    if resp.status_code == 304:
+                        # petición condicional: no ha cambiado
+                        return resp
+                    if resp.status_code not in RETRY_STATUS or attempt >= self.retries:
+                        return resp.raise_for_status()
+            # la espera va fuera del semáforo: no ocupa hueco del host
+            self.stats["retries"] += 1
+            await asyncio.sleep(self._delay(attempt, resp))
+            attempt += 1
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+
+def run_sync(fn: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+    """Ejecuta un extractor asíncrono ``fn(client, *args)`` con su propio cliente (uso suelto,
+    fuera de run_extract)."""
+    async def _main() -> T:
+        async with HttpClient() as client:
+            return await fn(client, *args, **kwargs)
+    return asyncio.run(_main())
@@ -1,24 +1,27 @@
 # etl/extract/electricidad_ide.py
 import os
-import io
-import re
 import json
 import time
 import base64
 import shutil
+import asyncio
+import threading
 import traceback
 from pathlib import Path
 from datetime import datetime, timezone
 from typing import List, Dict, Tuple, Optional
 
 import requests
-import pdfplumber
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+
+from etl.transform import numbers
+from etl.extract import ide_pdf
+from etl.extract.browser import BrowserSession, StrategyOrder
+from etl.extract.fetch_state import CHANGED, UNCHANGED, FetchState
 
 URL = "https://www.i-de.es/documents/1951486/1960840/Madrid.pdf/79b09d21-7309-1e84-6503-436f8901e830"
+SOURCE = "ide"
 
 TODAYUTC = datetime.now(timezone.utc).strftime("%Y%m%d")
 
@@ -39,7 +42,11 @@ CDP_WAIT = int(os.getenv("IDE_CDP_WAIT", "45"))
 DIR_WAIT = int(os.getenv("IDE_DIR_WAIT", "240"))
 TIME_BUDGET = int(os.getenv("IDE_TIME_BUDGET", "180"))
 STRATEGY = os.getenv("IDE_STRATEGY", "cdp_then_dir_then_http").strip().lower()
-HEADLESS = False
+HEADLESS = os.getenv("IDE_HEADLESS", "1") == "1"
+# los rangos ("1-2000") se guardan como intervalo; con 1 se expanden a un item por portal
+EXPAND_NUMBERS = os.getenv("IDE_EXPAND_NUMBERS", "0") == "1"
+# arun descarga y parsea aquí dentro y sólo publica en out_dir al terminar
+PARTIAL_DIR = "_partial"
 
 
 def _unique_name(base_dir: str, base_filename: str) -> str:
@@ -85,6 +92,10 @@ def _download_http(url: str, out_path: str) -> str:
 
 
 def _build_driver(download_dir: str):
+    # selenium sólo hace falta para las estrategias con Chrome; sin él la HTTP sigue funcionando
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
     opts = Options()
     if HEADLESS:
         opts.add_argument("--headless=new")
@@ -114,11 +125,15 @@ def _build_driver(download_dir: str):
     return d
 
 
-def _poll_pdf_logs(driver, max_wait: int) -> List[str]:
+def _cancelled(cancel: Optional[threading.Event]) -> bool:
+    return cancel is not None and cancel.is_set()
+
+
+def _poll_pdf_logs(driver, max_wait: int, cancel: Optional[threading.Event] = None) -> List[str]:
     end = time.time() + max_wait
     seen = set()
     ids: List[str] = []
-    while time.time() < end:
+    while time.time() < end and not _cancelled(cancel):
         try:
             logs = driver.get_log("performance")
         except Exception:
@@ -149,15 +164,20 @@ def _poll_pdf_logs(driver, max_wait: int) -> List[str]:
     return ids
 
 
-def _capture_cdp(driver, url: str, out_path: str, wait: int) -> str:
+def _capture_cdp(driver, url: str, out_path: str, wait: int, cancel: Optional[threading.Event] = None) -> str:
+    # el driver se reutiliza: se descartan los eventos de red de navegaciones anteriores
+    try:
+        driver.get_log("performance")
+    except Exception:
+        pass
     sep = "&" if "?" in url else "?"
     bust = f"{url}{sep}ts={int(time.time())}"
     driver.get(bust)
-    reqs = _poll_pdf_logs(driver, wait)
-    if not reqs:
+    reqs = _poll_pdf_logs(driver, wait, cancel)
+    if not reqs and not _cancelled(cancel):
         bust = f"{url}{sep}ts={int(time.time())}"
         driver.get(bust)
-        reqs = _poll_pdf_logs(driver, wait)
+        reqs = _poll_pdf_logs(driver, wait, cancel)
     if not reqs:
         raise RuntimeError("CDP: no PDF")
     for rid in reqs:
@@ -173,7 +193,7 @@ def _capture_cdp(driver, url: str, out_path: str, wait: int) -> str:
     raise RuntimeError("CDP: sin cuerpo")
 
 
-def _dir_download(driver, url: str, download_dir: str, wait: int) -> str:
+def _dir_download(driver, url: str, download_dir: str, wait: int, cancel: Optional[threading.Event] = None) -> str:
     baseline = 0.0
     for f in os.listdir(download_dir):
         if f.lower().endswith(".pdf"):
@@ -186,7 +206,7 @@ def _dir_download(driver, url: str, download_dir: str, wait: int) -> str:
     driver.get(bust)
     end = time.time() + wait
     candidate = None
-    while time.time() < end:
+    while time.time() < end and not _cancelled(cancel):
         for f in os.listdir(download_dir):
             if not f.lower().endswith(".pdf"):
                 continue
@@ -207,149 +227,138 @@ def _dir_download(driver, url: str, download_dir: str, wait: int) -> str:
     return candidate
 
 
-def open_and_download(url: str, download_dir: str) -> str:
+# orden configurado de cada IDE_STRATEGY; StrategyOrder lo adapta a lo que funcionó la última vez
+STRATEGIES = {
+    "http_only": ["http"],
+    "cdp_only": ["cdp"],
+    "dir_only": ["dir"],
+    "http_then_cdp_then_dir": ["http", "cdp", "dir"],
+    "cdp_then_dir_then_http": ["cdp", "dir", "http"],
+}
+
+
+def open_and_download(url: str, download_dir: str, session: Optional[BrowserSession] = None,
+                      cancel: Optional[threading.Event] = None) -> str:
+    """Descarga el PDF probando las estrategias en orden adaptativo. Todas las que usan Chrome
+    comparten ``session`` (si no se pasa, se crea una y se cierra al terminar). Con ``cancel``
+    activado las esperas de Chrome terminan y no se prueba ninguna estrategia más."""
     os.makedirs(download_dir, exist_ok=True)
     start = time.time()
 
     def budget_ok() -> bool:
-        return (time.time() - start) < TIME_BUDGET
+        return (time.time() - start) < TIME_BUDGET and not _cancelled(cancel)
+
+    def _keep(p: str) -> str:
+        u = _unique_name(download_dir, os.path.basename(p))
+        try:
+            shutil.move(p, u)
+            return u
+        except Exception:
+            return p
 
     def try_http() -> Optional[str]:
         try:
             p = os.path.join(download_dir, "Madrid_requests.pdf")
             _download_http(url, p)
-            u = _unique_name(download_dir, os.path.basename(p))
-            try:
-                shutil.move(p, u)
-                return u
-            except Exception:
-                return p
+            return _keep(p)
         except Exception:
             traceback.print_exc()
             return None
 
     def try_cdp() -> Optional[str]:
-        d = _build_driver(download_dir)
         try:
             p = os.path.join(download_dir, "Madrid_cdp.pdf")
-            _capture_cdp(d, url, p, CDP_WAIT)
-            u = _unique_name(download_dir, os.path.basename(p))
-            try:
-                shutil.move(p, u)
-                return u
-            except Exception:
-                return p
+            _capture_cdp(browser.driver, url, p, CDP_WAIT, cancel)
+            return _keep(p)
         except Exception:
             traceback.print_exc()
             return None
-        finally:
-            try:
-                d.quit()
-            except Exception:
-                pass
 
     def try_dir() -> Optional[str]:
-        d = _build_driver(download_dir)
         try:
-            p = _dir_download(d, url, download_dir, DIR_WAIT)
-            u = _unique_name(download_dir, os.path.basename(p))
-            try:
-                shutil.move(p, u)
-                return u
-            except Exception:
-                return p
+            p = _dir_download(browser.driver, url, download_dir, DIR_WAIT, cancel)
+            return _keep(p)
         except Exception:
             traceback.print_exc()
             return None
-        finally:
-            try:
-                d.quit()
-            except Exception:
-                pass
-
-    order = {
-        "http_only": [try_http],
-        "cdp_only": [try_cdp],
-        "dir_only": [try_dir],
-        "http_then_cdp_then_dir": [try_http, try_cdp, try_dir],
-        "cdp_then_dir_then_http": [try_cdp, try_dir, try_http],
-    }.get(STRATEGY, [try_http, try_cdp, try_dir])
 
-    for fn in order:
-        if not budget_ok():
-            break
-        out = fn()
-        if out:
-            return out
+    fns = {"http": try_http, "cdp": try_cdp, "dir": try_dir}
+    ranking = StrategyOrder()
+    order = ranking.order(STRATEGIES.get(STRATEGY, ["http", "cdp", "dir"]))
+    browser = session or BrowserSession(lambda: _build_driver(download_dir))
+    try:
+        for name in order:
+            if not budget_ok():
+                break
+            out = fns[name]()
+            if _cancelled(cancel):
+                break
+            ranking.record(name, out is not None)
+            if out:
+                return out
+    finally:
+        if session is None:
+            browser.close()
+    if _cancelled(cancel):
+        raise RuntimeError("i-DE: descarga cancelada")
     raise RuntimeError("i-DE: no se pudo obtener PDF (todas las estrategias fallaron)")
 
 
 def parse_pdf_rows(pdf_path: str) -> List[Dict[str, str]]:
-    rows: List[Dict[str, str]] = []
-    start = re.compile(r"^([A-ZÁÉÍÓÚÜÑ ][A-ZÁÉÍÓÚÜÑ \-/ºª\.]+?)\s+(\d{2}/\d{2}/\d{4})\s+(\d{2}:\d{2})\s+(\d{2}:\d{2})\s+(.*)$")
-    skip = ("Internal Use", "Página", "Población | Municipio")
-    with open(pdf_path, "rb") as f, pdfplumber.open(io.BytesIO(f.read())) as pdf:
-        cur: Optional[Dict[str, str]] = None
-        for page in pdf.pages:
-            txt = page.extract_text() or ""
-            for raw in txt.splitlines():
-                ln = re.sub(r"\s+", " ", raw).strip()
-                if not ln or ln.startswith(skip):
-                    continue
-                m = start.match(ln)
-                if m:
-                    if cur:
-                        rows.append(cur)
-                    cur = {
-                        "municipio": m.group(1).title().strip(),
-                        "fecha": m.group(2),
-                        "hora_inicio": m.group(3),
-                        "hora_fin": m.group(4),
-                        "direcciones": m.group(5),
-                    }
-                elif cur:
-                    cur["direcciones"] = (cur["direcciones"] + " " + ln).strip()
-        if cur:
-            rows.append(cur)
-    return rows
+    # por tramos de páginas en paralelo y con caché por hash del PDF (etl/extract/ide_pdf.py)
+    return ide_pdf.parse_pdf_rows(pdf_path)
 
 
 def expand_numbers(blob: str) -> List[str]:
     out: List[str] = []
-    for tok in [t.strip() for t in blob.split(",") if t.strip()]:
-        m = re.match(r"^(\d+)\s*-\s*(\d+)$", tok)
-        if m:
-            a, b = int(m.group(1)), int(m.group(2))
-            if a <= b and b - a <= 2000:
-                out.extend([str(x) for x in range(a, b + 1)])
-            else:
-                out.append(tok.replace(" ", ""))
-        else:
-            out.append(tok.replace(" ", ""))
+    for tok, desde, hasta, paridad in numbers.parse_numbers(blob):
+        pts = numbers.expand(desde, hasta, paridad) if numbers.is_range(desde, hasta) else []
+        out.extend([str(x) for x in pts] or [tok])
     return out
 
 
-def explode_calles(direcciones: str) -> List[Tuple[str, str]]:
-    items: List[Tuple[str, str]] = []
+def _split_calles(direcciones: str) -> List[Tuple[str, str]]:
+    out: List[Tuple[str, str]] = []
     for seg in [s.strip(" .") for s in direcciones.split(";") if s.strip()]:
         if ":" in seg:
             via, nums = seg.split(":", 1)
-            via = via.strip()
-            nums = nums.strip()
-            if nums:
-                for n in expand_numbers(nums):
-                    items.append((via, n))
-            else:
-                items.append((via, ""))
+            out.append((via.strip(), nums.strip()))
+        else:
+            out.append((seg.strip(), ""))
+    return out
+
+
+def explode_calles(direcciones: str) -> List[Tuple[str, str]]:
+    """(via, numero) por portal: expande los rangos."""
+    items: List[Tuple[str, str]] = []
+    for via, nums in _split_calles(direcciones):
+        if nums:
+            for n in expand_numbers(nums):
+                items.append((via, n))
         else:
-            items.append((seg.strip(), ""))
+            items.append((via, ""))
+    return items
+
+
+def calles_intervals(direcciones: str) -> List[Tuple[str, str, Optional[int], Optional[int], str]]:
+    """(via, numero, desde, hasta, paridad) por número o rango, sin expandir."""
+    items: List[Tuple[str, str, Optional[int], Optional[int], str]] = []
+    for via, nums in _split_calles(direcciones):
+        parsed = numbers.parse_numbers(nums) if nums else []
+        for tok, desde, hasta, paridad in parsed or [("", None, None, "todos")]:
+            numero = numbers.label(desde, hasta, paridad) if numbers.is_range(desde, hasta) else tok
+            items.append((via, numero, desde, hasta, paridad))
     return items
 
 
-def to_items(rows: List[Dict[str, str]], fuente: str) -> List[Dict[str, str]]:
-    items: List[Dict[str, str]] = []
+def to_items(rows: List[Dict[str, str]], fuente: str, expand: bool = EXPAND_NUMBERS) -> List[Dict]:
+    items: List[Dict] = []
     for r in rows:
-        for via, numero in explode_calles(r["direcciones"]):
+        if expand:
+            calles = [(via, n, *numbers.parse_token(n)) for via, n in explode_calles(r["direcciones"])]
+        else:
+            calles = calles_intervals(r["direcciones"])
+        for via, numero, desde, hasta, paridad in calles:
             items.append(
                 {
                     "municipio": r["municipio"],
@@ -358,6 +367,9 @@ def to_items(rows: List[Dict[str, str]], fuente: str) -> List[Dict[str, str]]:
                     "hora_fin": r["hora_fin"],
                     "via": via,
                     "numero": numero,
+                    "numero_desde": desde,
+                    "numero_hasta": hasta,
+                    "paridad": paridad,
                     "fuente": fuente,
                 }
             )
@@ -372,6 +384,15 @@ def week_span_from_rows(rows: List[Dict[str, str]]) -> Tuple[str, str]:
     return dates[0].strftime("%d-%m-%Y"), dates[-1].strftime("%d-%m-%Y")
 
 
+def _write_items(pdf_path: str, out_dir: Path) -> Path:
+    rows = parse_pdf_rows(pdf_path)
+    items = to_items(rows, URL)
+    wstart, wend = week_span_from_rows(rows)
+    out_name = out_dir / f"Cortes electricidad {wstart} a {wend}.json"
+    out_name.write_text(json.dumps(items, ensure_ascii=False, indent=2), encoding="utf-8")
+    return out_name
+
+
 def run(output_dir: Optional[str | os.PathLike] = None) -> None:
     out_dir = Path(output_dir).resolve() if output_dir else DEFAULT_OUT_DIR
     out_dir.mkdir(parents=True, exist_ok=True)
@@ -380,12 +401,54 @@ def run(output_dir: Optional[str | os.PathLike] = None) -> None:
     except Exception:
         traceback.print_exc()
         raise
-    rows = parse_pdf_rows(pdf_path)
-    items = to_items(rows, URL)
-    wstart, wend = week_span_from_rows(rows)
-    out_name = out_dir / f"Cortes electricidad {wstart} a {wend}.json"
-    out_name.write_text(json.dumps(items, ensure_ascii=False, indent=2), encoding="utf-8")
+    _write_items(pdf_path, out_dir)
+
 
+async def _probe_http(client, state: Optional[FetchState]):
+    """GET condicional directo (sin navegador): respuesta 304/PDF, o None si no sirve."""
+    try:
+        r = await client.get(URL, headers={"Referer": URL, **(state.validators(SOURCE) if state else {})})
+    except Exception:
+        return None
+    return r if r.status_code == 304 or r.content[:5] == b"%PDF-" else None
+
+
+async def arun(client, output_dir: Optional[str | os.PathLike] = None, state: Optional[FetchState] = None) -> str:
+    out_dir = Path(output_dir).resolve() if output_dir else DEFAULT_OUT_DIR
+    r = await _probe_http(client, state)
+    if r is not None and state is not None and state.unchanged(SOURCE, r):
+        print("[ide] sin cambios desde la última descarga")
+        return UNCHANGED
+    # el trabajo bloqueante va en hilos que wait_for no puede parar: escribe en PARTIAL_DIR y, si
+    # se cancela arun (presupuesto de run_extract), ``cancel`` corta las esperas y nada se publica
+    # en out_dir, donde puede estar escribiendo la simulación
+    work = out_dir / PARTIAL_DIR
+    work.mkdir(parents=True, exist_ok=True)
+    cancel = threading.Event()
+    try:
+        if r is not None and r.status_code != 304:
+            pdf_path = _unique_name(str(work), "Madrid_requests.pdf")
+            Path(pdf_path).write_bytes(r.content)
+            headers = r.headers
+        else:
+            # el navegador (selenium) es bloqueante: va en un hilo aparte
+            pdf_path = await asyncio.to_thread(open_and_download, URL, str(work), None, cancel)
+            headers = None
+        content = Path(pdf_path).read_bytes()
+        if state is not None and state.is_same(SOURCE, content):
+            shutil.rmtree(work, ignore_errors=True)
+            print("[ide] sin cambios desde la última descarga")
+            return UNCHANGED
+        json_path = await asyncio.to_thread(_write_items, pdf_path, work)
+    except asyncio.CancelledError:
+        cancel.set()
+        raise
+    for p in (Path(pdf_path), json_path):
+        os.replace(p, out_dir / p.name)
+    shutil.rmtree(work, ignore_errors=True)
+    if state is not None:
+        state.record(SOURCE, URL, content, headers)
+    return CHANGED
 
 if __name__ == "__main__":
     run()
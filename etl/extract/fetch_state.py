@@ -0,0 +1,94 @@
+# etl/extract/fetch_state.py
+# Estado de descarga por fuente (data_raw/_fetch_state.json): ETag, Last-Modified y sha256 del
+# último contenido extraído. Con él cada extractor pide con If-None-Match / If-Modified-Since y
+# sabe si la fuente ha cambiado desde la ejecución anterior (304 o mismo hash = "unchanged").
+# Sólo se registra una fuente cuando su extracción ha terminado bien, y run_extract lo deja como
+# pendiente (_fetch_state.pending.json): run_pipeline lo confirma con promote() cuando la carga ha
+# terminado, así un transform o load fallido no deja la fuente como "unchanged" en la siguiente.
+import os
+import json
+import hashlib
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Dict, Mapping, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+STATE_PATH = Path(os.getenv("EXTRACT_STATE_PATH", PROJECT_ROOT / "etl" / "data_raw" / "_fetch_state.json"))
+
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def pending_path(path: Optional[Path] = None) -> Path:
+    path = Path(path or STATE_PATH)
+    return path.with_name(f"{path.stem}.pending.json")
+
+
+def promote(path: Optional[Path] = None) -> bool:
+    """Confirma el estado pendiente de la última extracción; False si no había."""
+    try:
+        os.replace(pending_path(path), path or STATE_PATH)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def discard_pending(path: Optional[Path] = None) -> None:
+    pending_path(path).unlink(missing_ok=True)
+
+
+class FetchState:
+    def __init__(self, path: Path = STATE_PATH, sources: Optional[Dict[str, Dict]] = None):
+        self.path = Path(path)
+        self.sources: Dict[str, Dict] = sources or {}
+
+    @classmethod
+    def load(cls, path: Path = STATE_PATH) -> "FetchState":
+        try:
+            data = json.loads(Path(path).read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            data = {}
+        return cls(path, data.get("sources") or {})
+
+    def save(self, pending: bool = False) -> None:
+        """Escribe el estado; con ``pending`` al lado, a la espera de promote()."""
+        fp = pending_path(self.path) if pending else self.path
+        fp.parent.mkdir(parents=True, exist_ok=True)
+        tmp = fp.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps({"sources": self.sources}, ensure_ascii=False, indent=1, sort_keys=True),
+                       encoding="utf-8")
+        os.replace(tmp, fp)
+
+    def validators(self, source: str) -> Dict[str, str]:
+        """Cabeceras de la petición condicional (vacías si la fuente no se ha descargado nunca)."""
+        entry = self.sources.get(source) or {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def is_same(self, source: str, content: bytes) -> bool:
+        entry = self.sources.get(source)
+        return bool(entry) and entry.get("sha256") == sha256(content)
+
+    def unchanged(self, source: str, resp) -> bool:
+        """304, o 200 con el mismo contenido que la última vez."""
+        if resp.status_code == 304:
+            return source in self.sources
+        return self.is_same(source, resp.content)
+
+    def record(self, source: str, url: str, content: bytes, headers: Optional[Mapping[str, str]] = None) -> None:
+        headers = headers or {}
+        self.sources[source] = {
+            "url": url,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "sha256": sha256(content),
+            "fetched_at_utc": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
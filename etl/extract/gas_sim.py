@@ -2,6 +2,8 @@ import os, json, random
 from pathlib import Path
 from datetime import datetime, timedelta, timezone
 
+from etl.extract.fetch_state import CHANGED
+
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 RAW_DIR = PROJECT_ROOT / "etl" / "data_raw" / "gas"
 TODAYUTC = datetime.now(timezone.utc).strftime("%Y%m%d")
@@ -114,5 +116,10 @@ def run(output_dir: str | os.PathLike | None = None, dias=7, por_dia=3, seed: in
     (out_dir / fname).write_text(json.dumps(eventos, ensure_ascii=False, indent=2), encoding="utf-8")
     print(f"[gas] {len(eventos)} simulados -> {fname}")
 
+async def arun(client, output_dir: str | os.PathLike | None = None, state=None, **kwargs) -> str:
+    # simulación local: no usa la red y siempre cuenta como cambiada
+    run(output_dir, **kwargs)
+    return CHANGED
+
 if __name__ == "__main__":
     run()
@@ -0,0 +1,125 @@
+# etl/extract/ide_pdf.py
+# Lectura del PDF semanal de i-DE (cortes programados) a filas:
+# - las páginas se reparten en tramos (IDE_PARSE_CHUNK_PAGES) que se leen en un pool de procesos
+#   (extract_text es puro Python y va a un núcleo por proceso)
+# - cada tramo devuelve sus filas y, aparte, las líneas de continuación anteriores a su primera
+#   fila: pertenecen a la última fila del tramo anterior y se cosen al juntar los tramos
+# - el resultado se guarda por sha256 del PDF: el mismo PDF semanal no se vuelve a leer
+import os
+import re
+import json
+import hashlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import pdfplumber
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+CACHE_DIR = Path(os.getenv("IDE_PARSE_CACHE", PROJECT_ROOT / "etl" / ".cache" / "ide_pdf"))
+CHUNK_PAGES = int(os.getenv("IDE_PARSE_CHUNK_PAGES", "8"))
+WORKERS = int(os.getenv("IDE_PARSE_WORKERS", str(os.cpu_count() or 1)))
+# cambia si cambia el formato de las filas: invalida la caché
+CACHE_VERSION = 1
+
+START = re.compile(r"^([A-ZÁÉÍÓÚÜÑ ][A-ZÁÉÍÓÚÜÑ \-/ºª\.]+?)\s+(\d{2}/\d{2}/\d{4})\s+(\d{2}:\d{2})\s+(\d{2}:\d{2})\s+(.*)$")
+SKIP = ("Internal Use", "Página", "Población | Municipio")
+
+Row = Dict[str, str]
+
+
+def _sha256(fp: str) -> str:
+    h = hashlib.sha256()
+    with open(fp, "rb") as f:
+        for b in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(b)
+    return h.hexdigest()
+
+
+def _page_count(pdf_path: str) -> int:
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+
+def _parse_pages(pdf_path: str, start: int, end: int) -> Tuple[List[str], List[Row]]:
+    """Páginas [start, end): (líneas de continuación antes de la primera fila, filas)."""
+    head: List[str] = []
+    rows: List[Row] = []
+    cur: Optional[Row] = None
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages[start:end]:
+            txt = page.extract_text() or ""
+            for raw in txt.splitlines():
+                ln = re.sub(r"\s+", " ", raw).strip()
+                if not ln or ln.startswith(SKIP):
+                    continue
+                m = START.match(ln)
+                if m:
+                    if cur:
+                        rows.append(cur)
+                    cur = {
+                        "municipio": m.group(1).title().strip(),
+                        "fecha": m.group(2),
+                        "hora_inicio": m.group(3),
+                        "hora_fin": m.group(4),
+                        "direcciones": m.group(5),
+                    }
+                elif cur:
+                    cur["direcciones"] = (cur["direcciones"] + " " + ln).strip()
+                else:
+                    head.append(ln)
+    if cur:
+        rows.append(cur)
+    return head, rows
+
+
+def _stitch(chunks: List[Tuple[List[str], List[Row]]]) -> List[Row]:
+    rows: List[Row] = []
+    for head, chunk_rows in chunks:
+        # sin fila abierta (inicio del PDF) las continuaciones se descartan, como en una sola pasada
+        if rows:
+            for ln in head:
+                rows[-1]["direcciones"] = (rows[-1]["direcciones"] + " " + ln).strip()
+        rows.extend(chunk_rows)
+    return rows
+
+
+def _cache_path(sha: str) -> Path:
+    return CACHE_DIR / f"{sha}.json"
+
+
+def _cache_get(sha: str) -> Optional[List[Row]]:
+    try:
+        data = json.loads(_cache_path(sha).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+    return data.get("rows") if data.get("version") == CACHE_VERSION else None
+
+
+def _cache_put(sha: str, rows: List[Row]) -> None:
+    fp = _cache_path(sha)
+    fp.parent.mkdir(parents=True, exist_ok=True)
+    tmp = fp.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps({"version": CACHE_VERSION, "rows": rows}, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, fp)
+
+
+def parse_pdf_rows(pdf_path: str, workers: int = WORKERS, chunk_pages: int = CHUNK_PAGES,
+                   cache: bool = True) -> List[Row]:
+    pdf_path = str(pdf_path)
+    sha = _sha256(pdf_path) if cache else None
+    if sha:
+        hit = _cache_get(sha)
+        if hit is not None:
+            return hit
+    n = _page_count(pdf_path)
+    ranges = [(i, min(i + chunk_pages, n)) for i in range(0, n, max(1, chunk_pages))]
+    if workers <= 1 or len(ranges) <= 1:
+        chunks = [_parse_pages(pdf_path, a, b) for a, b in ranges]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as ex:
+            chunks = list(ex.map(_parse_pages, [pdf_path] * len(ranges), *zip(*ranges)))
+    rows = _stitch(chunks)
+    if sha:
+        _cache_put(sha, rows)
+    return rows
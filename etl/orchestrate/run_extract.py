@@ -1,76 +1,127 @@
 # etl/orchestrate/run_extract.py
 import os
 import sys
+import asyncio
 import argparse
+import importlib
 import subprocess
 from pathlib import Path
 from datetime import datetime, timezone
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import json
 import shutil
 
-from etl.extract import electricidad_ide, agua_canal, calles_ayto, gas_sim
 from etl.extract import ide_simulate
+from etl.extract.client import HttpClient
+from etl.extract.fetch_state import FetchState
 
 DETACHED_PROCESS = 0x00000008
 CREATE_NO_WINDOW = 0x08000000
 
+# extractores asíncronos (arun(client, out_dir, ...)); se importan al lanzarlos: i-DE arrastra
+# pdfplumber (y selenium al abrir Chrome), y si falta alguno pasa a simulación como cualquier otro fallo
+EXTRACTORS = {
+    "IDE": "etl.extract.electricidad_ide",
+    "CANAL": "etl.extract.agua_canal",
+    "AYTO": "etl.extract.calles_ayto",
+    "GAS": "etl.extract.gas_sim",
+}
+# fuente de data_raw / data_curated de cada extractor
+SOURCES = {"IDE": "ide", "CANAL": "canal", "AYTO": "ayto", "GAS": "gas"}
+# resultado de la última extracción por fuente (changed / unchanged / simulated / failed): run_pipeline
+# no transforma ni carga las que no han cambiado
+STATUS_FILE = "_extract_status.json"
+# tiempo máximo por fuente (s, EXTRACT_BUDGET_<FUENTE>); agotado, la fuente cuenta como fallida
+BUDGETS = {tag: float(os.getenv(f"EXTRACT_BUDGET_{tag}", default))
+           for tag, default in (("IDE", "600"), ("CANAL", "90"), ("AYTO", "90"), ("GAS", "60"))}
+
 
 def _print(enabled: bool, msg: str) -> None:
     if enabled:
         print(msg)
 
 
-def _safe(tag, fn, *args, quiet: bool = False, **kwargs):
+async def _job(client: HttpClient, tag: str, out: str, quiet: bool = False,
+               state: FetchState | None = None, **kwargs):
+    budget = BUDGETS.get(tag)
     try:
-        fn(*args, **kwargs)
+        mod = importlib.import_module(EXTRACTORS[tag])
+        status = await asyncio.wait_for(mod.arun(client, out, state=state, **kwargs), budget)
         _print(not quiet, f"[OK] {tag}")
-        return tag, True, None
-    except Exception as e:
-        _print(True, f"[WARN] {tag} falló: {e}")
-        if tag == "IDE":
-            _print(True, "[IDE] Activando simulación por fallo en scraping…")
-            out_dir = Path(args[0]) if len(args) > 0 else None
-            if out_dir is None:
-                today = datetime.now(timezone.utc).strftime("%Y%m%d")
-                out_dir = Path("etl") / "data_raw" / "ide" / today
-            out_dir.mkdir(parents=True, exist_ok=True)
-
+        return tag, status, None
+    except asyncio.TimeoutError:
+        e = TimeoutError(f"sin terminar en {budget:.0f}s")
+    except Exception as exc:
+        e = exc
+    return _fallback(tag, e, out)
+
+
+def _fallback(tag, e, out=None):
+    _print(True, f"[WARN] {tag} falló: {e}")
+    if tag == "IDE":
+        _print(True, "[IDE] Activando simulación por fallo en scraping…")
+        out_dir = Path(out) if out else None
+        if out_dir is None:
+            today = datetime.now(timezone.utc).strftime("%Y%m%d")
+            out_dir = Path("etl") / "data_raw" / "ide" / today
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        try:
             try:
-                try:
-                    ide_simulate.run(output_dir=str(out_dir))
-                except TypeError:
-                    ide_simulate.run()
-            except Exception as e2:
-                _print(True, f"[WARN] ide_simulate falló: {e2}")
-
-            def _has_events(p: Path) -> bool:
-                try:
-                    data = json.loads(p.read_text(encoding="utf-8"))
-                    if isinstance(data, list):
-                        return len(data) > 0
-                    if isinstance(data, dict):
-                        return len(data.get("events", [])) > 0
-                    return False
-                except Exception:
-                    return False
+                ide_simulate.run(output_dir=str(out_dir))
+            except TypeError:
+                ide_simulate.run()
+        except Exception as e2:
+            _print(True, f"[WARN] ide_simulate falló: {e2}")
 
+        def _has_events(p: Path) -> bool:
+            try:
+                data = json.loads(p.read_text(encoding="utf-8"))
+                if isinstance(data, list):
+                    return len(data) > 0
+                if isinstance(data, dict):
+                    return len(data.get("events", [])) > 0
+                return False
+            except Exception:
+                return False
+
+        candidates = [p for p in out_dir.glob("*.json") if _has_events(p)]
+
+        if not candidates:
+            ide_simulate.run(output_dir=str(out_dir), dias=7, por_dia=3, seed=42)
             candidates = [p for p in out_dir.glob("*.json") if _has_events(p)]
 
-            if not candidates:
-                ide_simulate.run(output_dir=str(out_dir), dias=7, por_dia=3, seed=42)
-                candidates = [p for p in out_dir.glob("*.json") if _has_events(p)]
+        if candidates:
+            candidates.sort(key=lambda x: x.stat().st_mtime, reverse=True)
+            canon = out_dir / "cortes_ide_events.json"
+            if candidates[0] != canon:
+                shutil.copyfile(candidates[0], canon)
+            _print(True, f"[IDE] Simulación OK -> {canon}")
+            return tag, "simulated", None
+
+    return tag, "failed", str(e)
 
-            if candidates:
-                candidates.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-                canon = out_dir / "cortes_ide_events.json"
-                if candidates[0] != canon:
-                    shutil.copyfile(candidates[0], canon)
-                _print(True, f"[IDE] Simulación OK -> {canon}")
-                return tag, True, None
 
-        return tag, False, str(e)
+async def extract(jobs, quiet: bool = False, state: FetchState | None = None):
+    """Lanza todas las fuentes a la vez sobre un mismo cliente HTTP; [(tag, estado, err), ...]
+    con estado changed / unchanged / simulated / failed."""
+    results = []
+    async with HttpClient() as client:
+        tasks = [asyncio.create_task(_job(client, tag, out, quiet=quiet, state=state, **kw)) for tag, out, kw in jobs]
+        for fut in asyncio.as_completed(tasks):
+            tag, status, err = await fut
+            _print(not quiet, f"[{tag}] {status.upper()}{'' if err is None else f' -> {err}'}")
+            results.append((tag, status, err))
+    return results
+
+
+def write_status(base: Path, results) -> Path:
+    fp = base / STATUS_FILE
+    fp.write_text(json.dumps({
+        "at_utc": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "sources": {SOURCES[tag]: status for tag, status, _ in sorted(results)},
+    }, indent=1), encoding="utf-8")
+    return fp
 
 
 def _cwd_data_base() -> Path:
@@ -114,20 +165,16 @@ def main():
     out_calles = base / "ayto" / today
     out_gas = base / "gas" / today
 
+    jobs = []
     if args.mode in ("daily", "all"):
-        jobs = [
-            ("IDE", electricidad_ide.run, str(out_luz)),
-            ("CANAL", agua_canal.run, str(out_agua)),
-            ("AYTO", calles_ayto.run, str(out_calles)),
-        ]
-        with ThreadPoolExecutor(max_workers=3) as ex:
-            futs = {ex.submit(_safe, tag, fn, out, quiet=args.quiet): tag for tag, fn, out in jobs}
-            for fut in as_completed(futs):
-                tag, ok, err = fut.result()
-                _print(not args.quiet, f"[{tag}] {'OK' if ok else 'FAIL'}{'' if ok else f' -> {err}'}")
-
+        jobs += [("IDE", str(out_luz), {}), ("CANAL", str(out_agua), {}), ("AYTO", str(out_calles), {})]
     if args.mode in ("weekly", "all"):
-        _safe("GAS", gas_sim.run, str(out_gas), dias=7, por_dia=3, seed=42, quiet=args.quiet)
+        jobs.append(("GAS", str(out_gas), dict(dias=7, por_dia=3, seed=42)))
+    state = FetchState.load()
+    results = asyncio.run(extract(jobs, quiet=args.quiet, state=state))
+    # pendiente: run_pipeline lo confirma cuando la carga ha terminado
+    state.save(pending=True)
+    write_status(base, results)
 
     _print(not args.quiet, ">> extracción terminada")
 
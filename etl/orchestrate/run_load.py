@@ -1,6 +1,8 @@
 import os
+import argparse
 import subprocess
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional
 from textwrap import dedent
 import duckdb
 from dotenv import load_dotenv
@@ -8,6 +10,9 @@ import psycopg2
 from psycopg2 import sql
 import os
 
+from etl.transform import selection
+from etl.transform.selection import DtRange
+
 ETL_ROOT = Path(__file__).resolve().parents[1]
 REPO_ROOT = ETL_ROOT.parent
 CURATED = ETL_ROOT / "data_curated"
@@ -100,62 +105,107 @@ def ensure_profiles_yml():
     """).lstrip()
     DBT_PROFILES_YML.write_text(yml, encoding="utf-8")
 
-def _parquet(rel_path: Path) -> str:
-    p = rel_path.resolve()
-    if not p.exists():
-        raise SystemExit(f"No existe el Parquet: {p}")
-    return p.as_posix()
-
-def build_duckdb_sql() -> str:
-    pg_host = os.environ["PGHOST"]
-    pg_port = os.environ["PGPORT"]
-    pg_db = os.environ["PGDATABASE"]
-    pg_user = os.environ["PGUSER"]
-    pg_pass = os.environ["PGPASSWORD"]
-
-    p_elec = _parquet(CURATED / "ide" / "history.parquet")
-    p_water = _parquet(CURATED / "canal" / "history.parquet")
-    p_road = _parquet(CURATED / "ayto" / "history.parquet")
-    p_gas = _parquet(CURATED / "gas" / "history.parquet")
+def _dataset(src_dir: Path) -> str:
+    # el histórico de una fuente es su dataset particionado: todas las dt=*/part-*.parquet
+    d = src_dir.resolve()
+    if not any(d.glob("dt=*/part-*.parquet")):
+        raise SystemExit(f"No hay particiones dt=* en: {d}")
+    return (d / "dt=*" / "part-*.parquet").as_posix()
+
+def _read(glob: str) -> str:
+    # dt sale de la ruta (hive) para poder podar particiones; los filtros sobre columnas se
+    # resuelven con las estadísticas de row group que escribe el transform
+    return f"read_parquet('{glob}', union_by_name=true, hive_partitioning=true)"
+
+# tabla de staging <- fuente curada
+TABLES = {"electricity": "ide", "water": "canal", "road": "ayto", "gas": "gas"}
+
+def _dt_filter(dts: DtRange) -> str:
+    lo, hi = dts
+    conds = ([f"dt >= DATE '{lo}'"] if lo else []) + ([f"dt <= DATE '{hi}'"] if hi else [])
+    return " AND ".join(conds)
+
+def _table_sql(table: str, rel: str, dts: DtRange, full: bool = False) -> str:
+    where = _dt_filter(dts)
+    if full or not where:
+        # carga completa: se recrea la tabla
+        return f"""
+    DROP TABLE IF EXISTS pg.staging.{table} CASCADE;
+    CREATE TABLE pg.staging.{table} AS
+    SELECT * FROM {rel} WHERE 1=0;
+    INSERT INTO pg.staging.{table}
+    SELECT * FROM {rel};
+"""
+    # backfill: sólo se sustituyen las filas de los dt seleccionados; el filtro sobre dt
+    # (columna hive) poda las particiones que no se leen
+    return f"""
+    CREATE TABLE IF NOT EXISTS pg.staging.{table} AS
+    SELECT * FROM {rel} WHERE 1=0;
+    DELETE FROM pg.staging.{table} WHERE {where};
+    INSERT INTO pg.staging.{table} BY NAME
+    SELECT * FROM {rel} WHERE {where};
+"""
+
+def _attach_sql() -> str:
+    return (f"ATTACH 'dbname={os.environ['PGDATABASE']} user={os.environ['PGUSER']} "
+            f"password={os.environ['PGPASSWORD']} host={os.environ['PGHOST']} port={os.environ['PGPORT']}' "
+            f"AS pg (TYPE POSTGRES)")
+
+def _selected(sources: Optional[List[str]]):
+    return [(table, source) for table, source in TABLES.items() if not sources or source in sources]
+
+def schema_drift(con, sources: Optional[List[str]] = None) -> Dict[str, str]:
+    """Tablas de staging que un backfill no puede actualizar en el sitio, con el motivo: creadas
+    antes de existir ``dt`` o sin alguna columna que ya trae el curado (INSERT BY NAME fallaría).
+    ``con`` es una conexión DuckDB con Postgres adjunto como ``pg``; una tabla que aún no existe
+    no cuenta (la crea el propio backfill)."""
+    out = {}
+    for table, source in _selected(sources):
+        have = {r[0] for r in con.execute(
+            "SELECT column_name FROM duckdb_columns() "
+            "WHERE database_name = 'pg' AND schema_name = 'staging' AND table_name = ?", [table]).fetchall()}
+        if not have:
+            continue
+        curated = {r[0] for r in con.sql(f"DESCRIBE SELECT * FROM {_read(_dataset(CURATED / source))}").fetchall()}
+        if "dt" not in have:
+            out[table] = "sin columna dt"
+        elif curated - have:
+            out[table] = "faltan columnas: " + ", ".join(sorted(curated - have))
+    return out
+
+def build_duckdb_sql(sources: Optional[List[str]] = None, dts: DtRange = (None, None),
+                     full_tables: Iterable[str] = ()) -> str:
+    """Script de carga; las tablas de ``full_tables`` se recrean enteras aunque haya selección de dt."""
+    full_tables = set(full_tables)
+    body = "".join(_table_sql(table, _read(_dataset(CURATED / source)), dts, full=table in full_tables)
+                   for table, source in _selected(sources))
 
     sql = f"""
     INSTALL postgres;
     LOAD postgres;
 
-    ATTACH 'dbname={pg_db} user={pg_user} password={pg_pass} host={pg_host} port={pg_port}' AS pg (TYPE POSTGRES);
+    {_attach_sql()};
     CREATE SCHEMA IF NOT EXISTS pg.staging;
-
-    DROP TABLE IF EXISTS pg.staging.electricity CASCADE;
-    CREATE TABLE pg.staging.electricity AS
-    SELECT * FROM read_parquet('{p_elec}') WHERE 1=0;
-    INSERT INTO pg.staging.electricity
-    SELECT * FROM read_parquet('{p_elec}');
-
-    DROP TABLE IF EXISTS pg.staging.water CASCADE;
-    CREATE TABLE pg.staging.water AS
-    SELECT * FROM read_parquet('{p_water}') WHERE 1=0;
-    INSERT INTO pg.staging.water
-    SELECT * FROM read_parquet('{p_water}');
-
-    DROP TABLE IF EXISTS pg.staging.road CASCADE;
-    CREATE TABLE pg.staging.road AS
-    SELECT * FROM read_parquet('{p_road}') WHERE 1=0;
-    INSERT INTO pg.staging.road
-    SELECT * FROM read_parquet('{p_road}');
-
-    DROP TABLE IF EXISTS pg.staging.gas CASCADE;
-    CREATE TABLE pg.staging.gas AS
-    SELECT * FROM read_parquet('{p_gas}') WHERE 1=0;
-    INSERT INTO pg.staging.gas
-    SELECT * FROM read_parquet('{p_gas}');
-
+{body}
     DETACH pg;
     """
     return dedent(sql).strip() + "\n"
 
-def load_staging_inline():
+def _drifted_tables(sources: Optional[List[str]]) -> Dict[str, str]:
+    con = duckdb.connect()
+    try:
+        con.execute("INSTALL postgres; LOAD postgres;")
+        con.execute(_attach_sql() + ";")
+        return schema_drift(con, sources)
+    finally:
+        con.close()
+
+def load_staging_inline(sources: Optional[List[str]] = None, dts: DtRange = (None, None)):
     print("== [LOAD] Cargando staging (DuckDB → Postgres) ==")
-    sql = build_duckdb_sql()
+    drift = _drifted_tables(sources) if _dt_filter(dts) else {}
+    for table, why in drift.items():
+        print(f"== [LOAD] staging.{table} no admite backfill ({why}): se recarga entera ==")
+    sql = build_duckdb_sql(sources, dts, full_tables=drift)
     print("== [LOAD] SQL inline (sin DROP) ==\n")
     print(sql)
     INFRA_DIR.mkdir(parents=True, exist_ok=True)
@@ -167,12 +217,15 @@ def run_dbt_build():
     print("== [LOAD] Ejecutando dbt build ==")
     sh(["dbt", "build", "--project-dir", str(DBT_PROJECT_DIR)])
 
-def main():
+def main(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser()
+    selection.add_arguments(p, TABLES.values())
+    sources, dts = selection.from_args(p, p.parse_args(argv))
     ensure_env()
     #ensure_postgres_up()
     ensure_schemas()
     ensure_profiles_yml()
-    load_staging_inline()
+    load_staging_inline(sources, dts)
     run_dbt_build()
     print("== [LOAD] OK ==")
 
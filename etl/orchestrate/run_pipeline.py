@@ -1,15 +1,19 @@
 # etl/orchestrate/run_pipeline.py
 import os
 import sys
+import json
 import subprocess
 from pathlib import Path
 from datetime import datetime, timezone
 
+from etl.extract import fetch_state
+
 BASE = Path(__file__).resolve().parents[1]
 RAW = BASE / "data_raw"
 CUR = BASE / "data_curated"
 SOURCES_DAILY = ["ide", "canal", "ayto"]
 SOURCES_WEEKLY = ["gas"]
+STATUS_FILE = RAW / "_extract_status.json"  # lo escribe run_extract
 
 def _today_yymmdd():
     return datetime.now(timezone.utc).strftime("%Y%m%d")
@@ -22,9 +26,11 @@ def _run(cmd):
     if r.returncode != 0:
         raise SystemExit(r.returncode)
 
+RAW_SUFFIXES = (".json", ".ndjson")  # los mismos que lee run_transform._iter_json_files
+
 def _raw_has_json(src, yyyymmdd):
     d = RAW / src / yyyymmdd
-    return d.exists() and any(p.is_file() and p.suffix.lower() == ".json" for p in d.iterdir())
+    return d.exists() and any(p.is_file() and p.suffix.lower() in RAW_SUFFIXES for p in d.iterdir())
 
 def _list_missing_and_available(mode):
     need = list(SOURCES_DAILY)
@@ -51,12 +57,30 @@ def _soft_verify_transform(dt_iso, sources):
     if not (u.exists() and u.is_file() and u.stat().st_size > 0):
         print(f"[warn][union] falta union dt={dt_iso}")
 
+def _changed_sources():
+    """Fuentes a transformar y cargar: todas menos las que run_extract marcó "unchanged".
+    None = sin información (se procesa todo)."""
+    try:
+        status = json.loads(STATUS_FILE.read_text(encoding="utf-8")).get("sources") or {}
+    except (FileNotFoundError, ValueError):
+        return None
+    unchanged = {s for s, st in status.items() if st == "unchanged"}
+    if not unchanged:
+        return None
+    return [s for s in SOURCES_DAILY + SOURCES_WEEKLY if s not in unchanged]
+
+def _source_args(sources):
+    return [a for s in sources for a in ("--source", s)]
+
 def main():
     mode = os.getenv("PIPELINE_MODE", "all").strip().lower()
     if mode not in ("daily", "weekly", "all"):
         mode = "all"
 
-    # 1) Extraer (incluye fallback/simulación dentro de run_extract)
+    # 1) Extraer (incluye fallback/simulación dentro de run_extract); sin el estado anterior,
+    #    para no saltar fuentes si la extracción no llega a escribir el nuevo
+    STATUS_FILE.unlink(missing_ok=True)
+    fetch_state.discard_pending()
     _run([sys.executable, "-m", "etl.orchestrate.run_extract", "--mode", mode])
 
     # 2) Verificar extracción de forma NO bloqueante y continuar siempre
@@ -67,15 +91,26 @@ def main():
     else:
         print(f"[ok][extract] {ymd} todas las fuentes presentes")
 
-    # 3) Transformar (parquets) — SIEMPRE
-    _run([sys.executable, "-m", "etl.transform.run_transform"])
+    # 3) Transformar (parquets) — salvo las fuentes que no han cambiado desde la última extracción
+    sources = _changed_sources()
+    if sources == []:
+        print("[pipeline] ninguna fuente ha cambiado: sin transform ni carga")
+        fetch_state.promote()
+        print("[pipeline] ok")
+        return
+    if sources is not None:
+        print(f"[pipeline] sin cambios: {', '.join(s for s in SOURCES_DAILY + SOURCES_WEEKLY if s not in sources)}")
+    _run([sys.executable, "-m", "etl.transform.run_transform", *_source_args(sources or [])])
 
     # 4) Verificación suave de transform — NO bloquea
-    _soft_verify_transform(dt_iso, avail)
+    _soft_verify_transform(dt_iso, [s for s in avail if sources is None or s in sources])
 
-    # 5) Cargar + dbt — SIEMPRE
-    _run([sys.executable, "-m", "etl.orchestrate.run_load"])
+    # 5) Cargar + dbt
+    _run([sys.executable, "-m", "etl.orchestrate.run_load", *_source_args(sources or [])])
 
+    # 6) Sólo ahora el estado de descarga: si algo de lo anterior falla, la próxima extracción
+    #    vuelve a ver las fuentes como cambiadas
+    fetch_state.promote()
     print("[pipeline] ok")
 
 if __name__ == "__main__":
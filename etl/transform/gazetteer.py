@@ -0,0 +1,245 @@
+# etl/transform/gazetteer.py
+# Geocodificador local a partir del callejero de Madrid (fichero de portales en CSV o Parquet,
+# p. ej. el "Callejero oficial - portales" del portal de datos abiertos).
+# - índice en memoria: nombre de vía normalizado -> portal -> (lat, lon)
+# - el tipo de vía se canoniza (C/, Cl, Calle -> calle; Av., Avda -> avenida; ...) y además se
+#   indexa sin tipo, para casar "Alberto Alcocer" con "Avenida de Alberto Alcocer"
+# - fuzzy sobre el nombre con un índice de trigramas (sólo se compara con unos pocos candidatos)
+# - portal inexistente -> el más cercano de la misma paridad en esa vía
+# Nominatim queda como fallback para lo que aquí no se resuelve.
+import os
+import re
+import bisect
+import difflib
+import unicodedata
+from pathlib import Path
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+MIN_SCORE = float(os.getenv("GAZETTEER_MIN_SCORE", "0.85"))
+FUZZY_CANDIDATES = 25
+
+LatLon = Tuple[Optional[float], Optional[float]]
+
+_TYPES = {
+    "calle": "calle", "c": "calle", "cl": "calle", "cll": "calle", "call": "calle",
+    "avenida": "avenida", "av": "avenida", "avd": "avenida", "avda": "avenida",
+    "paseo": "paseo", "po": "paseo", "ps": "paseo", "pso": "paseo",
+    "plaza": "plaza", "pl": "plaza", "pza": "plaza", "plz": "plaza",
+    "carretera": "carretera", "ctra": "carretera", "cr": "carretera",
+    "camino": "camino", "cmno": "camino", "cno": "camino",
+    "ronda": "ronda", "rda": "ronda",
+    "glorieta": "glorieta", "gta": "glorieta",
+    "travesia": "travesia", "trva": "travesia", "tr": "travesia",
+    "costanilla": "costanilla", "cuesta": "cuesta", "pasaje": "pasaje", "psje": "pasaje",
+    "callejon": "callejon", "cjon": "callejon", "via": "via", "autovia": "autovia",
+}
+_PARTICLES = {"de", "del", "la", "las", "el", "los", "d", "l"}
+
+_LAT_COLS = ("lat", "latitud", "latitude", "LATITUD")
+_LON_COLS = ("lon", "lng", "longitud", "longitude", "LONGITUD")
+_NUM_COLS = ("numero", "NUMERO", "num", "portal", "number", "house_number")
+_STREET_COLS = ("via", "calle", "street", "nombre_via", "DIRECCION", "direccion")
+
+
+def _fold(s: str) -> str:
+    return unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode()
+
+
+def street_key(name: Optional[str], normalize: Callable[[Optional[str]], Optional[str]] = lambda s: s,
+               strip_accents: Callable[[str], str] = _fold) -> Tuple[Optional[str], Optional[str]]:
+    """(clave con tipo canonizado, clave sin tipo) de un nombre de vía; (None, None) si vacío."""
+    s = normalize(name) if name else None
+    if not s:
+        return None, None
+    tokens = re.findall(r"[a-z0-9]+", strip_accents(str(s)).lower())
+    kind = None
+    if tokens and tokens[0] in _TYPES and len(tokens) > 1:
+        kind = _TYPES[tokens.pop(0)]
+    while len(tokens) > 1 and tokens[0] in _PARTICLES:
+        tokens.pop(0)
+    if not tokens:
+        return None, None
+    bare = " ".join(tokens)
+    return (f"{kind} {bare}" if kind else bare), bare
+
+
+def _portal(n) -> Optional[str]:
+    if n is None or (isinstance(n, float) and n != n):
+        return None
+    s = re.sub(r"[^0-9a-z]", "", str(n).lower())
+    s = re.sub(r"^0+(?=\d)", "", s)
+    return s or None
+
+
+def _portal_int(p: Optional[str]) -> Optional[int]:
+    m = re.match(r"\d+", p or "")
+    return int(m.group()) if m else None
+
+
+def _coord(v) -> Optional[float]:
+    # decimal ("40.41", "40,41") o grados-minutos-segundos ("40º25'3.45'' N")
+    if v is None:
+        return None
+    if isinstance(v, (int, float)):
+        return None if v != v else float(v)
+    s = str(v).strip()
+    try:
+        return float(s.replace(",", "."))
+    except ValueError:
+        pass
+    m = re.match(r"^(-?\d+)\D+(\d+)\D+([\d.,]+)[^NSEWO]*([NSEWO])?", s, flags=re.IGNORECASE)
+    if not m:
+        return None
+    deg = abs(int(m.group(1))) + int(m.group(2)) / 60 + float(m.group(3).replace(",", ".")) / 3600
+    neg = m.group(1).startswith("-") or (m.group(4) or "").upper() in ("S", "W", "O")
+    return -deg if neg else deg
+
+
+def _trigrams(key: str) -> set:
+    s = f"  {key} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class _Street:
+    __slots__ = ("portals", "numbers", "center")
+
+    def __init__(self):
+        self.portals: Dict[str, Tuple[float, float]] = {}
+        self.numbers: List[Tuple[int, str]] = []
+        self.center: LatLon = (None, None)
+
+
+class Gazetteer:
+    def __init__(self, normalize_street: Callable[[Optional[str]], Optional[str]] = lambda s: s,
+                 strip_accents: Callable[[str], str] = _fold, min_score: float = MIN_SCORE):
+        self.normalize_street = normalize_street
+        self.strip_accents = strip_accents
+        self.min_score = min_score
+        self.streets: Dict[str, _Street] = {}
+        self._bare: Dict[str, List[str]] = {}
+        self._grams: Dict[str, List[str]] = {}
+        self._resolved: Dict[str, Optional[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.streets)
+
+    def _key(self, name: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        return street_key(name, self.normalize_street, self.strip_accents)
+
+    def add(self, street: str, number, lat: float, lon: float) -> None:
+        full, bare = self._key(street)
+        if full is None or lat is None or lon is None:
+            return
+        st = self.streets.get(full)
+        if st is None:
+            st = self.streets[full] = _Street()
+            self._bare.setdefault(bare, []).append(full)
+            for g in _trigrams(full):
+                self._grams.setdefault(g, []).append(full)
+        p = _portal(number)
+        if p and p not in st.portals:
+            st.portals[p] = (float(lat), float(lon))
+            n = _portal_int(p)
+            if n is not None:
+                bisect.insort(st.numbers, (n, p))
+        self._resolved.clear()
+
+    def _finish(self) -> None:
+        for st in self.streets.values():
+            if st.portals:
+                lats, lons = zip(*st.portals.values())
+                st.center = (sum(lats) / len(lats), sum(lons) / len(lons))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, street_col: Optional[str] = None, number_col: Optional[str] = None,
+                   lat_col: Optional[str] = None, lon_col: Optional[str] = None, **kw) -> "Gazetteer":
+        def pick(given, options):
+            if given:
+                return given
+            return next((c for c in options if c in df.columns), None)
+
+        lat_col, lon_col = pick(lat_col, _LAT_COLS), pick(lon_col, _LON_COLS)
+        number_col = pick(number_col, _NUM_COLS)
+        if lat_col is None or lon_col is None:
+            raise ValueError(f"callejero sin columnas de coordenadas: {list(df.columns)}")
+        if street_col:
+            streets = df[street_col]
+        elif "VIA_NOMBRE" in df.columns:
+            # formato del callejero oficial: clase + partícula + nombre
+            parts = [df[c].fillna("").astype(str) for c in ("VIA_CLASE", "VIA_PAR", "VIA_NOMBRE") if c in df.columns]
+            streets = parts[0].str.cat(parts[1:], sep=" ") if len(parts) > 1 else parts[0]
+        else:
+            col = pick(None, _STREET_COLS)
+            if col is None:
+                raise ValueError(f"callejero sin columna de vía: {list(df.columns)}")
+            streets = df[col]
+        numbers = df[number_col] if number_col else [None] * len(df)
+        gz = cls(**kw)
+        for street, number, lat, lon in zip(streets, numbers, df[lat_col], df[lon_col]):
+            if isinstance(street, str) and street.strip():
+                gz.add(street, number, _coord(lat), _coord(lon))
+        gz._finish()
+        return gz
+
+    @classmethod
+    def load(cls, path: Path, **kw) -> "Gazetteer":
+        path = Path(path)
+        if path.suffix.lower() == ".parquet":
+            df = pd.read_parquet(path)
+        else:
+            try:
+                df = pd.read_csv(path, sep=None, engine="python", dtype=str, encoding="utf-8")
+            except UnicodeDecodeError:
+                # el callejero del ayuntamiento se publica en latin-1
+                df = pd.read_csv(path, sep=None, engine="python", dtype=str, encoding="latin-1")
+        df.columns = [str(c).strip() for c in df.columns]
+        opts = {k: kw.pop(k) for k in ("street_col", "number_col", "lat_col", "lon_col") if k in kw}
+        return cls.from_frame(df, **opts, **kw)
+
+    # ---------------- búsqueda ----------------
+    def _fuzzy(self, full: str) -> Optional[str]:
+        counts = Counter(k for g in _trigrams(full) for k in self._grams.get(g, ()))
+        best, best_score = None, self.min_score
+        for cand, _ in counts.most_common(FUZZY_CANDIDATES):
+            score = difflib.SequenceMatcher(None, full, cand, autojunk=False).ratio()
+            if score > best_score:
+                best, best_score = cand, score
+        return best
+
+    def resolve_street(self, name: Optional[str]) -> Optional[str]:
+        """Clave de la vía del callejero que corresponde a ``name`` (exacta, sin tipo o fuzzy)."""
+        if not name:
+            return None
+        if name in self._resolved:
+            return self._resolved[name]
+        full, bare = self._key(name)
+        found = None
+        if full is not None:
+            if full in self.streets:
+                found = full
+            elif len(self._bare.get(bare, ())) == 1:
+                found = self._bare[bare][0]
+            else:
+                found = self._fuzzy(full)
+        self._resolved[name] = found
+        return found
+
+    def lookup(self, street: Optional[str], number: Optional[str] = None) -> LatLon:
+        key = self.resolve_street(street)
+        if key is None:
+            return None, None
+        st = self.streets[key]
+        p = _portal(number)
+        if p in st.portals:
+            return st.portals[p]
+        n = _portal_int(p)
+        if n is None or not st.numbers:
+            return st.center
+        # portal más cercano, preferentemente de la misma acera (paridad)
+        i = bisect.bisect_left(st.numbers, (n, ""))
+        near = st.numbers[max(0, i - 4):i + 4]
+        same = [x for x in near if x[0] % 2 == n % 2] or near
+        return st.portals[min(same, key=lambda x: abs(x[0] - n))[1]]
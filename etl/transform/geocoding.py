@@ -0,0 +1,389 @@
+# etl/transform/geocoding.py
+# Servicio de geocodificación (Nominatim) para el transform:
+# - una sola conexión SQLite en modo WAL por proceso (caché persistente en .cache/geocode.sqlite)
+# - LRU en memoria delante de SQLite
+# - caché negativa con TTL: las direcciones sin resultado no vuelven a Nominatim cada ejecución
+# - resolución por lotes: cache hits en una consulta bulk y los misses en un cliente
+#   concurrente con límite de peticiones por segundo (sin sleep(1) en línea); el límite se
+#   reparte en la misma SQLite, así que vale para todos los workers del transform juntos
+# - la inversa se cachea por celda geohash (precisión 8 ≈ 38x19 m), no por float exacto, y si
+#   la celda no está se reutiliza la calle de un punto ya geocodificado a menos de N metros
+import os
+import math
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org").rstrip("/")
+USER_AGENT = os.getenv("GEOCODE_UA", "enterate-etl/1.0")
+NEG_TTL = float(os.getenv("GEOCODE_NEG_TTL_DAYS", "7")) * 86400
+RATE = float(os.getenv("GEOCODE_RATE", "1.0"))              # peticiones/s (política de Nominatim: 1)
+CONCURRENCY = int(os.getenv("GEOCODE_CONCURRENCY", "2"))
+LRU_SIZE = int(os.getenv("GEOCODE_LRU_SIZE", "50000"))
+TIMEOUT = float(os.getenv("GEOCODE_TIMEOUT", "20"))
+REV_PRECISION = int(os.getenv("GEOCODE_REV_PRECISION", "8"))
+REV_NEAREST_M = float(os.getenv("GEOCODE_REV_NEAREST_M", "30"))   # 0 = sin vecino más cercano
+
+_SQL_CHUNK = 500
+_MISS = object()
+
+LatLon = Tuple[Optional[float], Optional[float]]
+Street = Tuple[Optional[str], Optional[str]]
+
+_B32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(lat: float, lon: float, precision: int = REV_PRECISION) -> str:
+    lat_rng, lon_rng = [-90.0, 90.0], [-180.0, 180.0]
+    out, ch, bits, even = [], 0, 0, True
+    while len(out) < precision:
+        rng, v = (lon_rng, lon) if even else (lat_rng, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if v >= mid:
+            ch = ch * 2 + 1
+            rng[0] = mid
+        else:
+            ch = ch * 2
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_B32[ch])
+            ch = bits = 0
+    return "".join(out)
+
+
+def _cell_size(precision: int) -> Tuple[float, float]:
+    nbits = 5 * precision
+    return 180.0 / 2 ** (nbits // 2), 360.0 / 2 ** (nbits - nbits // 2)
+
+
+def _neighbours(lat: float, lon: float, precision: int) -> List[str]:
+    dlat, dlon = _cell_size(precision)
+    return sorted({geohash(lat + i * dlat, lon + j * dlon, precision) for i in (-1, 0, 1) for j in (-1, 0, 1)})
+
+
+def distance_m(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    la1, lo1, la2, lo2 = map(math.radians, (*a, *b))
+    h = math.sin((la2 - la1) / 2) ** 2 + math.cos(la1) * math.cos(la2) * math.sin((lo2 - lo1) / 2) ** 2
+    return 2 * 6371008.8 * math.asin(math.sqrt(h))
+
+
+class _LRU:
+    def __init__(self, size: int):
+        self.size = size
+        self._d: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._d:
+                return _MISS
+            self._d.move_to_end(key)
+            return self._d[key]
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._d[key] = value
+            self._d.move_to_end(key)
+            while len(self._d) > self.size:
+                self._d.popitem(last=False)
+
+
+class RateLimiter:
+    """Reparte huecos de 1/rate segundos entre todos los hilos y, con ``db_path``, entre todos los
+    procesos que abren esa base: el siguiente hueco libre se reserva en una transacción."""
+
+    def __init__(self, rate: float, db_path: Optional[Path] = None):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+        self._cx = None
+        if db_path is not None and self.interval:
+            # conexión propia en autocommit: la usan los hilos del pool, siempre bajo _lock
+            self._cx = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._cx.execute("create table if not exists rate_slot(id integer primary key, next_at real not null)")
+
+    def _reserve(self, now: float) -> float:
+        if self._cx is None:
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+            return slot
+        self._cx.execute("begin immediate")
+        try:
+            row = self._cx.execute("select next_at from rate_slot where id = 0").fetchone()
+            slot = max(now, row[0] if row else 0.0)
+            self._cx.execute("insert or replace into rate_slot(id, next_at) values(0, ?)", (slot + self.interval,))
+            self._cx.execute("commit")
+        except BaseException:
+            self._cx.execute("rollback")
+            raise
+        return slot
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            # reloj de pared: el hueco se compara entre procesos
+            now = time.time()
+            slot = self._reserve(now)
+        if slot > now:
+            time.sleep(slot - now)
+
+    def close(self) -> None:
+        if self._cx is not None:
+            self._cx.close()
+
+
+class Geocoder:
+    def __init__(self, db_path: Path, base_url: str = NOMINATIM_URL, user_agent: str = USER_AGENT,
+                 neg_ttl: float = NEG_TTL, rate: float = RATE, concurrency: int = CONCURRENCY,
+                 lru_size: int = LRU_SIZE, timeout: float = TIMEOUT,
+                 rev_precision: int = REV_PRECISION, rev_nearest_m: float = REV_NEAREST_M,
+                 normalize_street: Callable[[Optional[str]], Optional[str]] = lambda s: s,
+                 normalize_number: Callable[[Optional[str]], Optional[str]] = lambda n: n):
+        self.db_path = Path(db_path)
+        self.base_url = base_url.rstrip("/")
+        self.neg_ttl = neg_ttl
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.rev_precision = rev_precision
+        self.rev_nearest_m = rev_nearest_m
+        # el radio del vecino más cercano se busca en las 3x3 celdas de un nivel menos de precisión
+        self._near_precision = max(1, rev_precision - 1)
+        while self._near_precision > 1 and min(
+                _cell_size(self._near_precision)[0] * 111_000, _cell_size(self._near_precision)[1] * 85_000
+        ) < rev_nearest_m:
+            self._near_precision -= 1
+        self.normalize_street = normalize_street
+        self.normalize_number = normalize_number
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.limiter = RateLimiter(rate, db_path)
+        self.stats = {"hits": 0, "misses": 0, "network": 0, "negative": 0, "nearest": 0}
+        self._fwd = _LRU(lru_size)
+        self._rev = _LRU(lru_size)
+        self._session = requests.Session()
+        self._session.headers.update({"User-Agent": user_agent})
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self.cx = sqlite3.connect(db_path, timeout=30)
+        self.cx.execute("pragma journal_mode=WAL")
+        self.cx.execute("pragma synchronous=NORMAL")
+        self.cx.executescript("""
+            create table if not exists gc(address text primary key, lat real, lon real);
+            create table if not exists gc_neg(address text primary key, failed_at real not null);
+            create table if not exists revgc_cell(cell text primary key, lat real, lon real, street text, number text);
+            create table if not exists revgc_cell_neg(cell text primary key, failed_at real not null);
+        """)
+        self._migrate_revgc()
+        self.cx.commit()
+
+    def _migrate_revgc(self) -> None:
+        # caché antigua por (lat, lon) exacto -> celdas
+        if not self.cx.execute("select 1 from sqlite_master where type='table' and name='revgc'").fetchone():
+            return
+        if self.cx.execute("select 1 from revgc_cell limit 1").fetchone():
+            return
+        rows = self.cx.execute("select lat,lon,street,number from revgc where street is not null").fetchall()
+        self.cx.executemany("insert or ignore into revgc_cell(cell,lat,lon,street,number) values(?,?,?,?,?)",
+                            [(geohash(lat, lon, self.rev_precision), lat, lon, st, num) for lat, lon, st, num in rows])
+
+    def close(self) -> None:
+        self._session.close()
+        self.limiter.close()
+        self.cx.close()
+
+    # ---------------- consultas bulk a SQLite ----------------
+    def _bulk(self, sql: str, keys: List, width: int = 1):
+        rows = []
+        for i in range(0, len(keys), _SQL_CHUNK):
+            chunk = keys[i:i + _SQL_CHUNK]
+            if width == 1:
+                marks = ",".join("?" * len(chunk))
+                rows += self.cx.execute(sql.format(marks=marks), chunk).fetchall()
+            else:
+                marks = ",".join(["(?,?)"] * len(chunk))
+                rows += self.cx.execute(sql.format(marks=marks), [v for k in chunk for v in k]).fetchall()
+        return rows
+
+    def _fetch_all(self, fn, keys: List) -> Dict:
+        if not keys:
+            return {}
+        if self.concurrency == 1 or len(keys) == 1:
+            return {k: fn(k) for k in keys}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as ex:
+            return dict(zip(keys, ex.map(fn, keys)))
+
+    def _get(self, path: str, params: Dict):
+        self.limiter.wait()
+        self.stats["network"] += 1
+        try:
+            r = self._session.get(f"{self.base_url}/{path}", params=params, timeout=self.timeout)
+        except requests.RequestException:
+            return _MISS
+        if not r.ok:
+            # 429/5xx: transitorio, no se cachea como negativo
+            return _MISS
+        try:
+            return r.json()
+        except ValueError:
+            return _MISS
+
+    # ---------------- directa: dirección -> (lat, lon) ----------------
+    def _search(self, address: str):
+        data = self._get("search", {"q": address, "format": "json", "limit": 1})
+        if data is _MISS:
+            return _MISS
+        if isinstance(data, list) and data:
+            try:
+                return float(data[0]["lat"]), float(data[0]["lon"])
+            except (KeyError, TypeError, ValueError):
+                return None
+        return None
+
+    def geocode_many(self, addresses: Iterable[str]) -> Dict[str, LatLon]:
+        """Resuelve direcciones distintas; las que no tienen resultado devuelven (None, None)."""
+        out: Dict[str, LatLon] = {}
+        keys = list(dict.fromkeys(a for a in addresses if a))
+        todo = []
+        for a in keys:
+            v = self._fwd.get(a)
+            if v is _MISS:
+                todo.append(a)
+            else:
+                out[a] = v
+        if not todo:
+            self.stats["hits"] += len(keys)
+            return out
+        for addr, lat, lon in self._bulk("select address,lat,lon from gc where address in ({marks})", todo):
+            out[addr] = (float(lat), float(lon))
+        cutoff = time.time() - self.neg_ttl
+        for (addr,) in self._bulk(f"select address from gc_neg where failed_at > {cutoff} and address in ({{marks}})",
+                                  [a for a in todo if a not in out]):
+            out[addr] = (None, None)
+            self.stats["negative"] += 1
+        missing = [a for a in todo if a not in out]
+        self.stats["hits"] += len(keys) - len(missing)
+        self.stats["misses"] += len(missing)
+        fetched = self._fetch_all(self._search, missing)
+        now = time.time()
+        with self.cx:
+            for addr, res in fetched.items():
+                if res is _MISS:
+                    out[addr] = (None, None)
+                elif res is None:
+                    self.cx.execute("insert or replace into gc_neg(address, failed_at) values(?,?)", (addr, now))
+                    out[addr] = (None, None)
+                else:
+                    self.cx.execute("insert or replace into gc(address,lat,lon) values(?,?,?)", (addr, *res))
+                    self.cx.execute("delete from gc_neg where address=?", (addr,))
+                    out[addr] = res
+        for a in todo:
+            # los fallos transitorios no se recuerdan ni en memoria
+            if not (a in fetched and fetched[a] is _MISS):
+                self._fwd.put(a, out[a])
+        return out
+
+    def geocode(self, address: Optional[str]) -> LatLon:
+        if not address:
+            return None, None
+        return self.geocode_many([address]).get(address, (None, None))
+
+    # ---------------- inversa: (lat, lon) -> (calle, número) ----------------
+    def _reverse(self, key: Tuple[float, float]):
+        lat, lon = key
+        data = self._get("reverse", {"lat": f"{lat:.7f}", "lon": f"{lon:.7f}", "format": "json",
+                                     "zoom": 18, "addressdetails": 1})
+        if data is _MISS:
+            return _MISS
+        addr = data.get("address", {}) if isinstance(data, dict) else {}
+        via = addr.get("road") or addr.get("pedestrian") or addr.get("footway") or addr.get("path") \
+            or addr.get("residential") or addr.get("cycleway")
+        if not via:
+            return None
+        return self.normalize_street(via), self.normalize_number(addr.get("house_number"))
+
+    def _nearest(self, lat: float, lon: float) -> Optional[Tuple[float, float, Street]]:
+        best, best_d = None, self.rev_nearest_m
+        for prefix in _neighbours(lat, lon, self._near_precision):
+            rows = self.cx.execute("select lat,lon,street from revgc_cell where cell >= ? and cell < ?",
+                                   (prefix, prefix + "~")).fetchall()
+            for plat, plon, st in rows:
+                d = distance_m((lat, lon), (plat, plon))
+                if d <= best_d:
+                    # del vecino sólo vale la calle: su portal no es el de este punto
+                    best, best_d = (plat, plon, (st, None)), d
+        return best
+
+    def reverse_many(self, coords: Iterable[Tuple[float, float]]) -> Dict[Tuple[float, float], Street]:
+        """(calle, número) por coordenada; las coordenadas de una misma celda comparten resultado."""
+        keys = list(dict.fromkeys((float(lat), float(lon)) for lat, lon in coords))
+        cell_of = {k: geohash(*k, self.rev_precision) for k in keys}
+        rep: Dict[str, Tuple[float, float]] = {}
+        for k, c in cell_of.items():
+            rep.setdefault(c, k)
+        found: Dict[str, Street] = {}
+        todo = []
+        for c in rep:
+            v = self._rev.get(c)
+            if v is _MISS:
+                todo.append(c)
+            else:
+                found[c] = v
+        n_keys = len(rep)
+        if todo:
+            for c, st, num in self._bulk("select cell,street,number from revgc_cell where cell in ({marks})", todo):
+                found[c] = (st or None, num or None)
+            cutoff = time.time() - self.neg_ttl
+            for (c,) in self._bulk(f"select cell from revgc_cell_neg where failed_at > {cutoff} and cell in ({{marks}})",
+                                   [c for c in todo if c not in found]):
+                found[c] = (None, None)
+                self.stats["negative"] += 1
+            missing = []
+            with self.cx:
+                for c in [c for c in todo if c not in found]:
+                    near = self._nearest(*rep[c]) if self.rev_nearest_m > 0 else None
+                    if near is None:
+                        missing.append(c)
+                        continue
+                    # se guarda con las coordenadas del punto geocodificado de verdad: sin deriva
+                    plat, plon, res = near
+                    self.cx.execute("insert or replace into revgc_cell(cell,lat,lon,street,number) values(?,?,?,?,?)",
+                                    (c, plat, plon, *res))
+                    found[c] = res
+                    self.stats["nearest"] += 1
+            self.stats["hits"] += n_keys - len(missing)
+            self.stats["misses"] += len(missing)
+            fetched = self._fetch_all(self._reverse, [rep[c] for c in missing])
+            now = time.time()
+            with self.cx:
+                for c in missing:
+                    res = fetched[rep[c]]
+                    if res is _MISS:
+                        found[c] = (None, None)
+                    elif res is None:
+                        self.cx.execute("insert or replace into revgc_cell_neg(cell,failed_at) values(?,?)", (c, now))
+                        found[c] = (None, None)
+                    else:
+                        self.cx.execute("insert or replace into revgc_cell(cell,lat,lon,street,number) values(?,?,?,?,?)",
+                                        (c, *rep[c], *res))
+                        self.cx.execute("delete from revgc_cell_neg where cell=?", (c,))
+                        found[c] = res
+            for c in todo:
+                if not (c in missing and fetched[rep[c]] is _MISS):
+                    self._rev.put(c, found[c])
+        else:
+            self.stats["hits"] += n_keys
+        return {k: found[c] for k, c in cell_of.items()}
+
+    def reverse(self, lat: Optional[float], lon: Optional[float]) -> Street:
+        if lat is None or lon is None:
+            return None, None
+        return self.reverse_many([(lat, lon)]).get((float(lat), float(lon)), (None, None))
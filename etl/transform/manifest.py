@@ -0,0 +1,66 @@
+# etl/transform/manifest.py
+# Manifest del transform incremental: hash de contenido de cada fichero raw y las salidas
+# que produjo (clean JSON y parquet intermedio por fichero). Se guarda en data_curated/_manifest.json
+# con rutas relativas a ``root`` (el directorio etl/), para que sobreviva a mover el repo.
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Dict, Optional
+
+VERSION = 1
+
+
+def file_sha256(fp: Path, chunk: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(fp, "rb") as f:
+        while True:
+            b = f.read(chunk)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
+
+class Manifest:
+    def __init__(self, path: Path, root: Path, files: Optional[Dict[str, Dict]] = None):
+        self.path = Path(path)
+        self.root = Path(root)
+        self.files: Dict[str, Dict] = files or {}
+
+    @classmethod
+    def load(cls, path: Path, root: Path) -> "Manifest":
+        path = Path(path)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return cls(path, root)
+        if data.get("version") != VERSION:
+            return cls(path, root)
+        return cls(path, root, data.get("files") or {})
+
+    def key(self, fp: Path) -> str:
+        return Path(fp).relative_to(self.root).as_posix()
+
+    def resolve(self, rel: str) -> Path:
+        return self.root / rel
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps({"version": VERSION, "files": self.files}, ensure_ascii=False, indent=1, sort_keys=True),
+                       encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def is_fresh(self, key: str, sha: str) -> bool:
+        """True si el fichero no ha cambiado y sus salidas siguen existiendo."""
+        entry = self.files.get(key)
+        if not entry or entry.get("sha256") != sha:
+            return False
+        return all(self.resolve(p).exists() for p in entry.get("outputs", []))
+
+    def record(self, key: str, sha: str, source: str, dt: str, outputs: list) -> None:
+        self.files[key] = {"sha256": sha, "source": source, "dt": dt, "outputs": [self.key(p) for p in outputs]}
+
+    def forget(self, key: str) -> Optional[Dict]:
+        return self.files.pop(key, None)
@@ -0,0 +1,112 @@
+# etl/transform/metrics.py
+# Métricas de una ejecución del transform: tiempo por fuente y etapa (read, clean, geocode,
+# unify, write, union), contadores (filas, bytes, caché del geocoder) y, si se pide,
+# un volcado de cProfile por etapa. Cada tarea (fichero raw) mide en su proceso y devuelve un
+# snapshot que el proceso principal acumula; al final se escribe un informe JSON.
+import os
+import json
+import time
+import cProfile
+from pathlib import Path
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, Optional
+
+
+class RunMetrics:
+    def __init__(self, profile_dir: Optional[Path] = None):
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.sources: Dict[str, Dict[str, Dict]] = {}
+        self._profiles: Dict[tuple, cProfile.Profile] = {}
+
+    def _entry(self, source: str) -> Dict[str, Dict]:
+        return self.sources.setdefault(source, {"stages": {}, "counters": {}})
+
+    @contextmanager
+    def stage(self, source: str, name: str):
+        """Cronometra (y perfila, con ``profile_dir``) un bloque. Las etapas no se anidan:
+        cProfile sólo admite un perfilador activo."""
+        prof = None
+        if self.profile_dir is not None:
+            prof = self._profiles.setdefault((source, name), cProfile.Profile())
+            prof.enable()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            if prof is not None:
+                prof.disable()
+            st = self._entry(source)["stages"].setdefault(name, {"seconds": 0.0, "calls": 0})
+            st["seconds"] += elapsed
+            st["calls"] += 1
+
+    def timed(self, source: str, name: str, items: Iterable) -> Iterator:
+        """Itera ``items`` contando como etapa ``name`` sólo el tiempo de producir cada elemento."""
+        it = iter(items)
+        while True:
+            with self.stage(source, name):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, source: str, key: str, n: float = 1) -> None:
+        counters = self._entry(source)["counters"]
+        counters[key] = counters.get(key, 0) + n
+
+    def count_bytes(self, source: str, *paths: Path) -> None:
+        self.count(source, "bytes_written", sum(Path(p).stat().st_size for p in paths if p and Path(p).exists()))
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return json.loads(json.dumps(self.sources))
+
+    def merge(self, snapshot: Dict[str, Dict]) -> None:
+        for source, entry in snapshot.items():
+            mine = self._entry(source)
+            for name, st in entry.get("stages", {}).items():
+                cur = mine["stages"].setdefault(name, {"seconds": 0.0, "calls": 0})
+                cur["seconds"] += st["seconds"]
+                cur["calls"] += st["calls"]
+            for key, n in entry.get("counters", {}).items():
+                mine["counters"][key] = mine["counters"].get(key, 0) + n
+
+    def dump_profiles(self, tag: str = "") -> None:
+        if self.profile_dir is None:
+            return
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        suffix = f".{tag}" if tag else ""
+        for (source, name), prof in self._profiles.items():
+            prof.dump_stats(self.profile_dir / f"{source}.{name}{suffix}.prof")
+        self._profiles.clear()
+
+    def report(self, **extra) -> Dict:
+        sources = {}
+        for source, entry in sorted(self.sources.items()):
+            stages = {k: {"seconds": round(v["seconds"], 4), "calls": v["calls"]} for k, v in entry["stages"].items()}
+            sources[source] = {
+                "seconds": round(sum(v["seconds"] for v in entry["stages"].values()), 4),
+                "stages": stages,
+                "counters": dict(sorted(entry["counters"].items())),
+            }
+        return {**extra, "sources": sources}
+
+    def write(self, out_dir: Path, started: datetime, **extra) -> Path:
+        """``out_dir/transform_<inicio>.json`` (y ``transform_latest.json``, una copia)."""
+        finished = datetime.now(timezone.utc)
+        rep = self.report(
+            started_at_utc=started.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            finished_at_utc=finished.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            seconds=round((finished - started).total_seconds(), 3),
+            **extra,
+        )
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        text = json.dumps(rep, ensure_ascii=False, indent=2)
+        out_fp = out_dir / f"transform_{started.strftime('%Y%m%dT%H%M%SZ')}.json"
+        for fp in (out_fp, out_dir / "transform_latest.json"):
+            tmp = fp.with_suffix(".json.tmp")
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, fp)
+        return out_fp
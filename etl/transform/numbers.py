@@ -0,0 +1,61 @@
+# etl/transform/numbers.py
+# Números de portal como intervalos (desde, hasta, paridad) en vez de puntos sueltos.
+# El PDF de i-DE trae rangos como "1-2000" o "2-40 pares": se guardan como un único intervalo
+# desde el extract hasta la carga y sólo se expanden a portales si se pide (``expand``).
+# Sin dependencias: lo usan tanto el extract como el transform.
+import os
+import re
+from typing import List, Optional, Tuple
+
+PARITIES = ("todos", "par", "impar")
+# tope de portales al expandir un intervalo (el extract de antes no expandía rangos mayores)
+MAX_EXPAND = int(os.getenv("IDE_MAX_EXPAND", "2000"))
+
+_RANGE = re.compile(r"(?i)^(\d+)\s*-\s*(\d+)\s*\(?\s*(pares|impares|par|impar|p|i)?\s*\)?\.?$")
+_POINT = re.compile(r"^\s*(\d+)")
+_PARITY = {"p": "par", "par": "par", "pares": "par", "i": "impar", "impar": "impar", "impares": "impar"}
+
+Interval = Tuple[Optional[int], Optional[int], str]
+
+
+def parse_token(tok) -> Interval:
+    """(desde, hasta, paridad) de un número o rango; (None, None, "todos") si no es numérico
+    (p. ej. "s/n") o el rango está al revés."""
+    t = str(tok if tok is not None else "").strip()
+    m = _RANGE.match(t)
+    if m:
+        a, b = int(m.group(1)), int(m.group(2))
+        if a > b:
+            return None, None, "todos"
+        return a, b, _PARITY.get((m.group(3) or "").lower(), "todos")
+    m = _POINT.match(t)
+    if m:
+        n = int(m.group(1))
+        return n, n, "todos"
+    return None, None, "todos"
+
+
+def parse_numbers(blob: str) -> List[Tuple[str, Optional[int], Optional[int], str]]:
+    """Lista "1, 3-9, 2-40 pares" -> [(token, desde, hasta, paridad), ...] sin expandir."""
+    return [(t.replace(" ", ""), *parse_token(t)) for t in (t.strip() for t in blob.split(",")) if t]
+
+
+def is_range(desde: Optional[int], hasta: Optional[int]) -> bool:
+    return desde is not None and hasta is not None and desde != hasta
+
+
+def label(desde: int, hasta: int, paridad: str = "todos") -> str:
+    """Texto del intervalo para ``numero`` / ``street_number``: "1-2000", "2-40 pares"."""
+    base = f"{desde}-{hasta}"
+    return base if paridad == "todos" else f"{base} {'pares' if paridad == 'par' else 'impares'}"
+
+
+def expand(desde: Optional[int], hasta: Optional[int], paridad: str = "todos", limit: int = MAX_EXPAND) -> List[int]:
+    """Portales del intervalo; [] si no tiene límites o pasa de ``limit``."""
+    if desde is None or hasta is None or hasta < desde or hasta - desde > limit:
+        return []
+    if paridad == "todos":
+        return list(range(desde, hasta + 1))
+    first = desde if (desde % 2 == 0) == (paridad == "par") else desde + 1
+    return list(range(first, hasta + 1, 2))
+
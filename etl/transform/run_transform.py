@@ -1,23 +1,35 @@
 import os
 import re
-import json
-import time
-import sqlite3
 import unicodedata
-import requests
-import hashlib
+import shutil
 from pathlib import Path
 from datetime import datetime, timezone
-from zoneinfo import ZoneInfo
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import pandas as pd
+import pyarrow.parquet as pq
+
+from etl.transform.manifest import Manifest, file_sha256
+from etl.transform.geocoding import Geocoder
+from etl.transform.gazetteer import Gazetteer
+from etl.transform.metrics import RunMetrics
+from etl.transform import columns as cols
+from etl.transform import stream
+from etl.transform import schemas
+from etl.transform import union
+from etl.transform import selection
+from etl.transform.selection import DtRange
 
 BASE = Path(__file__).resolve().parents[1]
 RAW = BASE / "data_raw"
 CUR = BASE / "data_curated"
 CACHE = BASE / ".cache"
+REPORTS = Path(os.getenv("TRANSFORM_REPORT_DIR", str(BASE / "run_reports")))
+# callejero local de portales (ver README); GAZETTEER_PATH="" lo desactiva
+_GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", str(BASE / "ref" / "callejero.parquet"))
+GAZETTEER = Path(_GAZETTEER_PATH) if _GAZETTEER_PATH else None
 SOURCES = ["ide", "canal", "ayto", "gas"]
-TZ_MAD = ZoneInfo("Europe/Madrid")
+TS_COLUMNS = ["start_ts_utc", "end_ts_utc", "ingested_at_utc"]
 
 def _iter_json_files(source: str) -> List[Tuple[Path, str]]:
     out = []
@@ -34,61 +46,20 @@ def _iter_json_files(source: str) -> List[Tuple[Path, str]]:
             dt = dt_raw
         else:
             dt = datetime.now(timezone.utc).date().isoformat()
-        for fp in dt_dir.glob("*.json"):
+        # un .ndjson sustituye al .json del mismo nombre (p. ej. un día con ambos formatos)
+        nd = {fp.stem for fp in dt_dir.glob("*.ndjson")}
+        for fp in sorted(dt_dir.glob("*.json")) + sorted(dt_dir.glob("*.ndjson")):
+            if fp.suffix == ".json" and fp.stem in nd:
+                continue
             out.append((fp, dt))
     return out
 
-def _read_json(fp: Path) -> List[Dict]:
-    data = json.loads(fp.read_text(encoding="utf-8"))
-    if isinstance(data, list):
-        return data
-    if isinstance(data, dict):
-        for k in ("items","results","data","events","incidencias"):
-            v = data.get(k)
-            if isinstance(v, list):
-                return v
-        return [data]
-    return []
-
-def _write_clean_json(original_fp: Path, records: List[Dict]) -> Optional[Path]:
-    if not records:
-        return None
-    clean_dir = original_fp.parent / "clean"
-    clean_dir.mkdir(parents=True, exist_ok=True)
-    out_fp = clean_dir / f"{original_fp.stem}.clean.json"
-    out_fp.write_text(json.dumps(records, ensure_ascii=False, indent=2), encoding="utf-8")
-    return out_fp
+def _clean_json_path(original_fp: Path) -> Path:
+    return original_fp.parent / "clean" / f"{original_fp.stem}.clean.json"
 
 def _strip_accents(s: str) -> str:
     return unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode()
 
-def _is_madrid_strict(s: Optional[str]) -> bool:
-    if not s:
-        return False
-    t = _strip_accents(str(s)).lower().strip()
-    t = re.sub(r"\s+", " ", t)
-    return bool(re.fullmatch(r"madrid(?:\s*\(capital\))?", t))
-
-def _is_madrid_soft(s: Optional[str]) -> bool:
-    if not s:
-        return False
-    return "madrid" in str(s).casefold()
-
-def _in_bbox(lat: Optional[float], lon: Optional[float]) -> bool:
-    try:
-        if lat is None or lon is None:
-            return False
-        return 40.2 <= float(lat) <= 40.6 and -3.9 <= float(lon) <= -3.4
-    except:
-        return False
-
-def _gc_db():
-    CACHE.mkdir(parents=True, exist_ok=True)
-    cx = sqlite3.connect(CACHE / "geocode.sqlite")
-    cx.execute("create table if not exists gc(address text primary key, lat real, lon real)")
-    cx.commit()
-    return cx
-
 def _addr(street: Optional[str], number: Optional[str]) -> Optional[str]:
     s = (street or "").strip()
     n = (number or "").strip()
@@ -96,40 +67,30 @@ def _addr(street: Optional[str], number: Optional[str]) -> Optional[str]:
         return None
     return f"{n} {s}, Madrid, Spain".strip()
 
-def _geocode(street: Optional[str], number: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
-    address = _addr(street, number)
-    if not address:
-        return None, None
-    cx = _gc_db()
-    row = cx.execute("select lat,lon from gc where address=?", (address,)).fetchone()
-    if row:
-        return float(row[0]), float(row[1])
-    url = "https://nominatim.openstreetmap.org/search"
-    ua = os.getenv("GEOCODE_UA", "enterate-etl/1.0")
-    r = requests.get(url, params={"q": address, "format": "json", "limit": 1}, headers={"User-Agent": ua}, timeout=20)
-    if r.ok:
-        data = r.json()
-        if isinstance(data, list) and data:
-            lat = float(data[0]["lat"])
-            lon = float(data[0]["lon"])
-            cx.execute("insert or replace into gc(address,lat,lon) values(?,?,?)", (address, lat, lon))
-            cx.commit()
-            time.sleep(1.0)
-            return lat, lon
-    return None, None
-
-_VIA_TOKEN = r"(?:Cl|C/|Calle|Avda?|Av\.?|Paseo|Ps\.?|Plaza|Pl\.?|Ctra|Ronda|Camino|Cmno|Pza\.?)"
-
-def _clean_via(v: Optional[str]) -> Optional[str]:
-    if not v:
-        return None
-    s = str(v).strip()
-    s = re.sub(r"\s+", " ", s)
-    m = re.search(rf"({_VIA_TOKEN})\s+.+$", s, flags=re.IGNORECASE)
-    if m:
-        start = m.start(1)
-        return s[start:]
-    return s
+_GEOCODER: Optional[Geocoder] = None
+
+def _geocoder() -> Geocoder:
+    # uno por proceso (cada worker del pool abre el suyo sobre la misma caché WAL, que también
+    # reparte entre todos el límite de peticiones a Nominatim)
+    global _GEOCODER
+    db_path = CACHE / "geocode.sqlite"
+    if _GEOCODER is None or _GEOCODER.db_path != db_path:
+        _GEOCODER = Geocoder(db_path, normalize_street=_normalize_via_name, normalize_number=_clean_num)
+    return _GEOCODER
+
+_GAZETTEER: Dict[Optional[Path], Optional[Gazetteer]] = {}
+
+def _gazetteer() -> Optional[Gazetteer]:
+    # callejero local (CSV o Parquet); desactivado o sin fichero todo va a Nominatim
+    if GAZETTEER not in _GAZETTEER:
+        gz = None
+        if GAZETTEER is not None and GAZETTEER.exists():
+            gz = Gazetteer.load(GAZETTEER, normalize_street=_normalize_via_name, strip_accents=_strip_accents)
+        elif GAZETTEER is not None:
+            print(f"[transform][warn] no existe el callejero {GAZETTEER}: se geocodifica todo con Nominatim "
+                  f"(GAZETTEER_PATH=\"\" para desactivarlo)")
+        _GAZETTEER[GAZETTEER] = gz
+    return _GAZETTEER[GAZETTEER]
 
 def _clean_num(n: Optional[str]) -> Optional[str]:
     if not n:
@@ -137,308 +98,53 @@ def _clean_num(n: Optional[str]) -> Optional[str]:
     s = str(n).strip()
     s = s.replace(" ", "")
     s = s.replace("º", "").replace("ª", "")
-    s = re.sub(r"(?i)madrid.*$", "", s)
-    s = re.sub(r"\d{1,2}/\d{1,2}/\d{2,4}.*$", "", s)
-    s = re.sub(r"\d{2}:\d{2}.*$", "", s)
-    s = re.sub(r"(?i)cl[A-Za-zÁÉÍÓÚÜÑ]+:?\d+[A-Za-z]?$", "", s)
-    s = re.sub(r"[^0-9A-Za-z]", "", s)
-    m = re.match(r"^(\d+[A-Za-z]{0,2})", s)
+    for pat in cols.RE_NUM_DROP:
+        s = pat.sub("", s)
+    m = cols.RE_NUM_HEAD.match(s)
     return m.group(1) if m else None
 
-def _to_float(x):
-    try:
-        return float(x)
-    except:
-        return None
-
-def _now_utc_iso():
-    return datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00","Z")
-
-def _ts_from_date_time(date_str: Optional[str], time_str: Optional[str]) -> Optional[str]:
-    if not date_str:
-        return None
-    t = time_str or "00:00"
-    try:
-        d = datetime.strptime(f"{date_str} {t}", "%d/%m/%Y %H:%M")
-    except:
-        return None
-    dt = d.replace(tzinfo=TZ_MAD).astimezone(timezone.utc)
-    return dt.replace(microsecond=0).isoformat().replace("+00:00","Z")
-
-def _to_utc_iso(ts_like: Optional[str]) -> Optional[str]:
-    if not ts_like:
-        return None
-    try:
-        dt = datetime.fromisoformat(ts_like.replace("Z","+00:00"))
-    except:
-        return None
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=TZ_MAD)
-    dt = dt.astimezone(timezone.utc)
-    return dt.replace(microsecond=0).isoformat().replace("+00:00","Z")
-
-def _fp(city, street, number, category, source, start_iso) -> str:
-    base = "|".join([
-        (city or "").lower(),
-        (street or "").lower(),
-        (number or "").lower(),
-        (category or "").lower(),
-        (source or "").lower(),
-        (start_iso or "")
-    ])
-    return hashlib.sha1(base.encode("utf-8")).hexdigest()
-
-def _clean_ide_record(rec: Dict) -> Optional[Dict]:
-    m = str(rec.get("municipio") or "").strip()
-    if not _is_madrid_strict(m):
-        return None
-    out = dict(rec)
-    out.pop("fuente", None)
-    out.pop("source", None)
-    via_raw = out.get("via")
-    num_raw = out.get("numero")
-    via = _clean_via(via_raw)
-    num = _clean_num(num_raw)
-    out["via"] = via
-    out["numero"] = num
-    lat = _to_float(out.get("lat"))
-    lon = _to_float(out.get("lon"))
-    if lat is None or lon is None:
-        lat_g, lon_g = _geocode(via, num)
-        if lat_g is not None and lon_g is not None:
-            out["lat"] = lat_g
-            out["lon"] = lon_g
-    return out
-
-def _ayto_extract_from_desc(desc: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
-    if not desc:
-        return None, None
-    t = desc.strip()
-    mnum = re.search(r"(?i)\b(nº|n°|num\.?|numero)\s*[:\-]?\s*(\d+[A-Za-z]?)", t)
-    number = mnum.group(2) if mnum else None
-    street = None
-    if mnum:
-        head = t[:mnum.start()].strip(" .,:;")
-        head = re.sub(r"\s+", " ", head)
-        street = head if head else None
-    return (street or None), (number or None)
-
-def _ayto_enrich_with_desc(records: List[Dict]) -> List[Dict]:
-    out = []
-    for r in records:
-        rec = dict(r)
-        if (not rec.get("via")) or (not rec.get("numero")):
-            street, num = _ayto_extract_from_desc(rec.get("descripcion") or rec.get("mensaje"))
-            if (not rec.get("via")) and street:
-                rec["via"] = street
-            if (not rec.get("numero")) and num:
-                rec["numero"] = num
-        out.append(rec)
-    return out
-
-def _clean_generic_madrid(rec: Dict, city_keys: List[str], addr_keys: List[str], lat_key: str = "lat", lon_key: str = "lon") -> Optional[Dict]:
-    out = dict(rec)
-    out.pop("fuente", None)
-    out.pop("source", None)
-    city = None
-    for ck in city_keys:
-        if ck in rec and rec[ck] is not None:
-            city = str(rec[ck]).strip()
-            break
-    if _is_madrid_strict(city) or _is_madrid_soft(city):
-        return out
-    lat = rec.get(lat_key)
-    lon = rec.get(lon_key)
-    if _in_bbox(lat, lon):
-        return out
-    addr_text = " ".join(str(rec.get(k) or "") for k in addr_keys)
-    if _is_madrid_soft(addr_text):
-        return out
-    return None
-
-def _df_ide(rows: List[Dict]) -> pd.DataFrame:
-    df = pd.DataFrame(rows)
-    need = ["municipio","fecha","hora_inicio","hora_fin","via","numero","lat","lon"]
-    for c in need:
-        if c not in df.columns:
-            df[c] = None
-    df = df[df["municipio"].apply(_is_madrid_strict)]
-    return df.reset_index(drop=True)
-
-def _df_passthrough(rows: List[Dict], required: List[str] | None = None) -> pd.DataFrame:
-    df = pd.DataFrame(rows)
-    if required:
-        for c in required:
-            if c not in df.columns:
-                df[c] = None
-    return df.reset_index(drop=True)
-
-def _write_daily(df: pd.DataFrame, source: str, dt: str) -> Path:
-    out_dir = CUR / source / f"dt={dt}"
-    out_dir.mkdir(parents=True, exist_ok=True)
-    out_fp = out_dir / "part-000.parquet"
-    df.to_parquet(out_fp, index=False)
-    return out_fp
-
-def _build_history(source: str) -> Path:
-    parts = []
-    src_dir = CUR / source
-    for p in sorted(src_dir.glob("dt=*/part-*.parquet")):
-        parts.append(pd.read_parquet(p))
-    if not parts:
-        return src_dir / "history.parquet"
-    hist = pd.concat(parts, ignore_index=True)
-    out_fp = src_dir / "history.parquet"
-    hist.to_parquet(out_fp, index=False)
-    return out_fp
-
-def _union_for_date(dt: str) -> Path:
-    parts = []
-    for source in SOURCES:
-        p = CUR / source / f"dt={dt}" / "part-000.parquet"
-        if p.exists():
-            df = pd.read_parquet(p)
-            df["source"] = source
-            parts.append(df)
-    out_dir = CUR / "union" / f"dt={dt}"
-    out_dir.mkdir(parents=True, exist_ok=True)
-    out_fp = out_dir / "part-000.parquet"
-    if parts:
-        pd.concat(parts, ignore_index=True).to_parquet(out_fp, index=False)
-    else:
-        pd.DataFrame().to_parquet(out_fp, index=False)
-    return out_fp
-
-def _build_union_history() -> Path:
-    parts = []
-    uni_dir = CUR / "union"
-    for p in sorted(uni_dir.glob("dt=*/part-*.parquet")):
-        parts.append(pd.read_parquet(p))
-    if not parts:
-        return uni_dir / "history.parquet"
-    hist = pd.concat(parts, ignore_index=True)
-    out_fp = uni_dir / "history.parquet"
-    hist.to_parquet(out_fp, index=False)
-    return out_fp
-
-def _unify_ide(rec: Dict) -> Dict:
-    street = rec.get("via")
-    number = rec.get("numero")
-    lat = _to_float(rec.get("lat"))
-    lon = _to_float(rec.get("lon"))
-    start_iso = _ts_from_date_time(rec.get("fecha"), rec.get("hora_inicio"))
-    end_iso = _ts_from_date_time(rec.get("fecha"), rec.get("hora_fin"))
-    out = {
-        "source": "ide",
-        "category": "electricity",
-        "status": "planned",
-        "city": "Madrid",
-        "street": street,
-        "street_number": number,
-        "lat": lat,
-        "lon": lon,
-        "start_ts_utc": start_iso,
-        "end_ts_utc": end_iso,
-        "description": None,
-        "event_id": None,
-        "ingested_at_utc": _now_utc_iso()
-    }
-    out["fingerprint"] = _fp(out["city"], out["street"], out["street_number"], out["category"], out["source"], out["start_ts_utc"])
+_GAZETTEER_HITS = 0
+
+def _resolve_addresses(pairs: List[Tuple[Optional[str], Optional[str]]]) -> List[Tuple[Optional[float], Optional[float]]]:
+    # primero el callejero local; lo que quede, una sola pasada al geocoder
+    global _GAZETTEER_HITS
+    out: List[Tuple[Optional[float], Optional[float]]] = [(None, None)] * len(pairs)
+    gz = _gazetteer()
+    rest = []
+    for i, (via, num) in enumerate(pairs):
+        hit = gz.lookup(via, num) if gz is not None else (None, None)
+        if hit[0] is None:
+            rest.append(i)
+        else:
+            out[i] = hit
+            _GAZETTEER_HITS += 1
+    if rest:
+        found = _geocoder().geocode_many(_addr(*pairs[i]) for i in rest)
+        for i in rest:
+            out[i] = found.get(_addr(*pairs[i]), (None, None))
     return out
 
-def _unify_canal(rec: Dict) -> Dict:
-    street = rec.get("via") or rec.get("street") or rec.get("direccion")
-    number = rec.get("numero") or rec.get("street_number")
-    lat = _to_float(rec.get("lat") or rec.get("latitude"))
-    lon = _to_float(rec.get("lon") or rec.get("longitude"))
-    start_iso = _to_utc_iso(rec.get("start_ts_utc") or rec.get("start_ts") or rec.get("start") or rec.get("inicio"))
-    end_iso = _to_utc_iso(rec.get("end_ts_utc") or rec.get("end_ts") or rec.get("end") or rec.get("fin"))
-    status = str(rec.get("status") or rec.get("estado") or "active")
-    out = {
-        "source": "canal",
-        "category": "water",
-        "status": status,
-        "city": "Madrid",
-        "street": street,
-        "street_number": number,
-        "lat": lat,
-        "lon": lon,
-        "start_ts_utc": start_iso,
-        "end_ts_utc": end_iso,
-        "description": rec.get("mensaje"),
-        "event_id": rec.get("event_id"),
-        "ingested_at_utc": _now_utc_iso()
-    }
-    out["fingerprint"] = _fp(out["city"], out["street"], out["street_number"], out["category"], out["source"], out["start_ts_utc"])
-    return out
+def _ide_fill_coords_df(df: pd.DataFrame) -> pd.DataFrame:
+    lat, lon = cols.to_float(cols.column(df, "lat")), cols.to_float(cols.column(df, "lon"))
+    miss = df.index[lat.isna() | lon.isna()]
+    if not len(miss):
+        return df
+    found = _resolve_addresses(list(zip(cols.column(df, "via")[miss], cols.geocode_number(df)[miss])))
+    la = pd.Series([f[0] for f in found], index=miss, dtype=object).reindex(df.index)
+    lo = pd.Series([f[1] for f in found], index=miss, dtype=object).reindex(df.index)
+    hit = la.notna() & lo.notna()
+    if hit.any():
+        df["lat"] = cols.fill(cols.column(df, "lat"), hit, la)
+        df["lon"] = cols.fill(cols.column(df, "lon"), hit, lo)
+    return df
 
-def _unify_ayto(rec: Dict) -> Dict:
-    street = rec.get("via") or rec.get("street") or rec.get("calle") or rec.get("direccion")
-    number = rec.get("numero") or rec.get("street_number")
-    lat = _to_float(rec.get("lat") or rec.get("latitude"))
-    lon = _to_float(rec.get("lon") or rec.get("longitude"))
-    start_iso = _to_utc_iso(rec.get("start_ts") or rec.get("start_ts_utc") or rec.get("inicio"))
-    end_iso = _to_utc_iso(rec.get("end_ts") or rec.get("end_ts_utc") or rec.get("fin"))
-    status = str(rec.get("status") or rec.get("estado") or "active")
-    event_id = rec.get("event_id") or rec.get("id_incidencia") or rec.get("codigo")
-    out = {
-        "source": "ayto",
-        "category": "road",
-        "status": status,
-        "city": "Madrid",
-        "street": street,
-        "street_number": number,
-        "lat": lat,
-        "lon": lon,
-        "start_ts_utc": start_iso,
-        "end_ts_utc": end_iso,
-        "description": rec.get("descripcion"),
-        "event_id": event_id,
-        "ingested_at_utc": _now_utc_iso()
-    }
-    out["fingerprint"] = _fp(out["city"], out["street"], out["street_number"], out["category"], out["source"], out["start_ts_utc"])
-    return out
+IDE_COLUMNS = ["municipio","fecha","hora_inicio","hora_fin","via","numero","numero_desde","numero_hasta","paridad","lat","lon"]
 
-def _unify_gas(rec: Dict) -> Dict:
-    street = rec.get("via") or rec.get("street") or rec.get("direccion")
-    number = rec.get("numero") or rec.get("street_number")
-    lat = _to_float(rec.get("lat"))
-    lon = _to_float(rec.get("lon"))
-    start_iso = _to_utc_iso(rec.get("start_ts_utc") or rec.get("start_ts") or rec.get("start"))
-    end_iso   = _to_utc_iso(rec.get("end_ts_utc")   or rec.get("end_ts")   or rec.get("end"))
-    status = str(rec.get("status") or ("planned" if rec.get("programado") else "unplanned"))
-    out = {
-        "source": "gas",
-        "category": "gas",
-        "status": status,
-        "city": "Madrid",
-        "street": street,
-        "street_number": number,
-        "lat": lat,
-        "lon": lon,
-        "start_ts_utc": start_iso,
-        "end_ts_utc": end_iso,
-        "description": rec.get("descripcion") or rec.get("mensaje"),
-        "event_id": rec.get("event_id"),
-        "ingested_at_utc": _now_utc_iso()
-    }
-    out["fingerprint"] = _fp(out["city"], out["street"], out["street_number"], out["category"], out["source"], out["start_ts_utc"])
-    return out
+def _daily_path(source: str, dt: str) -> Path:
+    return CUR / source / f"dt={dt}" / "part-000.parquet"
 
-def _rev_gc_db():
-    CACHE.mkdir(parents=True, exist_ok=True)
-    cx = sqlite3.connect(CACHE / "geocode.sqlite")
-    cx.execute("""
-    create table if not exists revgc(
-        lat real,
-        lon real,
-        street text,
-        number text,
-        primary key(lat,lon)
-    )
-    """)
-    cx.commit()
-    return cx
+def _build_union(dts: List[str]) -> List[Path]:
+    return union.build_union(CUR, SOURCES, dts)
 
 def _normalize_via_name(v: Optional[str]) -> Optional[str]:
     if not v:
@@ -459,123 +165,292 @@ def _normalize_via_name(v: Optional[str]) -> Optional[str]:
     out = re.sub(r"^Avda\.?\s*", "Avenida ", out)
     return out
 
-def _rev_geocode(lat: Optional[float], lon: Optional[float]) -> Tuple[Optional[str], Optional[str]]:
-    try:
-        if lat is None or lon is None:
-            return None, None
-        cx = _rev_gc_db()
-        row = cx.execute(
-            "select street, number from revgc where lat=? and lon=?",
-            (float(lat), float(lon))
-        ).fetchone()
-        if row:
-            return (row[0] or None), (row[1] or None)
-
-        url = "https://nominatim.openstreetmap.org/reverse"
-        ua = os.getenv("GEOCODE_UA", "enterate-etl/1.0")
-        r = requests.get(
-            url,
-            params={
-                "lat": f"{float(lat):.7f}",
-                "lon": f"{float(lon):.7f}",
-                "format": "json",
-                "zoom": 18,
-                "addressdetails": 1
-            },
-            headers={"User-Agent": ua},
-            timeout=20
-        )
-        if not r.ok:
-            return None, None
-        data = r.json()
-        addr = data.get("address", {}) if isinstance(data, dict) else {}
-        via = addr.get("road") or addr.get("pedestrian") or addr.get("footway") or addr.get("path") or addr.get("residential") or addr.get("cycleway")
-        num = addr.get("house_number")
-        via_norm = _normalize_via_name(via)
-        num_norm = _clean_num(num)
-        cx.execute(
-            "insert or replace into revgc(lat,lon,street,number) values(?,?,?,?)",
-            (float(lat), float(lon), via_norm, num_norm)
-        )
-        cx.commit()
-        time.sleep(1.0)
-        return via_norm, num_norm
-    except:
-        return None, None
-
-def _ayto_fill_from_coords(records: List[Dict]) -> List[Dict]:
-    out = []
-    for r in records:
-        rec = dict(r)
-        st = rec.get("via") or rec.get("street")
-        num = rec.get("numero") or rec.get("street_number")
-        if not st or not num:
-            lat = _to_float(rec.get("lat") or rec.get("latitude"))
-            lon = _to_float(rec.get("lon") or rec.get("longitude"))
-            if lat is not None and lon is not None:
-                via_rc, num_rc = _rev_geocode(lat, lon)
-                if not st and via_rc:
-                    rec["via"] = via_rc
-                    rec["street"] = via_rc
-                if not num and num_rc:
-                    rec["numero"] = num_rc
-                    rec["street_number"] = num_rc
-        out.append(rec)
-    return out
+def _ayto_fill_from_coords_df(df: pd.DataFrame) -> pd.DataFrame:
+    st = cols.coalesce(df, ["via", "street"])
+    num = cols.coalesce(df, ["numero", "street_number"])
+    lat = cols.to_float(cols.coalesce(df, ["lat", "latitude"]))
+    lon = cols.to_float(cols.coalesce(df, ["lon", "longitude"]))
+    need = (~cols.truthy(st) | ~cols.truthy(num)) & lat.notna() & lon.notna()
+    if not need.any():
+        return df
+    coords = list(zip(lat[need], lon[need]))
+    found = _geocoder().reverse_many(coords)
+    res = [found.get(c, (None, None)) for c in coords]
+    via_rc = pd.Series([r[0] for r in res], index=df.index[need], dtype=object).reindex(df.index)
+    num_rc = pd.Series([r[1] for r in res], index=df.index[need], dtype=object).reindex(df.index)
+    for names, cur, new in ((("via", "street"), st, via_rc), (("numero", "street_number"), num, num_rc)):
+        mask = need & ~cols.truthy(cur) & cols.truthy(new)
+        if mask.any():
+            for name in names:
+                df[name] = cols.fill(cols.column(df, name), mask, new)
+    return df
+
+def _clean_frame(source: str, df: pd.DataFrame) -> Optional[pd.DataFrame]:
+    if source == "ide":
+        df = cols.drop_meta(df[cols.is_madrid_strict(cols.column(df, "municipio"))]).reset_index(drop=True)
+        if df.empty:
+            return None
+        df["via"] = cols.clean_via(cols.column(df, "via"))
+        cols.ide_numbers(df)
+    elif source == "canal":
+        df = cols.drop_meta(df[cols.madrid_mask(df, ["municipio","city"], ["via","street","direccion"])])
+    elif source == "ayto":
+        df = cols.drop_meta(df[cols.madrid_mask(df, ["municipio","city"], ["via","street","calle","direccion","descripcion"])])
+        if not df.empty:
+            df = cols.ayto_enrich_with_desc(df.reset_index(drop=True))
+    elif source == "gas":
+        df = cols.drop_meta(df[cols.madrid_mask(df, ["city"], ["street","direccion"])])
+    else:
+        return None
+    return None if df.empty else df.reset_index(drop=True)
 
-def _process_source(source: str) -> List[str]:
-    written_dt = set()
-    for fp, dt in _iter_json_files(source):
-        raw_rows = _read_json(fp)
-        if not raw_rows:
-            continue
+def _geocode_stats() -> Dict[str, int]:
+    stats = {f"geocode_{k}": v for k, v in (_GEOCODER.stats if _GEOCODER is not None else {}).items()}
+    stats["gazetteer_hits"] = _GAZETTEER_HITS
+    return stats
+
+def _geocode_frame(source: str, df: pd.DataFrame) -> pd.DataFrame:
+    m = _metrics()
+    before = _geocode_stats()
+    with m.stage(source, "geocode"):
         if source == "ide":
-            cleaned = [c for r in raw_rows if (c := _clean_ide_record(r)) is not None]
-            if not cleaned:
-                continue
-            unified = [_unify_ide(c) for c in cleaned]
-            _write_clean_json(fp, unified)
-            df = _df_ide(cleaned)
-        elif source == "canal":
-            cleaned = [c for r in raw_rows if (c := _clean_generic_madrid(r, ["municipio","city"], ["via","street","direccion"])) is not None]
-            if not cleaned:
-                continue
-            unified = [_unify_canal(c) for c in cleaned]
-            _write_clean_json(fp, unified)
-            df = _df_passthrough(cleaned)
+            df = _ide_fill_coords_df(df)
         elif source == "ayto":
-            if "events" not in fp.stem.lower():
-                continue
-            base_clean = [c for r in raw_rows if (c := _clean_generic_madrid(r, ["municipio","city"], ["via","street","calle","direccion","descripcion"])) is not None]
-            if not base_clean:
-                continue
-            cleaned = _ayto_fill_from_coords(_ayto_enrich_with_desc(base_clean))
-            unified = [_unify_ayto(c) for c in cleaned]
-            _write_clean_json(fp, unified)
-            df = _df_passthrough(cleaned)
-        elif source == "gas":
-            cleaned = [c for r in raw_rows if (c := _clean_generic_madrid(r, ["city"], ["street","direccion"])) is not None]
-            if not cleaned:
-                continue
-            unified = [_unify_gas(c) for c in cleaned]
-            _write_clean_json(fp, unified)
-            df = _df_passthrough(cleaned)
-        else:
+            df = _ayto_fill_from_coords_df(df)
+    for k, v in _geocode_stats().items():
+        m.count(source, k, v - before.get(k, 0))
+    return df
+
+def _transform_rows(source: str, rows: List[Dict], ingested: pd.Timestamp) -> Optional[Tuple[pd.DataFrame, pd.DataFrame]]:
+    """Limpia un lote de registros raw: (DataFrame curado, DataFrame unificado) o None."""
+    if not rows:
+        return None
+    m = _metrics()
+    m.count(source, "rows_in", len(rows))
+    with m.stage(source, "clean"):
+        df = _clean_frame(source, pd.DataFrame(rows))
+    if df is None:
+        return None
+    df = _geocode_frame(source, df)
+    with m.stage(source, "unify"):
+        unified = cols.unify(df, source, ingested)
+        if source == "ide":
+            for c in IDE_COLUMNS:
+                if c not in df.columns:
+                    df[c] = None
+        # mismos dtypes que un DataFrame construido desde los registros
+        df = cols.infer(df)
+        # timestamps ya normalizados a UTC: dbt no tiene que volver a parsear texto en hora de Madrid
+        for c in TS_COLUMNS:
+            df[c] = unified[c].to_numpy()
+    m.count(source, "rows_out", len(df))
+    return (df, unified)
+
+def _transform_chunks(source: str, fp: Path) -> Iterator[Tuple[pd.DataFrame, pd.DataFrame]]:
+    """Recorre el raw en lotes de CHUNK_ROWS registros sin cargarlo entero."""
+    if source == "ayto" and "events" not in fp.stem.lower():
+        return
+    # una marca de ingesta por fichero (la comparten todos sus lotes)
+    ingested = pd.Timestamp.now(tz="UTC").floor("s")
+    batches = stream.batched(stream.iter_records(fp), stream.CHUNK_ROWS)
+    for rows in _metrics().timed(source, "read", batches):
+        res = _transform_rows(source, rows, ingested)
+        if res is not None:
+            yield res
+
+def _part_path(source: str, dt: str, fp: Path) -> Path:
+    # parquet intermedio por fichero raw; el diario es la mezcla de los de su dt
+    return CUR / "_parts" / source / f"dt={dt}" / f"{fp.stem}.parquet"
+
+def _transform_task(source: str, fp: Path, dt: str) -> List[Path]:
+    """Transforma un fichero raw y devuelve las salidas que ha escrito (para el manifest).
+
+    Cada lote se escribe como un parquet suelto y al final se concatenan con el esquema
+    unificado (un lote puede traer columnas o tipos que otro no tiene).
+    """
+    part = _part_path(source, dt, fp)
+    part.unlink(missing_ok=True)
+    pieces_dir = part.with_suffix(".chunks")
+    shutil.rmtree(pieces_dir, ignore_errors=True)
+    pieces = []
+    m = _metrics()
+    try:
+        with stream.JsonArrayWriter(_clean_json_path(fp)) as clean:
+            for df, unified in _transform_chunks(source, fp):
+                with m.stage(source, "write"):
+                    clean.write_columns(*cols.json_columns(unified))
+                    piece = pieces_dir / f"{len(pieces):05d}.parquet"
+                    piece.parent.mkdir(parents=True, exist_ok=True)
+                    pq.write_table(schemas.table(df, source), piece, row_group_size=stream.ROW_GROUP_ROWS, **schemas.WRITE_OPTS)
+                    pieces.append(piece)
+        if not pieces:
+            return []
+        with m.stage(source, "write"):
+            if len(pieces) == 1:
+                os.replace(pieces[0], part)
+            else:
+                stream.concat_parquet(pieces, part, schema=schemas.SCHEMAS.get(source), **schemas.WRITE_OPTS)
+    finally:
+        shutil.rmtree(pieces_dir, ignore_errors=True)
+    outputs = [part, _clean_json_path(fp)]
+    m.count_bytes(source, *outputs)
+    return outputs
+
+_TASK_METRICS: Optional[RunMetrics] = None
+
+def _metrics() -> RunMetrics:
+    # métricas de la tarea en curso en este proceso (fuera de una tarea, unas desechables)
+    global _TASK_METRICS
+    if _TASK_METRICS is None:
+        _TASK_METRICS = RunMetrics()
+    return _TASK_METRICS
+
+def _measured_task(source: str, fp: Path, dt: str, profile_dir: Optional[Path] = None) -> Tuple[List[Path], Dict]:
+    """``_transform_task`` con sus métricas: (salidas, snapshot para RunMetrics.merge)."""
+    global _TASK_METRICS
+    _TASK_METRICS = RunMetrics(profile_dir)
+    try:
+        outputs = _transform_task(source, fp, dt)
+        _TASK_METRICS.count(source, "files")
+        _TASK_METRICS.dump_profiles(fp.stem)
+        return outputs, _TASK_METRICS.snapshot()
+    finally:
+        _TASK_METRICS = None
+
+def _tasks(sources: List[str], dts: DtRange = (None, None)) -> List[Tuple[str, Path, str]]:
+    return [(source, fp, dt) for source in sources for fp, dt in _iter_json_files(source)
+            if selection.in_range(dt, dts)]
+
+def _load_manifest() -> Manifest:
+    return Manifest.load(CUR / "_manifest.json", root=CUR.parent)
+
+def _plan(tasks: List[Tuple[str, Path, str]], sources: List[str], manifest: Manifest, full: bool,
+          dts: DtRange = (None, None)):
+    """Decide qué ficheros hay que transformar y qué particiones (source, dt) reconstruir.
+    Con ``full`` se reprocesa todo lo seleccionado; fuera de ``dts`` no se toca nada."""
+    todo, affected, present = [], set(), set()
+    for source, fp, dt in tasks:
+        key = manifest.key(fp)
+        present.add(key)
+        sha = file_sha256(fp)
+        prev = manifest.files.get(key)
+        if full or not manifest.is_fresh(key, sha) or prev.get("dt") != dt:
+            todo.append((source, fp, dt, sha))
+            affected.add((source, dt))
+            if prev:
+                affected.add((prev["source"], prev["dt"]))
+    # ficheros raw que ya no existen: su partición pierde filas
+    for key, entry in list(manifest.files.items()):
+        if key not in present and entry.get("source") in sources and selection.in_range(entry["dt"], dts):
+            affected.add((entry["source"], entry["dt"]))
+            for out in entry.get("outputs", []):
+                if out.endswith(".parquet"):
+                    manifest.resolve(out).unlink(missing_ok=True)
+            manifest.forget(key)
+    return todo, affected
+
+def _rebuild_partition(source: str, dt: str, manifest: Manifest) -> bool:
+    # Varios ficheros raw del mismo dt: concat en orden de nombre de fichero (no de
+    # finalización) y sin filas repetidas (la marca de ingesta no cuenta), para que serie y
+    # paralelo den el mismo parquet
+    parts = []
+    for key, entry in manifest.files.items():
+        if entry.get("source") != source or entry.get("dt") != dt:
             continue
-        if not df.empty:
-            _write_daily(df, source, dt)
-            written_dt.add(dt)
-    _build_history(source)
-    return sorted(written_dt)
-
-def run() -> None:
-    all_dt = set()
-    for source in SOURCES:
-        for dt in _process_source(source):
-            all_dt.add(dt)
-    for dt in sorted(all_dt):
-        _union_for_date(dt)
-    _build_union_history()
+        for out in entry.get("outputs", []):
+            if out.endswith(".parquet"):
+                parts.append((Path(key).name, manifest.resolve(out)))
+    if not parts:
+        shutil.rmtree(CUR / source / f"dt={dt}", ignore_errors=True)
+        return False
+    stream.concat_parquet([p for _, p in sorted(parts, key=lambda x: x[0])], _daily_path(source, dt), dedupe=True,
+                          dedupe_ignore=["ingested_at_utc"], schema=schemas.SCHEMAS.get(source), **schemas.WRITE_OPTS)
+    return True
+
+def _run_tasks(tasks: List[Tuple[str, Path, str]], workers: int = 1, sources: Optional[List[str]] = None,
+               full: bool = False, metrics: Optional[RunMetrics] = None,
+               dts: DtRange = (None, None)) -> Dict[str, List[str]]:
+    """Transforma (en serie o en un pool de procesos) sólo los ficheros nuevos o cambiados
+    según el manifest, y reconstruye únicamente las particiones afectadas.
+
+    Cada fuente reescribe sus parquets diarios (en paralelo por dt con ``workers`` > 1) en
+    cuanto terminan todos sus ficheros; devuelve {source: [dt reconstruidos]}. Las métricas de cada tarea se acumulan
+    en ``metrics``.
+    """
+    sources = sources or sorted({t[0] for t in tasks})
+    metrics = metrics if metrics is not None else RunMetrics()
+    manifest = _load_manifest()
+    todo, affected = _plan(tasks, sources, manifest, full, dts)
+    pending = {s: 0 for s in {a[0] for a in affected}}
+    for source, _, _, _ in todo:
+        pending[source] += 1
+    written: Dict[str, List[str]] = {}
+
+    def _source_done(source: str) -> None:
+        days = sorted(dt for s, dt in affected if s == source)
+        with metrics.stage(source, "write"):
+            if workers <= 1 or len(days) <= 1:
+                for dt in days:
+                    _rebuild_partition(source, dt, manifest)
+            else:
+                # pyarrow suelta el GIL al leer/escribir parquet: basta con hilos
+                with ThreadPoolExecutor(max_workers=workers) as ex:
+                    list(ex.map(lambda dt: _rebuild_partition(source, dt, manifest), days))
+        metrics.count_bytes(source, *(_daily_path(source, dt) for dt in days))
+        written[source] = days
+
+    def _done(source: str, fp: Path, dt: str, sha: str, result: Tuple[List[Path], Dict]) -> None:
+        outputs, snapshot = result
+        metrics.merge(snapshot)
+        manifest.record(manifest.key(fp), sha, source, dt, outputs)
+        pending[source] -= 1
+        if pending[source] == 0:
+            _source_done(source)
+
+    for source in [s for s, n in pending.items() if n == 0]:
+        _source_done(source)
+    try:
+        if workers <= 1:
+            for source, fp, dt, sha in todo:
+                _done(source, fp, dt, sha, _measured_task(source, fp, dt, metrics.profile_dir))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                futs = {ex.submit(_measured_task, source, fp, dt, metrics.profile_dir): (source, fp, dt, sha)
+                        for source, fp, dt, sha in todo}
+                for fut in as_completed(futs):
+                    _done(*futs[fut], fut.result())
+    finally:
+        manifest.save()
+    return written
+
+def run(workers: int = 1, full: bool = False, profile: bool = False,
+        sources: Optional[List[str]] = None, dts: DtRange = (None, None)) -> Path:
+    """Ejecuta el transform (todas las fuentes y dt, o sólo la selección ``sources`` × ``dts``)
+    y devuelve la ruta del informe de métricas."""
+    started = datetime.now(timezone.utc)
+    profile_dir = REPORTS / f"profile_{started.strftime('%Y%m%dT%H%M%SZ')}" if profile else None
+    metrics = RunMetrics(profile_dir)
+    sources = sources or SOURCES
+    written = _run_tasks(_tasks(sources, dts), workers, sources=sources, full=full, metrics=metrics, dts=dts)
+    all_dt = {dt for s, dts in written.items() for dt in dts}
+    # union (sólo de los dt afectados) cuando han terminado todas las fuentes
+    with metrics.stage("union", "union"):
+        metrics.count_bytes("union", *_build_union(sorted(all_dt)))
+    metrics.dump_profiles()
+    return metrics.write(REPORTS, started, workers=workers, full=full,
+                         selection=selection.describe(sources, dts),
+                         partitions={s: dts for s, dts in sorted(written.items())})
 
 if __name__ == "__main__":
-    run()
+    import argparse
+    p = argparse.ArgumentParser()
+    p.add_argument("--workers", type=int, default=int(os.getenv("TRANSFORM_WORKERS", "1")),
+                   help="procesos para transformar source×fichero en paralelo")
+    p.add_argument("--full", action="store_true", help="ignora el manifest y reprocesa todo lo seleccionado")
+    p.add_argument("--profile", action="store_true", default=os.getenv("TRANSFORM_PROFILE") == "1",
+                   help="vuelca un cProfile por fuente y etapa junto al informe de la ejecución")
+    selection.add_arguments(p, SOURCES)
+    args = p.parse_args()
+    sources, dts = selection.from_args(p, args)
+    report = run(workers=args.workers, full=args.full, profile=args.profile, sources=sources, dts=dts)
+    print(f"[transform] informe: {report}")
@@ -0,0 +1,79 @@
+# etl/transform/schemas.py
+# Esquemas Arrow explícitos de data_curated (por fuente y para union) y opciones de escritura.
+# - los tipos ya no dependen de lo que infiera pandas en cada lote: una columna que en un
+#   fichero viene toda a null sigue siendo string, y todas las particiones comparten esquema
+# - municipio / tipo (categoría) / estado / source van como diccionario: pocas claves, se
+#   guardan una vez por column chunk
+# - zstd + estadísticas por row group, para que DuckDB pueda descartar row groups en los filtros
+# Las columnas que no estén en el esquema se conservan al final con el tipo observado.
+import os
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from etl.transform.stream import conform, unify_schemas
+
+ZSTD_LEVEL = int(os.getenv("PARQUET_ZSTD_LEVEL", "6"))
+
+DICT = pa.dictionary(pa.int32(), pa.string())
+STR = pa.string()
+F64 = pa.float64()
+BOOL = pa.bool_()
+I64 = pa.int64()
+TS = pa.timestamp("us", tz="UTC")
+
+_EVENT = [("event_id", STR), ("tipo", DICT), ("programado", BOOL)]
+_TS = [("start_ts", STR), ("end_ts", STR)]
+_COORDS = [("lat", F64), ("lon", F64)]
+# normalizados en el transform (columns.to_utc / ts_from_date_time)
+_UTC = [("start_ts_utc", TS), ("end_ts_utc", TS), ("ingested_at_utc", TS)]
+
+SCHEMAS = {
+    "ide": pa.schema([
+        ("municipio", DICT), ("fecha", STR), ("hora_inicio", STR), ("hora_fin", STR),
+        ("via", STR), ("numero", STR), ("numero_desde", I64), ("numero_hasta", I64), ("paridad", DICT),
+        *_COORDS, *_UTC,
+    ]),
+    "canal": pa.schema([*_EVENT, ("direccion", STR), *_COORDS, *_TS, ("mensaje", STR), *_UTC]),
+    "ayto": pa.schema([
+        *_EVENT, ("descripcion", STR), *_TS, ("municipio", DICT), *_COORDS, ("estado", DICT),
+        ("es_obras", BOOL), ("es_accidente", BOOL), ("es_contaminacion", BOOL), ("codigo", STR),
+        ("id_incidencia", STR), ("via", STR), ("street", STR), ("numero", STR), ("street_number", STR), *_UTC,
+    ]),
+    "gas": pa.schema([
+        *_EVENT, ("direccion", STR), ("via", STR), ("numero", STR), *_COORDS, *_TS, ("mensaje", STR), *_UTC,
+    ]),
+}
+UNION = unify_schemas([pa.schema([("source", DICT)]), *SCHEMAS.values()])
+
+WRITE_OPTS = dict(compression="zstd", compression_level=ZSTD_LEVEL, write_statistics=True)
+
+
+def resolve(base: Optional[pa.Schema], observed: Iterable[pa.Schema]) -> pa.Schema:
+    """Esquema final: el de ``base`` y, detrás, las columnas observadas que no estén en él."""
+    return unify_schemas(list(observed), base=base)
+
+
+def _cast(col: pa.ChunkedArray, typ: pa.DataType) -> pa.ChunkedArray:
+    try:
+        return col.cast(typ)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        pass
+    # valores sueltos que no encajan (p. ej. "40,41" en una columna double): null, como to_numeric
+    s = col.to_pandas()
+    if pa.types.is_floating(typ) or pa.types.is_integer(typ):
+        s = pd.to_numeric(s.astype(str).str.replace(",", ".", regex=False).where(s.notna()), errors="coerce")
+    elif pa.types.is_boolean(typ):
+        s = s.map(lambda v: None if v is None or v != v else str(v).strip().lower() in ("1", "true", "t", "si", "sí", "s", "y", "yes"))
+    else:
+        s = s.astype(object).where(s.notna(), None).map(lambda v: v if v is None else str(v))
+    return pa.chunked_array([pa.array(np.asarray(s, dtype=object), from_pandas=True)]).cast(typ)
+
+
+def table(df: pd.DataFrame, source: str) -> pa.Table:
+    """DataFrame curado de ``source`` -> tabla Arrow con el esquema de la fuente."""
+    t = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+    schema = resolve(SCHEMAS.get(source), [t.schema])
+    return conform(t, schema, cast=_cast)
@@ -0,0 +1,42 @@
+# etl/transform/selection.py
+# Selección de particiones para reprocesar / recargar: --source, --dt y --from-dt/--to-dt,
+# compartida por run_transform y run_load.
+import argparse
+from datetime import date
+from typing import Iterable, List, Optional, Tuple
+
+DtRange = Tuple[Optional[str], Optional[str]]
+
+
+def _iso_date(s: str) -> str:
+    try:
+        return date.fromisoformat(s).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha no válida (se espera AAAA-MM-DD): {s!r}")
+
+
+def add_arguments(p: argparse.ArgumentParser, sources: Iterable[str]) -> None:
+    p.add_argument("--source", action="append", choices=list(sources), dest="sources",
+                   help="sólo esta fuente (se puede repetir)")
+    p.add_argument("--dt", type=_iso_date, help="sólo esta partición dt (AAAA-MM-DD)")
+    p.add_argument("--from-dt", type=_iso_date, help="primera partición dt incluida")
+    p.add_argument("--to-dt", type=_iso_date, help="última partición dt incluida")
+
+
+def from_args(p: argparse.ArgumentParser, args: argparse.Namespace) -> Tuple[Optional[List[str]], DtRange]:
+    """(fuentes o None = todas, (desde, hasta)); ``--dt`` equivale a desde = hasta."""
+    if args.dt and (args.from_dt or args.to_dt):
+        p.error("--dt no se combina con --from-dt/--to-dt")
+    lo, hi = (args.dt, args.dt) if args.dt else (args.from_dt, args.to_dt)
+    if lo and hi and lo > hi:
+        p.error(f"--from-dt {lo} es posterior a --to-dt {hi}")
+    return args.sources, (lo, hi)
+
+
+def in_range(dt: str, dts: DtRange) -> bool:
+    lo, hi = dts
+    return (lo is None or dt >= lo) and (hi is None or dt <= hi)
+
+
+def describe(sources: Optional[List[str]], dts: DtRange) -> dict:
+    return {"sources": sources, "from_dt": dts[0], "to_dt": dts[1]}
@@ -0,0 +1,317 @@
+# etl/transform/stream.py
+# E/S en streaming del transform, para que la memoria no dependa del tamaño de los ficheros:
+# - lectura de los raw JSON con ijson (los arrays items/events/... nunca se materializan enteros)
+#   y de los NDJSON línea a línea
+# - escritura de parquet con ParquetWriter en row groups de tamaño fijo
+# - concatenación de parquets (con esquema unificado y dedupe opcional) row group a row group
+# - clean JSON escrito por trozos con el mismo formato que json.dumps(indent=2)
+import os
+import json
+import textwrap
+from pathlib import Path
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import ijson
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ROW_GROUP_ROWS = int(os.getenv("TRANSFORM_ROW_GROUP_ROWS", str(128 * 1024)))
+CHUNK_ROWS = int(os.getenv("TRANSFORM_CHUNK_ROWS", "50000"))
+LIST_KEYS = ("items", "results", "data", "events", "incidencias")
+
+
+# ---------------- lectura ----------------
+def _first_byte(fp: Path) -> bytes:
+    with open(fp, "rb") as f:
+        while True:
+            b = f.read(1)
+            if not b or not b.isspace():
+                return b
+
+
+def _list_key(fp: Path) -> Optional[str]:
+    # claves de primer nivel cuyo valor es un array; se recorre el fichero sin construir nada
+    found = set()
+    pending = None
+    with open(fp, "rb") as f:
+        for prefix, event, value in ijson.parse(f):
+            if pending is not None:
+                if event == "start_array":
+                    found.add(pending)
+                    if pending == LIST_KEYS[0]:
+                        break
+                pending = None
+            if prefix == "" and event == "map_key" and value in LIST_KEYS:
+                pending = value
+    return next((k for k in LIST_KEYS if k in found), None)
+
+
+def iter_records(fp: Path) -> Iterator:
+    """Registros de un raw JSON: el array de primer nivel, o el de la primera clave de
+    ``LIST_KEYS`` que sea un array, o el propio objeto. En un ``.ndjson``, un registro por línea."""
+    if fp.suffix == ".ndjson":
+        with open(fp, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    first = _first_byte(fp)
+    if first == b"[":
+        prefix = "item"
+    elif first == b"{":
+        key = _list_key(fp)
+        if key is None:
+            with open(fp, "rb") as f:
+                yield json.load(f)
+            return
+        prefix = f"{key}.item"
+    else:
+        return
+    with open(fp, "rb") as f:
+        yield from ijson.items(f, prefix, use_float=True)
+
+
+def batched(items: Iterable, n: int) -> Iterator[List]:
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, n))
+        if not chunk:
+            return
+        yield chunk
+
+
+# ---------------- esquemas ----------------
+def unify_schemas(schemas: Iterable[pa.Schema], base: Optional[pa.Schema] = None) -> pa.Schema:
+    # tipos por columna en orden de aparición; null cede ante cualquier tipo, int+float -> float,
+    # y cualquier otro conflicto acaba en string. Las columnas de ``base`` van primero y con su tipo
+    order: List[str] = list(base.names) if base is not None else []
+    types: Dict[str, pa.DataType] = {f.name: f.type for f in base} if base is not None else {}
+    fixed = set(order)
+    for schema in schemas:
+        for f in schema:
+            if f.name in fixed:
+                continue
+            if f.name not in types:
+                order.append(f.name)
+                types[f.name] = f.type
+                continue
+            cur = types[f.name]
+            if cur == f.type or pa.types.is_null(f.type):
+                continue
+            if pa.types.is_null(cur):
+                types[f.name] = f.type
+            elif (pa.types.is_integer(cur) or pa.types.is_floating(cur)) and \
+                    (pa.types.is_integer(f.type) or pa.types.is_floating(f.type)):
+                types[f.name] = pa.float64()
+            elif pa.types.is_dictionary(cur) and pa.types.is_dictionary(f.type) and cur.value_type == f.type.value_type:
+                continue
+            else:
+                types[f.name] = pa.string()
+    return pa.schema([pa.field(n, types[n]) for n in order])
+
+
+def conform(table: pa.Table, schema: pa.Schema,
+            cast: Optional[Callable[[pa.ChunkedArray, pa.DataType], pa.ChunkedArray]] = None) -> pa.Table:
+    cols = []
+    for f in schema:
+        if f.name in table.column_names:
+            col = table.column(f.name)
+            cols.append(col if col.type == f.type else (cast or _cast)(col, f.type))
+        else:
+            cols.append(pa.nulls(table.num_rows, f.type))
+    return pa.Table.from_arrays(cols, schema=schema)
+
+
+def _cast(col: pa.ChunkedArray, typ: pa.DataType) -> pa.ChunkedArray:
+    return col.cast(typ)
+
+
+# ---------------- escritura ----------------
+class RowGroupWriter:
+    """ParquetWriter que emite row groups de exactamente ``rows`` filas (salvo el último).
+    Escribe en ``<path>.tmp`` y lo mueve a ``path`` al cerrar sin error."""
+
+    def __init__(self, path: Path, schema: pa.Schema, rows: int = ROW_GROUP_ROWS, **write_opts):
+        self.path = Path(path)
+        self.schema = schema
+        self.rows = rows
+        self.num_rows = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        self._writer = pq.ParquetWriter(self._tmp, schema, **write_opts)
+        self._buf: List[pa.Table] = []
+        self._buffered = 0
+
+    def write(self, table: pa.Table) -> None:
+        if table.num_rows == 0:
+            return
+        self._buf.append(table)
+        self._buffered += table.num_rows
+        while self._buffered >= self.rows:
+            self._flush(self.rows)
+
+    def _flush(self, n: int) -> None:
+        t = pa.concat_tables(self._buf)
+        self._writer.write_table(t.slice(0, n), row_group_size=n)
+        rest = t.slice(n)
+        self._buf = [rest] if rest.num_rows else []
+        self._buffered = rest.num_rows
+        self.num_rows += n
+
+    def close(self) -> Path:
+        if self._buffered:
+            self._flush(self._buffered)
+        self._writer.close()
+        os.replace(self._tmp, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        self._writer.close()
+        self._tmp.unlink(missing_ok=True)
+
+    def __enter__(self) -> "RowGroupWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _row_hashes(table: pa.Table, ignore: Sequence[str] = ()) -> np.ndarray:
+    table = table.drop_columns([c for c in ignore if c in table.column_names])
+    return pd.util.hash_pandas_object(table.to_pandas(), index=False).to_numpy()
+
+
+def concat_parquet(inputs: Sequence[Path], out_fp: Path, dedupe: bool = False,
+                   constants: Optional[Sequence[Dict[str, object]]] = None,
+                   schema: Optional[pa.Schema] = None, dedupe_ignore: Sequence[str] = (), **write_opts) -> int:
+    """Concatena ``inputs`` (en ese orden) en ``out_fp`` con el esquema unificado (``schema``
+    primero, si se da), leyendo un row group cada vez. ``constants[i]`` = columnas fijas que se
+    añaden a las filas de ``inputs[i]``. Con ``dedupe`` descarta las filas repetidas (se queda
+    la primera), como ``drop_duplicates``: en memoria sólo queda un hash de 64 bits por fila.
+    ``dedupe_ignore`` = columnas que no cuentan para decidir si dos filas son iguales.
+    Devuelve las filas escritas."""
+    inputs = [Path(p) for p in inputs]
+    constants = list(constants) if constants is not None else [{} for _ in inputs]
+    files = [pq.ParquetFile(p) for p in inputs]
+    try:
+        schemas = []
+        for pf, const in zip(files, constants):
+            s = pf.schema_arrow.remove_metadata()
+            for name, value in const.items():
+                if name in s.names:
+                    s = s.remove(s.get_field_index(name))
+                s = s.append(pa.field(name, pa.scalar(value).type))
+            schemas.append(s)
+        schema = unify_schemas(schemas, base=schema)
+        seen = set()
+        writer = RowGroupWriter(out_fp, schema, **write_opts)
+        with writer:
+            for pf, const in zip(files, constants):
+                for i in range(pf.num_row_groups):
+                    t = pf.read_row_group(i)
+                    for name, value in const.items():
+                        if name in t.column_names:
+                            t = t.drop_columns([name])
+                        t = t.append_column(name, pa.array([value] * t.num_rows))
+                    t = conform(t, schema)
+                    if dedupe and t.num_rows:
+                        keep = [j for j, h in enumerate(_row_hashes(t, dedupe_ignore)) if not (h in seen or seen.add(h))]
+                        if len(keep) < t.num_rows:
+                            t = t.take(pa.array(keep, type=pa.int64()))
+                    writer.write(t)
+        return writer.num_rows
+    finally:
+        for pf in files:
+            pf.close()
+
+
+def write_empty(out_fp: Path, schema: Optional[pa.Schema] = None, **write_opts) -> Path:
+    out_fp = Path(out_fp)
+    out_fp.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(schema.empty_table() if schema is not None else pa.table({}), out_fp, **write_opts)
+    return out_fp
+
+
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _encode_column(values: Sequence) -> List[str]:
+    # cada valor como lo deja json.dumps(indent=2) dentro de un objeto de nivel 1; los
+    # escalares repetidos (vía, fecha, source...) se codifican una vez
+    cache: Dict[tuple, str] = {}
+    out = []
+    for v in values:
+        if isinstance(v, _SCALARS):
+            key = (type(v), v)
+            enc = cache.get(key)
+            if enc is None:
+                enc = cache[key] = json.dumps(v, ensure_ascii=False)
+        else:
+            enc = json.dumps(v, ensure_ascii=False, indent=2).replace("\n", "\n    ")
+        out.append(enc)
+    return out
+
+
+class JsonArrayWriter:
+    """Escribe una lista JSON por trozos; el resultado es idéntico a
+    ``json.dumps(records, ensure_ascii=False, indent=2)``. Sin registros, no deja fichero."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.count = 0
+        self._f = None
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+
+    def _item(self, text: str) -> None:
+        if self._f is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._f = open(self._tmp, "w", encoding="utf-8")
+            self._f.write("[\n")
+        elif self.count:
+            self._f.write(",\n")
+        self._f.write(text)
+        self.count += 1
+
+    def write(self, records: Iterable[Dict]) -> None:
+        for rec in records:
+            self._item(textwrap.indent(json.dumps(rec, ensure_ascii=False, indent=2), "  "))
+
+    def write_columns(self, names: Sequence[str], columns: Sequence[Sequence]) -> None:
+        """Como ``write`` con los registros ``dict(zip(names, fila))``, pero sin construirlos:
+        se codifica columna a columna y cada fila se escribe ya como texto."""
+        if not names:
+            self.write({} for _ in range(len(columns[0]) if columns else 0))
+            return
+        keys = [f"    {json.dumps(str(n), ensure_ascii=False)}: " for n in names]
+        encoded = [_encode_column(c) for c in columns]
+        for row in zip(*encoded):
+            self._item("  {\n" + ",\n".join(k + v for k, v in zip(keys, row)) + "\n  }")
+
+    def close(self) -> Optional[Path]:
+        if self._f is None:
+            self.path.unlink(missing_ok=True)
+            return None
+        self._f.write("\n]")
+        self._f.close()
+        os.replace(self._tmp, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._tmp.unlink(missing_ok=True)
+
+    def __enter__(self) -> "JsonArrayWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
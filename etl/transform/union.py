@@ -0,0 +1,113 @@
+# etl/transform/union.py
+# union de las fuentes con DuckDB, sin pasar por pandas:
+# - una sola consulta sobre data_curated/<source>/dt=*/part-*.parquet (union_by_name) que
+#   escribe todas las particiones afectadas con COPY ... PARTITION_BY (dt)
+# DuckDB paraleliza la lectura/escritura y, si no cabe en memoria, desborda a disco
+# (DUCKDB_MEMORY_LIMIT / DUCKDB_TEMP_DIR).
+import os
+import shutil
+from pathlib import Path
+from typing import Iterable, List, Sequence
+
+import duckdb
+import pyarrow as pa
+
+from etl.transform import schemas
+from etl.transform.stream import ROW_GROUP_ROWS, write_empty
+
+MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT", "")
+TEMP_DIR = os.getenv("DUCKDB_TEMP_DIR", "")
+THREADS = int(os.getenv("DUCKDB_THREADS", "0"))
+
+PART_NAME = "part-000.parquet"
+_COPY_OPTS = f"FORMAT PARQUET, COMPRESSION zstd, ROW_GROUP_SIZE {ROW_GROUP_ROWS}"
+
+
+def _connect() -> duckdb.DuckDBPyConnection:
+    con = duckdb.connect()
+    for name, value in (("memory_limit", MEMORY_LIMIT), ("temp_directory", TEMP_DIR)):
+        if value:
+            con.execute(f"SET {name} = {_lit(value)}")
+    if THREADS > 0:
+        con.execute(f"SET threads = {THREADS}")
+    return con
+
+
+def _lit(s: str) -> str:
+    return "'" + str(s).replace("'", "''") + "'"
+
+
+def _ident(s: str) -> str:
+    return '"' + s.replace('"', '""') + '"'
+
+
+def _sql_type(t: pa.DataType) -> str:
+    if pa.types.is_dictionary(t):
+        t = t.value_type
+    if pa.types.is_boolean(t):
+        return "BOOLEAN"
+    if pa.types.is_floating(t):
+        return "DOUBLE"
+    if pa.types.is_integer(t):
+        return "BIGINT"
+    if pa.types.is_timestamp(t):
+        return "TIMESTAMPTZ" if t.tz else "TIMESTAMP"
+    return "VARCHAR"
+
+
+def _read(globs: Sequence[str]) -> str:
+    files = "[" + ", ".join(_lit(g) for g in globs) + "]"
+    return (f"read_parquet({files}, union_by_name=true, hive_partitioning=true, "
+            f"hive_types_autocast=false, filename=true, file_row_number=true)")
+
+
+def _columns(con: duckdb.DuckDBPyConnection, rel: str) -> List[str]:
+    return [r[0] for r in con.execute(f"DESCRIBE SELECT * FROM {rel}").fetchall()]
+
+
+def build_union(cur: Path, sources: Sequence[str], dts: Iterable[str]) -> List[Path]:
+    """Reescribe ``cur/union/dt=<dt>/part-000.parquet`` para cada ``dt`` con las filas de todas
+    las fuentes (columna ``source``), en el orden de ``sources`` y, dentro, el de cada parquet.
+    Un dt sin datos queda como parquet vacío con el esquema de union."""
+    cur, dts = Path(cur), sorted(set(dts))
+    out_dir = cur / "union"
+    outputs = [out_dir / f"dt={dt}" / PART_NAME for dt in dts]
+    if not dts:
+        return outputs
+    for fp in outputs:
+        shutil.rmtree(fp.parent, ignore_errors=True)
+    present = [s for s in sources if any((cur / s).glob("dt=*/part-*.parquet"))]
+    if present:
+        con = _connect()
+        try:
+            rel = _read([(cur / s / "dt=*" / "part-*.parquet").as_posix() for s in present])
+            have = set(_columns(con, rel))
+            source_expr = "regexp_extract(filename, '([^/\\\\]+)[/\\\\]dt=[^/\\\\]+[/\\\\][^/\\\\]+$', 1)"
+            cols = []
+            for f in schemas.UNION:
+                if f.name == "source":
+                    expr = source_expr
+                elif f.name in have:
+                    expr = f"CAST({_ident(f.name)} AS {_sql_type(f.type)})"
+                else:
+                    expr = f"CAST(NULL AS {_sql_type(f.type)})"
+                cols.append(f"{expr} AS {_ident(f.name)}")
+            extra = sorted(have - set(schemas.UNION.names) - {"dt", "filename", "file_row_number"})
+            cols += [_ident(c) for c in extra]
+            order = "CASE " + " ".join(f"WHEN {source_expr} = {_lit(s)} THEN {i}" for i, s in enumerate(present)) + " END"
+            con.execute(f"""
+                COPY (
+                    SELECT {", ".join(cols)}, dt
+                    FROM {rel}
+                    WHERE dt IN ({", ".join(_lit(dt) for dt in dts)})
+                    ORDER BY dt, {order}, filename, file_row_number
+                ) TO {_lit(out_dir.as_posix())}
+                ({_COPY_OPTS}, PARTITION_BY (dt), OVERWRITE_OR_IGNORE true, FILENAME_PATTERN 'part-00{{i}}')
+            """)
+        finally:
+            con.close()
+    for fp in outputs:
+        if not fp.exists():
+            write_empty(fp, schemas.UNION, **schemas.WRITE_OPTS)
+    return outputs
+
@@ -1,4 +1,4 @@
-{{ config(materialized='incremental', unique_key='fingerprint') }}
+{{ config(materialized='incremental', unique_key='fingerprint', on_schema_change='append_new_columns') }}
 
 with unioned as (
   select * from {{ ref('stg_electricity') }}
@@ -11,11 +11,19 @@ select
   municipio                                    as city,
   via                                          as street,
   nullif(numero,'')                            as street_number,
+  -- intervalo de portales (un portal suelto: desde = hasta); la búsqueda por número va contra él
+  numero_desde::bigint                         as street_number_from,
+  numero_hasta::bigint                         as street_number_to,
+  paridad::text                                as street_number_parity,
   lat::double precision                        as lat,
   lon::double precision                        as lon,
-  (to_timestamp(fecha||' '||hora_inicio,'DD/MM/YYYY HH24:MI') at time zone 'Europe/Madrid') as start_ts_utc,
-  (to_timestamp(fecha||' '||hora_fin   ,'DD/MM/YYYY HH24:MI') at time zone 'Europe/Madrid') as end_ts_utc,
+  -- ya en UTC desde el transform (hora de Madrid con cambio de hora resuelto); sin él, la hora
+  -- local del PDF se lee como timestamp sin zona y se sitúa en Madrid (timestamptz explícito)
+  coalesce(start_ts_utc::timestamptz,
+           (to_timestamp(fecha||' '||hora_inicio,'DD/MM/YYYY HH24:MI')::timestamp at time zone 'Europe/Madrid')::timestamptz) as start_ts_utc,
+  coalesce(end_ts_utc::timestamptz,
+           (to_timestamp(fecha||' '||hora_fin   ,'DD/MM/YYYY HH24:MI')::timestamp at time zone 'Europe/Madrid')::timestamptz) as end_ts_utc,
   null::text                                   as description,
   null::text                                   as event_id,
-  now() at time zone 'utc'                     as ingested_at_utc
+  coalesce(ingested_at_utc, now()) at time zone 'utc' as ingested_at_utc
 from {{ source('staging','electricity') }}
@@ -16,11 +16,14 @@ select
   'Madrid'                                       as city,
   direccion                                      as street,
   null::text                                     as street_number,
+  null::bigint                                   as street_number_from,
+  null::bigint                                   as street_number_to,
+  null::text                                     as street_number_parity,
   lat::double precision                          as lat,
   lon::double precision                          as lon,
-  nullif(start_ts,'')::timestamptz               as start_ts_utc,
-  nullif(end_ts,'')::timestamptz                 as end_ts_utc,
+  coalesce(start_ts_utc, nullif(start_ts,'')::timestamptz) as start_ts_utc,
+  coalesce(end_ts_utc, nullif(end_ts,'')::timestamptz)     as end_ts_utc,
   mensaje                                        as description,
   event_id::text                                 as event_id,
-  now() at time zone 'utc'                       as ingested_at_utc
+  coalesce(ingested_at_utc, now()) at time zone 'utc' as ingested_at_utc
 from {{ source('staging','water') }}
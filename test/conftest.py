@@ -0,0 +1,99 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# La API usa imports de nivel superior (se ejecuta con /app como cwd en Docker)
+APP_DIR = Path(__file__).resolve().parents[1] / "app"
+sys.path.insert(0, str(APP_DIR))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+
+@pytest.fixture
+def ads_db():
+    """SQLite en memoria con el schema "public" adjunto y get_db redirigido a él."""
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from database import Base, get_db
+    from main import app
+    import models.models_ads  # noqa: F401  (registra las tablas de anuncios)
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    @event.listens_for(engine, "connect")
+    def _attach_public(dbapi_conn, _):
+        dbapi_conn.execute("ATTACH DATABASE ':memory:' AS public")
+
+    tables = [t for t in Base.metadata.sorted_tables if t.schema == "public"]
+    Base.metadata.create_all(bind=engine, tables=tables)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def _get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = _get_db
+    yield Session
+    app.dependency_overrides.pop(get_db, None)
+    engine.dispose()
+
+
+@pytest.fixture
+def seed_ad(ads_db):
+    """Crea un anunciante y un anuncio (activo por defecto) y devuelve su id."""
+    from models.models_ads import Advertiser, Ad, AdStatusEnum
+
+    def _seed(status="active", n=1):
+        with ads_db() as db:
+            adv = Advertiser(name="ACME", email=f"acme{n}@example.com")
+            db.add(adv)
+            db.flush()
+            ad = Ad(user_id=adv.id, title="Promo", media_url="https://x.test/a.png",
+                    target_url="https://x.test", status=AdStatusEnum(status))
+            db.add(ad)
+            db.commit()
+            return ad.id
+
+    return _seed
+
+
+@pytest.fixture
+def transform_env(tmp_path, monkeypatch):
+    """Copia los raw del repo a un directorio temporal y apunta run_transform a él, sin red."""
+    import shutil
+    from etl.transform import run_transform as rt
+
+    raw = tmp_path / "data_raw"
+    src = Path(rt.__file__).resolve().parents[1] / "data_raw"
+    for fp in src.glob("*/*/*.json"):
+        dst = raw / fp.relative_to(src)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(fp, dst)
+    monkeypatch.setattr(rt, "RAW", raw)
+    monkeypatch.setattr(rt, "CUR", tmp_path / "data_curated")
+    monkeypatch.setattr(rt, "CACHE", tmp_path / ".cache")
+    monkeypatch.setattr(rt, "REPORTS", tmp_path / "run_reports")
+    monkeypatch.setattr(rt, "GAZETTEER", tmp_path / "callejero.parquet")
+    monkeypatch.setattr(rt, "_geocoder", lambda: _NoGeocoder())
+    return rt
+
+
+class _NoGeocoder:
+    """Geocoder sin red ni caché: todo queda sin resolver."""
+
+    def geocode_many(self, addresses):
+        return {}
+
+    def reverse_many(self, coords):
+        return {}
+
+    def geocode(self, address):
+        return None, None
+
+    def reverse(self, lat, lon):
+        return None, None
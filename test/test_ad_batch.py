@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+
+def test_batch_applies_valid_events_in_one_go(ads_db, seed_ad, monkeypatch):
+    from main import app
+    from routers import routes_ads
+    from services.ad_cache import AdIdCache
+
+    monkeypatch.setattr(routes_ads, "METRICS_SINK", "db")
+    monkeypatch.setattr(routes_ads, "ad_ids", AdIdCache(ttl=3600, min_refresh=3600))
+    ad_id = seed_ad()
+    client = TestClient(app)
+    ts = datetime.now(timezone.utc).isoformat()
+
+    batch = [{"ad_id": ad_id, "type": "impression", "ts": ts}] * 5
+    batch += [{"ad_id": ad_id, "type": "click", "ts": ts}, {"ad_id": 999, "type": "click", "ts": ts}]
+    r = client.post("/ads/events/batch", json=batch)
+    assert r.status_code == 200
+    assert r.json() == {"accepted": 6, "rejected": 1, "duplicates": 0}
+
+    out = client.get(f"/ads/{ad_id}").json()
+    assert (out["total_impressions"], out["total_clicks"]) == (5, 1)
+
+    # un anuncio creado después se valida gracias a create_ad -> invalidate()
+    new = client.post("/ads", json={"user_id": 1, "title": "B", "media_url": "https://x.test/b.png",
+                                    "target_url": "https://x.test/b"}).json()
+    r = client.post("/ads/events/batch", json=[{"ad_id": new["id"], "type": "impression", "ts": ts}])
+    assert r.json() == {"accepted": 1, "rejected": 0, "duplicates": 0}
+
+
+def test_batch_size_is_capped(ads_db):
+    from main import app
+    from routers import routes_ads
+
+    ts = datetime.now(timezone.utc).isoformat()
+    batch = [{"ad_id": 1, "type": "impression", "ts": ts}] * (routes_ads.BATCH_MAX_EVENTS + 1)
+    assert TestClient(app).post("/ads/events/batch", json=batch).status_code == 422
+
+
+def test_batch_rejects_timestamps_outside_window(ads_db, seed_ad, monkeypatch):
+    from main import app
+    from routers import routes_ads
+
+    monkeypatch.setattr(routes_ads, "METRICS_SINK", "db")
+    ad_id = seed_ad()
+    client = TestClient(app)
+    now = datetime.now(timezone.utc)
+    for ts in (now - timedelta(days=30), now + timedelta(hours=2), datetime(2020, 1, 1)):
+        r = client.post("/ads/events/batch", json=[{"ad_id": ad_id, "type": "click", "ts": ts.isoformat()}])
+        assert r.status_code == 422
+    ok = [{"ad_id": ad_id, "type": "click", "ts": (now - timedelta(hours=1)).isoformat()}]
+    assert client.post("/ads/events/batch", json=ok).json()["accepted"] == 1
+    assert client.get(f"/reports/ads/{ad_id}/daily").json()[0]["clicks"] == 1
@@ -0,0 +1,36 @@
+from fastapi.testclient import TestClient
+
+
+def test_sharded_increments_are_summed_and_folded(ads_db, seed_ad, monkeypatch):
+    from main import app
+    from routers import routes_ads
+    from services import ad_counters
+    from models.models_ads import Ad, AdCounterShard
+
+    monkeypatch.setattr(routes_ads, "METRICS_SINK", "db")
+    monkeypatch.setattr(ad_counters, "SHARD_STRATEGY", "random")
+    ad_id = seed_ad()
+    client = TestClient(app)
+
+    for _ in range(20):
+        client.post(f"/ads/{ad_id}/impression")
+    client.post(f"/ads/{ad_id}/click")
+
+    with ads_db() as db:
+        assert db.query(AdCounterShard).count() > 1
+        assert db.get(Ad, ad_id).total_impressions == 0
+
+    out = client.get(f"/ads/{ad_id}").json()
+    assert (out["total_impressions"], out["total_clicks"]) == (20, 1)
+    daily = client.get(f"/reports/ads/{ad_id}/daily").json()
+    assert [(d["impressions"], d["clicks"]) for d in daily] == [(20, 1)]
+
+    with ads_db() as db:
+        ad_counters.fold(db)
+        assert db.get(Ad, ad_id).total_impressions == 20
+        assert sum(s.impressions for s in db.query(AdCounterShard)) == 0
+
+    # tras el plegado la API devuelve lo mismo
+    assert client.get("/ads").json()[0]["total_impressions"] == 20
+    daily = client.get(f"/reports/ads/{ad_id}/daily").json()
+    assert [(d["impressions"], d["clicks"]) for d in daily] == [(20, 1)]
@@ -0,0 +1,52 @@
+from fastapi.testclient import TestClient
+
+
+def test_events_go_to_log_and_compact_into_totals(ads_db, seed_ad, tmp_path, monkeypatch):
+    from main import app
+    from routers import routes_ads
+    from services import ad_events
+    from models.models_ads import Ad, AdStatsDaily
+
+    log = ad_events.AdEventLog(tmp_path, fsync_every=2)
+    monkeypatch.setattr(routes_ads, "METRICS_SINK", "log")
+    monkeypatch.setattr(routes_ads, "event_log", log)
+    ad_id = seed_ad()
+    client = TestClient(app)
+
+    for _ in range(3):
+        assert client.post(f"/ads/{ad_id}/impression").status_code == 200
+    assert client.post(f"/ads/{ad_id}/click").status_code == 200
+    assert client.get("/ads/serve-ad").json()["ad_id"] == ad_id
+
+    # nada llega a la BD hasta compactar
+    assert client.get(f"/ads/{ad_id}").json()["total_impressions"] == 0
+
+    log.close()
+    with ads_db() as db:
+        res = ad_events.compact(db, tmp_path)
+        assert res == {"segments": 1, "events": 5, "skipped": 0}
+        # re-ejecutar no vuelve a contar
+        assert ad_events.compact(db, tmp_path)["events"] == 0
+        ad = db.get(Ad, ad_id)
+        assert (ad.total_impressions, ad.total_clicks) == (4, 1)
+        assert db.query(AdStatsDaily).one().impressions == 4
+
+    assert len(list((tmp_path / "archive").glob("*.ndjson"))) == 1
+
+    with ads_db() as db:
+        ad_events.replay(db, directory=tmp_path)
+        ad = db.get(Ad, ad_id)
+        assert (ad.total_impressions, ad.total_clicks) == (4, 1)
+
+
+def test_truncated_tail_is_ignored(tmp_path):
+    from services import ad_events
+
+    log = ad_events.AdEventLog(tmp_path)
+    log.append(1, "impressions")
+    log.close()
+    seg = next(tmp_path.glob("*.ndjson"))
+    with open(seg, "a", encoding="utf-8") as f:
+        f.write('{"ad_id": 1, "ty')
+    totals, daily, n = ad_events._read_segment(seg)
+    assert n == 1 and totals[1] == [1, 0]
@@ -0,0 +1,97 @@
+import math
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+
+def test_bloom_false_positive_rate_within_documented_bound():
+    from services.click_dedup import BloomFilter
+
+    bf = BloomFilter(size_bytes=16 * 1024, capacity=10_000)
+    for i in range(10_000):
+        bf.add(f"in-{i}".encode())
+    fp = sum(f"out-{i}".encode() in bf for i in range(20_000)) / 20_000
+    # p ≈ (1 - e^(-k·n/m))^k, la cota documentada en click_dedup.py
+    expected = (1 - math.exp(-bf.k * bf.capacity / bf.m)) ** bf.k
+    assert fp <= 2 * expected + 0.001
+
+
+def test_dedup_rotates_per_day_but_remembers_yesterday():
+    from services.click_dedup import ClickDeduplicator
+
+    d = ClickDeduplicator(max_bytes=64 * 1024, capacity=1000)
+    today = date(2025, 10, 22)
+    assert d.reserve(1, "c", "n1", today=today)
+    d.commit(1, "c", "n1", today=today)
+    assert not d.reserve(1, "c", "n1", today=today)
+    assert not d.reserve(1, "c", "n1", today=today + timedelta(days=1))
+    assert d.reserve(1, "c", "n1", today=today + timedelta(days=3))
+
+
+def test_reservation_is_atomic_and_released_on_failure():
+    from services.click_dedup import ClickDeduplicator
+
+    d = ClickDeduplicator(max_bytes=64 * 1024, capacity=1000)
+    won = []
+    barrier = threading.Barrier(8)
+
+    def race():
+        barrier.wait()
+        won.append(d.reserve(1, "c", "n1"))
+
+    threads = [threading.Thread(target=race) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert won.count(True) == 1
+    # en vuelo: el reintento se descarta; si el original falla, el siguiente reintento cuenta
+    assert not d.reserve(1, "c", "n1")
+    d.release(1, "c", "n1")
+    assert d.reserve(1, "c", "n1")
+
+
+def test_retried_click_is_counted_once(ads_db, seed_ad, monkeypatch):
+    from main import app
+    from routers import routes_ads
+    from services.click_dedup import ClickDeduplicator
+
+    monkeypatch.setattr(routes_ads, "METRICS_SINK", "db")
+    monkeypatch.setattr(routes_ads, "click_dedup", ClickDeduplicator(max_bytes=64 * 1024, capacity=1000))
+    ad_id = seed_ad()
+    client = TestClient(app)
+
+    params = {"client_id": "phone-1", "nonce": "abc"}
+    assert client.post(f"/ads/{ad_id}/click", params=params).json() == {"ok": True}
+    assert client.post(f"/ads/{ad_id}/click", params=params).json() == {"ok": True, "duplicate": True}
+    ev = {"ad_id": ad_id, "type": "click", "ts": datetime.now(timezone.utc).isoformat(), **params}
+    assert client.post("/ads/events/batch", json=[ev]).json()["duplicates"] == 1
+    assert client.get(f"/ads/{ad_id}").json()["total_clicks"] == 1
+
+
+def test_click_failed_to_record_is_counted_on_retry(ads_db, seed_ad, monkeypatch):
+    import pytest
+    from main import app
+    from routers import routes_ads
+    from services.click_dedup import ClickDeduplicator
+
+    monkeypatch.setattr(routes_ads, "METRICS_SINK", "db")
+    monkeypatch.setattr(routes_ads, "click_dedup", ClickDeduplicator(max_bytes=64 * 1024, capacity=1000))
+    ad_id = seed_ad()
+    client = TestClient(app)
+    ev = {"ad_id": ad_id, "type": "click", "ts": datetime.now(timezone.utc).isoformat(), "client_id": "phone-1", "nonce": "abc"}
+
+    record = routes_ads._record_metrics
+
+    def _fails(db, events):
+        raise RuntimeError("commit fallido")
+
+    monkeypatch.setattr(routes_ads, "_record_metrics", _fails)
+    with pytest.raises(RuntimeError):
+        client.post("/ads/events/batch", json=[ev, ev])
+    monkeypatch.setattr(routes_ads, "_record_metrics", record)
+    out = client.post("/ads/events/batch", json=[ev, ev]).json()
+    assert (out["accepted"], out["duplicates"]) == (1, 1)
+    assert client.post("/ads/events/batch", json=[ev]).json()["duplicates"] == 1
+    assert client.get(f"/ads/{ad_id}").json()["total_clicks"] == 1
@@ -0,0 +1,64 @@
+import pytest
+
+from etl.extract.browser import BrowserSession, StrategyOrder
+
+
+class _FakeDriver:
+    def __init__(self):
+        self.crashed = False
+        self.quits = 0
+
+    @property
+    def window_handles(self):
+        if self.crashed:
+            raise RuntimeError("chrome not reachable")
+        return ["w0"]
+
+    def quit(self):
+        self.quits += 1
+
+
+def test_session_launches_once_and_relaunches_after_crash():
+    made = []
+
+    def factory():
+        made.append(_FakeDriver())
+        return made[-1]
+
+    with BrowserSession(factory) as s:
+        d = s.driver
+        assert s.driver is d and s.driver is d
+        assert s.launches == 1
+        d.crashed = True
+        assert s.driver is not d and s.launches == 2
+        assert d.quits == 1
+    assert made[-1].quits == 1
+
+
+def test_session_closed_on_error():
+    made = []
+    with pytest.raises(ValueError):
+        with BrowserSession(lambda: made.append(_FakeDriver()) or made[-1]) as s:
+            s.driver
+            raise ValueError("estrategia rota")
+    assert made[0].quits == 1
+
+
+def test_strategy_order_adapts_and_persists(tmp_path):
+    base = ["cdp", "dir", "http"]
+    fp = tmp_path / "ide_strategy.json"
+    rank = StrategyOrder(fp)
+    assert rank.order(base) == base
+    rank.record("cdp", False)
+    rank.record("dir", False)
+    rank.record("http", True)
+    assert StrategyOrder(fp).order(base) == ["http", "cdp", "dir"]
+
+    rank = StrategyOrder(fp)
+    rank.record("http", False)
+    rank.record("http", False)
+    rank.record("cdp", True)
+    # la ganadora primero; detrás, por fallos seguidos
+    assert StrategyOrder(fp).order(base) == ["cdp", "dir", "http"]
+    assert StrategyOrder(fp).stats["http"] == {"ok": 1, "fail": 2, "fail_streak": 2,
+                                               "last_ok_utc": rank.stats["http"]["last_ok_utc"]}
@@ -0,0 +1,285 @@
+import sys
+import json
+import time
+import types
+import asyncio
+import threading
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from etl.extract import agua_canal, calles_ayto, electricidad_ide, fetch_state
+from etl.extract.browser import StrategyOrder
+from etl.extract.client import HttpClient
+from etl.extract.fetch_state import CHANGED, UNCHANGED, FetchState
+from etl.orchestrate import run_extract, run_pipeline
+
+DATA = Path(__file__).resolve().parent / "data" / "extract"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: el cliente puede reutilizar la conexión
+
+    def do_GET(self):
+        srv = self.server
+        with srv.lock:
+            srv.hits[self.path] = srv.hits.get(self.path, 0) + 1
+            srv.requests.append((self.path, dict(self.headers)))
+            srv.ports.add(self.client_address[1])
+            srv.inflight += 1
+            srv.max_inflight = max(srv.max_inflight, srv.inflight)
+            plan = srv.routes.get(self.path, [(404, {}, b"")])
+            status, headers, body = plan[min(srv.hits[self.path], len(plan)) - 1]
+            if headers.get("ETag") and self.headers.get("If-None-Match") == headers["ETag"]:
+                status, body = 304, b""
+        try:
+            if headers.get("X-Sleep"):
+                time.sleep(float(headers["X-Sleep"]))
+            self.send_response(status)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with srv.lock:
+                srv.inflight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    """Servidor HTTP local con respuestas grabadas: ``server.routes[path] = [(status, headers, body), ...]``
+    (una por petición; la última se repite)."""
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    srv.routes, srv.hits, srv.ports, srv.requests = {}, {}, set(), []
+    srv.inflight = srv.max_inflight = 0
+    srv.lock = threading.Lock()
+    srv.url = f"http://127.0.0.1:{srv.server_address[1]}"
+    t = threading.Thread(target=srv.serve_forever, daemon=True)
+    t.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_retries_with_backoff_and_pooled_connection(server):
+    server.routes["/flaky"] = [(503, {"Retry-After": "0"}, b""), (502, {}, b""), (200, {}, b"ok")]
+    server.routes["/ok"] = [(200, {}, b"ok")]
+
+    async def main():
+        async with HttpClient(backoff=0.01) as client:
+            r = await client.get(server.url + "/flaky")
+            for _ in range(3):
+                await client.get(server.url + "/ok")
+            return r, client.stats
+
+    r, stats = _run(main())
+    assert r.status_code == 200 and r.text == "ok"
+    assert server.hits["/flaky"] == 3 and stats["retries"] == 2
+    # todas las peticiones por la misma conexión
+    assert len(server.ports) == 1
+
+
+def test_gives_up_after_retries(server):
+    server.routes["/down"] = [(500, {}, b"")]
+
+    async def main():
+        async with HttpClient(retries=1, backoff=0.01) as client:
+            await client.get(server.url + "/down")
+
+    with pytest.raises(httpx.HTTPStatusError):
+        _run(main())
+    assert server.hits["/down"] == 2
+
+
+def test_per_host_concurrency_limit(server):
+    server.routes["/slow"] = [(200, {"X-Sleep": "0.1"}, b"")]
+
+    async def main():
+        async with HttpClient(per_host=2) as client:
+            await asyncio.gather(*(client.get(server.url + "/slow") for _ in range(6)))
+
+    _run(main())
+    assert server.hits["/slow"] == 6
+    assert server.max_inflight == 2
+
+
+def test_extractors_against_recorded_payloads(server, tmp_path, monkeypatch):
+    server.routes["/canal"] = [(200, {"Content-Type": "text/html; charset=utf-8"},
+                                (DATA / "incidencias-en-el-suministro.html").read_bytes())]
+    server.routes["/ayto"] = [(200, {"Content-Type": "text/xml"}, (DATA / "incid_aytomadrid.xml").read_bytes())]
+    monkeypatch.setattr(agua_canal, "URL", server.url + "/canal")
+    monkeypatch.setattr(calles_ayto, "URL", server.url + "/ayto")
+
+    async def main():
+        async with HttpClient() as client:
+            await asyncio.gather(agua_canal.arun(client, tmp_path / "canal"), calles_ayto.arun(client, tmp_path / "ayto"))
+
+    _run(main())
+    canal = json.loads((tmp_path / "canal" / "cortes_agua_canalisabelii.json").read_text(encoding="utf-8"))
+    assert [e["direccion"] for e in canal][:1] == ["AVDA ARAGON, 404, MADRID"] and len(canal) == 3
+    assert canal[0]["tipo"] == "mantenimiento" and canal[0]["mensaje"].startswith("Se está")
+    lines = (tmp_path / "ayto" / calles_ayto.EVENTS_FILE).read_text(encoding="utf-8").splitlines()
+    events = [json.loads(ln) for ln in lines]
+    assert len(events) == 3
+    assert events[0]["tipo"] == "Obras en la vía" and events[0]["es_obras"] is True
+    assert not (tmp_path / "ayto" / calles_ayto.RAW_FILE).exists()
+
+
+@pytest.mark.parametrize("chunk", [7, 64 * 1024])
+def test_ayto_streaming_parse_matches_whole_document(monkeypatch, tmp_path, chunk):
+    xml = (DATA / "incid_aytomadrid.xml").read_bytes()
+    whole = [{c.tag: (c.text or "").strip() for c in inc} for inc in ET.fromstring(xml).iter("Incidencia")]
+    feed = [xml[i:i + chunk] for i in range(0, len(xml), chunk)]
+    assert list(calles_ayto._xml_rows(feed)) == whole
+
+    n = calles_ayto._write_ndjson(iter(whole), tmp_path / calles_ayto.EVENTS_FILE, tmp_path / calles_ayto.RAW_FILE)
+    raw = (tmp_path / calles_ayto.RAW_FILE).read_text(encoding="utf-8").splitlines()
+    assert n == 3 and [json.loads(ln) for ln in raw] == whole
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_source_time_budget(monkeypatch, tmp_path):
+    async def arun(client, out, state=None):
+        await asyncio.sleep(5)
+
+    monkeypatch.setitem(run_extract.EXTRACTORS, "CANAL", "fake_extractor")
+    monkeypatch.setitem(sys.modules, "fake_extractor", types.SimpleNamespace(arun=arun))
+    monkeypatch.setitem(run_extract.BUDGETS, "CANAL", 0.05)
+    t0 = time.perf_counter()
+    [(tag, status, err)] = _run(run_extract.extract([("CANAL", str(tmp_path), {})], quiet=True))
+    assert (tag, status) == ("CANAL", "failed") and "sin terminar" in err
+    assert time.perf_counter() - t0 < 2
+
+
+def test_ide_budget_stops_browser_thread(monkeypatch, tmp_path):
+    # i-DE descarga en un hilo: agotado el presupuesto, el hilo tiene que parar y no publicar nada
+    # junto a la simulación
+    class Driver:
+        window_handles = ["w0"]
+
+        def get(self, url):
+            pass
+
+        def quit(self):
+            pass
+
+    async def no_probe(client, state):
+        return None
+
+    done = threading.Event()
+    real = electricidad_ide.open_and_download
+
+    def open_and_download(*args):
+        try:
+            return real(*args)
+        finally:
+            done.set()
+
+    monkeypatch.setattr(electricidad_ide, "_probe_http", no_probe)
+    monkeypatch.setattr(electricidad_ide, "_build_driver", lambda d: Driver())
+    monkeypatch.setattr(electricidad_ide, "open_and_download", open_and_download)
+    monkeypatch.setattr(electricidad_ide, "StrategyOrder", lambda: StrategyOrder(tmp_path / "strategy.json"))
+    monkeypatch.setattr(electricidad_ide, "STRATEGY", "dir_only")
+    monkeypatch.setattr(electricidad_ide, "DIR_WAIT", 30)
+    monkeypatch.setitem(run_extract.BUDGETS, "IDE", 0.2)
+    out = tmp_path / "ide"
+    t0 = time.perf_counter()
+    [(tag, status, err)] = _run(run_extract.extract([("IDE", str(out), {})], quiet=True))
+    assert (tag, status) == ("IDE", "simulated")
+    assert done.wait(2) and time.perf_counter() - t0 < 3
+    assert (out / "cortes_ide_events.json").exists()
+    assert not list(out.glob("Cortes electricidad*")) and not list((out / electricidad_ide.PARTIAL_DIR).iterdir())
+
+
+def _extract_twice(server, monkeypatch, tmp_path, module, path, payloads):
+    server.routes[path] = payloads
+    monkeypatch.setattr(module, "URL", server.url + path)
+    state = FetchState(tmp_path / "_fetch_state.json")
+
+    async def main(out):
+        async with HttpClient() as client:
+            return await module.arun(client, out, state=state)
+
+    first = _run(main(tmp_path / "1"))
+    state.save()
+    state = FetchState.load(tmp_path / "_fetch_state.json")
+    second = _run(main(tmp_path / "2"))
+    return first, second, state
+
+
+def test_conditional_request_marks_source_unchanged(server, monkeypatch, tmp_path):
+    html = (DATA / "incidencias-en-el-suministro.html").read_bytes()
+    first, second, state = _extract_twice(server, monkeypatch, tmp_path, agua_canal, "/canal",
+                                          [(200, {"ETag": '"v1"', "Last-Modified": "Wed, 22 Oct 2025 08:00:00 GMT"}, html)])
+    assert (first, second) == (CHANGED, UNCHANGED)
+    sent = server.requests[-1][1]
+    assert sent["If-None-Match"] == '"v1"' and sent["If-Modified-Since"] == "Wed, 22 Oct 2025 08:00:00 GMT"
+    # sin cambios no se escribe nada
+    assert (tmp_path / "1" / "cortes_agua_canalisabelii.json").exists() and not (tmp_path / "2").exists()
+    assert state.sources["canal"]["etag"] == '"v1"'
+
+
+def test_content_hash_detects_unchanged_and_changed(server, monkeypatch, tmp_path):
+    xml = (DATA / "incid_aytomadrid.xml").read_bytes()
+    first, second, _ = _extract_twice(server, monkeypatch, tmp_path, calles_ayto, "/ayto", [(200, {}, xml)])
+    assert (first, second) == (CHANGED, UNCHANGED)
+    first, second, _ = _extract_twice(server, monkeypatch, tmp_path / "b", calles_ayto, "/ayto2",
+                                      [(200, {}, xml), (200, {}, xml.replace(b"39350", b"39351"))])
+    assert (first, second) == (CHANGED, CHANGED)
+
+
+def test_pipeline_skips_unchanged_sources(monkeypatch, tmp_path):
+    monkeypatch.setattr(run_pipeline, "STATUS_FILE", tmp_path / run_extract.STATUS_FILE)
+    assert run_pipeline._changed_sources() is None
+    run_extract.write_status(tmp_path, [("IDE", "simulated", None), ("CANAL", "unchanged", None),
+                                        ("AYTO", "changed", None)])
+    assert run_pipeline._changed_sources() == ["ide", "ayto", "gas"]
+    run_extract.write_status(tmp_path, [("IDE", "unchanged", None), ("CANAL", "unchanged", None),
+                                        ("AYTO", "unchanged", None), ("GAS", "unchanged", None)])
+    assert run_pipeline._changed_sources() == []
+
+
+def test_fetch_state_committed_only_after_load(monkeypatch, tmp_path):
+    state_fp = tmp_path / "_fetch_state.json"
+    monkeypatch.setattr(fetch_state, "STATE_PATH", state_fp)
+    monkeypatch.setattr(run_pipeline, "RAW", tmp_path)
+    monkeypatch.setattr(run_pipeline, "STATUS_FILE", tmp_path / run_extract.STATUS_FILE)
+    FetchState(state_fp, {"ayto": {"sha256": "viejo"}}).save()
+    fail = {"etl.orchestrate.run_load"}
+
+    def fake_run(cmd):
+        if cmd[2] == "etl.orchestrate.run_extract":
+            FetchState(state_fp, {"ayto": {"sha256": "nuevo"}}).save(pending=True)
+            run_extract.write_status(tmp_path, [("AYTO", "changed", None)])
+        elif cmd[2] in fail:
+            raise SystemExit(1)
+
+    monkeypatch.setattr(run_pipeline, "_run", fake_run)
+    with pytest.raises(SystemExit):
+        run_pipeline.main()
+    # la carga falló: la próxima extracción sigue comparando con lo último cargado
+    assert FetchState.load(state_fp).sources["ayto"]["sha256"] == "viejo"
+    fail.clear()
+    run_pipeline.main()
+    assert FetchState.load(state_fp).sources["ayto"]["sha256"] == "nuevo"
+    assert not fetch_state.pending_path().exists()
+
+
+def test_pipeline_sees_ndjson_raw(monkeypatch, tmp_path):
+    monkeypatch.setattr(run_pipeline, "RAW", tmp_path)
+    d = tmp_path / "ayto" / "20251022"
+    d.mkdir(parents=True)
+    (d / calles_ayto.EVENTS_FILE).write_text('{"event_id":"x"}\n', encoding="utf-8")
+    assert run_pipeline._raw_has_json("ayto", "20251022")
+    assert not run_pipeline._raw_has_json("canal", "20251022")
@@ -0,0 +1,106 @@
+import io
+import re
+
+import pdfplumber
+import pytest
+
+from etl.extract import ide_pdf
+
+# una página por lista; las filas largas siguen en la página siguiente (frontera de tramo)
+PAGES = [
+    ["Internal Use", "Población | Municipio Fecha Hora inicio Hora fin Calles",
+     "MADRID 27/10/2025 10:15 11:35 C/ López de Hoyos: 170-180, 172;",
+     "Av. de América: 2-40 pares;",
+     "ALCOBENDAS 27/10/2025 12:00 14:00 C/ Marquesa Viuda de Aldama: 1-9"],
+    ["Página 2", "C/ Francisca Delgado: 3;",
+     "Pº de la Chopera: 1-11", "MADRID 28/10/2025 15:30 18:44 Av. de Andalucía: 190, 210 A"],
+    ["Página 3", "C/ Ñandú: 5-7;", "C/ Águila: 1"],
+    ["Página 4", "SAN SEBASTIÁN DE LOS REYES 29/10/2025 09:00 13:00 Av. de España: 12-20",
+     "MADRID 30/10/2025 08:00 09:30 C/ Real de Arganda: 206"],
+]
+
+
+def _pdf(pages) -> bytes:
+    """PDF mínimo (Helvetica, WinAnsi) con una línea de texto por elemento."""
+    objs = {1: b"<< /Type /Catalog /Pages 2 0 R >>",
+            3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"}
+    kids = []
+    for i, lines in enumerate(pages):
+        page_id, content_id = 4 + 2 * i, 5 + 2 * i
+        ops = ["BT /F1 9 Tf 40 800 Td 12 TL"]
+        for ln in lines:
+            esc = ln.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            ops.append(f"({esc}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("cp1252")
+        objs[content_id] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        objs[page_id] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                         b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        kids.append(b"%d 0 R" % page_id)
+    objs[2] = b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % len(pages)
+    out, offsets = bytearray(b"%PDF-1.4\n"), {}
+    for n in sorted(objs):
+        offsets[n] = len(out)
+        out += b"%d 0 obj\n" % n + objs[n] + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    for n in sorted(objs):
+        out += b"%010d 00000 n \n" % offsets[n]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    return bytes(out)
+
+
+def _reference(pdf_path):
+    """``parse_pdf_rows`` de antes: todo el PDF en memoria, página a página en un solo proceso."""
+    rows = []
+    start = re.compile(r"^([A-ZÁÉÍÓÚÜÑ ][A-ZÁÉÍÓÚÜÑ \-/ºª\.]+?)\s+(\d{2}/\d{2}/\d{4})\s+(\d{2}:\d{2})\s+(\d{2}:\d{2})\s+(.*)$")
+    skip = ("Internal Use", "Página", "Población | Municipio")
+    with open(pdf_path, "rb") as f, pdfplumber.open(io.BytesIO(f.read())) as pdf:
+        cur = None
+        for page in pdf.pages:
+            txt = page.extract_text() or ""
+            for raw in txt.splitlines():
+                ln = re.sub(r"\s+", " ", raw).strip()
+                if not ln or ln.startswith(skip):
+                    continue
+                m = start.match(ln)
+                if m:
+                    if cur:
+                        rows.append(cur)
+                    cur = {"municipio": m.group(1).title().strip(), "fecha": m.group(2), "hora_inicio": m.group(3),
+                           "hora_fin": m.group(4), "direcciones": m.group(5)}
+                elif cur:
+                    cur["direcciones"] = (cur["direcciones"] + " " + ln).strip()
+        if cur:
+            rows.append(cur)
+    return rows
+
+
+@pytest.fixture
+def pdf_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(ide_pdf, "CACHE_DIR", tmp_path / "cache")
+    fp = tmp_path / "Madrid.pdf"
+    fp.write_bytes(_pdf(PAGES))
+    return fp
+
+
+@pytest.mark.parametrize("workers,chunk_pages", [(1, 8), (1, 1), (2, 1), (2, 3)])
+def test_parse_pdf_rows_golden(pdf_path, workers, chunk_pages):
+    ref = _reference(pdf_path)
+    assert [r["municipio"] for r in ref] == ["Madrid", "Alcobendas", "Madrid", "San Sebastián De Los Reyes", "Madrid"]
+    assert ref[1]["direcciones"] == ("C/ Marquesa Viuda de Aldama: 1-9 C/ Francisca Delgado: 3; Pº de la Chopera: 1-11")
+    assert ref[2]["direcciones"].endswith("210 A C/ Ñandú: 5-7; C/ Águila: 1")
+    assert ide_pdf.parse_pdf_rows(pdf_path, workers=workers, chunk_pages=chunk_pages, cache=False) == ref
+
+
+def test_parsed_rows_cached_by_content_hash(pdf_path, monkeypatch):
+    rows = ide_pdf.parse_pdf_rows(pdf_path, workers=1)
+    assert len(list(ide_pdf.CACHE_DIR.glob("*.json"))) == 1
+
+    def _no_parse(*args, **kwargs):
+        raise AssertionError("el PDF no debería volver a leerse")
+
+    monkeypatch.setattr(ide_pdf.pdfplumber, "open", _no_parse)
+    copy = pdf_path.with_name("Madrid_copia.pdf")
+    copy.write_bytes(pdf_path.read_bytes())
+    assert ide_pdf.parse_pdf_rows(copy, workers=1) == rows
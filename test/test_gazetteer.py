@@ -0,0 +1,81 @@
+import time
+
+import pandas as pd
+import pytest
+
+from etl.transform.gazetteer import Gazetteer, street_key
+
+CALLEJERO = """VIA_CLASE;VIA_PAR;VIA_NOMBRE;NUMERO;LATITUD;LONGITUD
+CALLE;;REAL DE ARGANDA;204;40.3801;-3.6201
+CALLE;;REAL DE ARGANDA;206;40.3803;-3.6203
+CALLE;;REAL DE ARGANDA;211;40.3810;-3.6210
+AVENIDA;DE;ALBERTO ALCOCER;12;40.4560;-3.6790
+CALLE;DEL;GENERAL RICARDOS;93;40.3900;-3.7250
+PASEO;DE LA;CASTELLANA;100;40º26'24.00'' N;3º41'24.00'' W
+PLAZA;;MAYOR;1;40.4155;-3.7074
+CALLE;;MAYOR;1;40.4160;-3.7090
+"""
+
+
+@pytest.fixture
+def gz(tmp_path):
+    fp = tmp_path / "callejero.csv"
+    fp.write_bytes(CALLEJERO.encode("latin-1"))
+    from etl.transform import run_transform as rt
+    return Gazetteer.load(fp, normalize_street=rt._normalize_via_name, strip_accents=rt._strip_accents)
+
+
+def test_street_key_canonical_type():
+    assert street_key("C/ Real de Arganda") == ("calle real de arganda", "real de arganda")
+    assert street_key("Av. de Alberto Alcócer")[0] == street_key("AVENIDA ALBERTO ALCOCER")[0]
+    assert street_key("Pº Castellana")[0] == "paseo castellana"
+
+
+def test_lookup_exact_fuzzy_and_nearest(gz):
+    assert gz.lookup("C/ Real de Arganda", "206") == (40.3803, -3.6203)
+    assert gz.lookup("Av. Alberto Alcocer", "12 B") == (40.456, -3.679)        # sin calificador
+    assert gz.lookup("C/ Genral Ricardos", "93") == (40.39, -3.725)             # fuzzy
+    assert gz.lookup("C/ Real de Arganda", "208") == (40.3803, -3.6203)         # misma acera
+    lat, lon = gz.lookup("Pº Castellana", "100")
+    assert lat == pytest.approx(40.44) and lon == pytest.approx(-3.69)
+    assert gz.lookup("Plaza Mayor", "1") == (40.4155, -3.7074)
+    assert gz.lookup("Calle Mayor", "1") == (40.416, -3.709)
+    assert gz.lookup("Calle Que No Existe", "1") == (None, None)
+
+
+def test_lookup_is_fast(gz):
+    gz.lookup("C/ Genral Ricardos", "93")
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        gz.lookup("C/ Genral Ricardos", "93")
+    assert (time.perf_counter() - t0) / 1000 < 1e-3
+
+
+def test_ide_fill_coords_uses_gazetteer_first(transform_env, monkeypatch):
+    rt = transform_env
+    rt.GAZETTEER.parent.mkdir(parents=True, exist_ok=True)
+    csv = rt.GAZETTEER.with_suffix(".csv")
+    csv.write_text(CALLEJERO, encoding="utf-8")
+    monkeypatch.setattr(rt, "GAZETTEER", csv)
+    asked = []
+
+    class Fallback:
+        def geocode_many(self, addresses):
+            asked.extend(addresses)
+            return {}
+
+    monkeypatch.setattr(rt, "_geocoder", lambda: Fallback())
+    recs = [{"via": "C/ Real de Arganda", "numero": "206"}, {"via": "C/ Inventada", "numero": "1"}]
+    df = rt._ide_fill_coords_df(rt.cols.ide_numbers(pd.DataFrame(recs)))
+    assert (df.loc[0, "lat"], df.loc[0, "lon"]) == (40.3803, -3.6203)
+    assert pd.isna(df.loc[1, "lat"])
+    assert asked == ["1 C/ Inventada, Madrid, Spain"]
+
+
+def test_missing_gazetteer_is_reported_and_can_be_disabled(transform_env, monkeypatch, capsys):
+    rt = transform_env
+    assert rt._gazetteer() is None
+    assert "no existe el callejero" in capsys.readouterr().out
+    monkeypatch.setattr(rt, "GAZETTEER", None)
+    assert rt._gazetteer() is None
+    assert capsys.readouterr().out == ""
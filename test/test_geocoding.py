@@ -0,0 +1,158 @@
+import json
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from etl.transform.geocoding import Geocoder
+
+KNOWN = {"1 Calle Mayor, Madrid, Spain": (40.4153, -3.7074)}
+
+
+@pytest.fixture
+def nominatim():
+    """Nominatim falso en local: /search y /reverse, contando peticiones."""
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            q = {k: v[0] for k, v in parse_qs(url.query).items()}
+            calls.append((url.path, q))
+            if q.get("q") == "boom":
+                self.send_response(503)
+                self.end_headers()
+                return
+            if url.path == "/search":
+                hit = KNOWN.get(q.get("q"))
+                body = [{"lat": str(hit[0]), "lon": str(hit[1])}] if hit else []
+            else:
+                body = {"address": {"road": "calle de alcalá", "house_number": "12 "}} \
+                    if q["lat"].startswith("40.4") else {"error": "Unable to geocode"}
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    th = threading.Thread(target=srv.serve_forever, daemon=True)
+    th.start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}", calls
+    srv.shutdown()
+    srv.server_close()
+
+
+def _geocoder(tmp_path, url, **kw):
+    kw.setdefault("rate", 0)
+    return Geocoder(tmp_path / "gc.sqlite", base_url=url, **kw)
+
+
+def test_bulk_hits_and_negative_cache(tmp_path, nominatim):
+    url, calls = nominatim
+    addrs = ["1 Calle Mayor, Madrid, Spain", "99 Calle Inventada, Madrid, Spain"]
+    gc = _geocoder(tmp_path, url)
+    res = gc.geocode_many(addrs + addrs)
+    assert res[addrs[0]] == KNOWN[addrs[0]]
+    assert res[addrs[1]] == (None, None)
+    assert len(calls) == 2
+    gc.close()
+
+    # nueva instancia (LRU vacía): todo sale de SQLite, incluida la caché negativa
+    gc = _geocoder(tmp_path, url)
+    assert gc.geocode_many(addrs) == res
+    assert len(calls) == 2
+    assert gc.stats["hits"] == 2 and gc.stats["negative"] == 1
+    gc.close()
+
+    # con el TTL vencido el negativo se reintenta
+    gc = _geocoder(tmp_path, url, neg_ttl=0)
+    gc.geocode_many(addrs)
+    assert [q["q"] for _, q in calls[2:]] == [addrs[1]]
+    gc.close()
+
+
+def test_transient_errors_are_not_cached(tmp_path, nominatim):
+    url, calls = nominatim
+    gc = _geocoder(tmp_path, url)
+    assert gc.geocode("boom") == (None, None)
+    assert gc.geocode("boom") == (None, None)
+    assert len(calls) == 2
+    gc.close()
+
+
+def test_reverse_normalizes_and_caches(tmp_path, nominatim):
+    url, calls = nominatim
+    gc = _geocoder(tmp_path, url, normalize_street=str.title, normalize_number=str.strip)
+    res = gc.reverse_many([(40.42, -3.70), (41.0, -3.0), (40.42, -3.70)])
+    assert res[(40.42, -3.70)] == ("Calle De Alcalá", "12")
+    assert res[(41.0, -3.0)] == (None, None)
+    assert len(calls) == 2
+    gc.close()
+
+    gc = _geocoder(tmp_path, url)
+    assert gc.reverse(40.42, -3.70) == ("Calle De Alcalá", "12")
+    assert gc.reverse(41.0, -3.0) == (None, None)
+    assert len(calls) == 2
+    gc.close()
+
+
+def test_reverse_cache_is_spatially_quantized(tmp_path, nominatim):
+    url, calls = nominatim
+    gc = _geocoder(tmp_path, url, rev_nearest_m=30)
+    gc.reverse(40.4200001, -3.7000001)
+    gc.close()
+
+    gc = _geocoder(tmp_path, url, rev_nearest_m=30)
+    # misma celda con otra precisión de float y un punto ~20 m más allá (celda vecina)
+    res = gc.reverse_many([(40.42, -3.70), (40.42018, -3.70)])
+    assert res[(40.42, -3.70)] == ("calle de alcalá", "12 ")
+    # del vecino se reutiliza la calle, no el número
+    assert res[(40.42018, -3.70)] == ("calle de alcalá", None)
+    assert len(calls) == 1
+    assert gc.stats["nearest"] == 1
+    assert gc.reverse_many([(40.42018, -3.70)]) == {(40.42018, -3.70): ("calle de alcalá", None)}
+    # a 200 m ya no vale el vecino
+    gc.reverse(40.4218, -3.70)
+    assert len(calls) == 2
+    gc.close()
+
+
+def test_legacy_exact_reverse_cache_is_migrated(tmp_path, nominatim):
+    import sqlite3
+    url, calls = nominatim
+    cx = sqlite3.connect(tmp_path / "gc.sqlite")
+    cx.execute("create table revgc(lat real, lon real, street text, number text, primary key(lat,lon))")
+    cx.execute("insert into revgc values(40.45, -3.69, 'Paseo de la Castellana', '100')")
+    cx.commit()
+    cx.close()
+    gc = _geocoder(tmp_path, url)
+    assert gc.reverse(40.45000001, -3.69) == ("Paseo de la Castellana", "100")
+    assert calls == []
+    gc.close()
+
+
+def _geocode_in_worker(db_path, url, worker, rate):
+    gc = Geocoder(db_path, base_url=url, rate=rate, concurrency=2)
+    gc.geocode_many(f"{i} Calle del Worker {worker}, Madrid, Spain" for i in range(4))
+    gc.close()
+
+
+def test_rate_limit_is_shared_across_workers(tmp_path, nominatim):
+    # como los workers del transform: un Geocoder por proceso sobre la misma caché
+    url, calls = nominatim
+    rate, workers = 20.0, 3
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        list(ex.map(_geocode_in_worker, [tmp_path / "gc.sqlite"] * workers, [url] * workers, range(workers),
+                    [rate] * workers))
+    assert len(calls) == 12
+    # 12 peticiones a 20/s en total: al menos 11 huecos de 50 ms, no 3 procesos a 20/s cada uno
+    assert time.perf_counter() - t0 >= 11 / rate * 0.95
@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def incidents_db():
+    """SQLite en memoria con el schema de fct_events adjunto y get_db redirigido a él."""
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from database import get_db
+    from main import app
+    from models.models import Incident
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    @event.listens_for(engine, "connect")
+    def _attach(dbapi_conn, _):
+        dbapi_conn.execute("ATTACH DATABASE ':memory:' AS analytics_analytics")
+
+    Incident.__table__.create(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def _get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = _get_db
+    yield Session
+    app.dependency_overrides.pop(get_db, None)
+    engine.dispose()
+
+
+def test_filter_by_street_number_uses_ranges(incidents_db):
+    from main import app
+    from models.models import Incident
+
+    now = datetime(2025, 10, 22, tzinfo=timezone.utc)
+    rows = [
+        ("todo", "1-2000", 1, 2000, "todos"),
+        ("pares", "2-40 pares", 2, 40, "par"),
+        ("portal", "12", 12, 12, "todos"),
+        ("ayto", "12 B", None, None, None),
+        ("otro", "120", None, None, None),
+    ]
+    with incidents_db() as db:
+        for fp, num, lo, hi, par in rows:
+            db.add(Incident(fingerprint=fp, source="ide", category="electricity", status="planned", city="Madrid",
+                            street="Calle Mayor", street_number=num, street_number_from=lo, street_number_to=hi,
+                            street_number_parity=par, start_ts_utc=now, ingested_at_utc=now))
+        db.commit()
+
+    client = TestClient(app)
+
+    def found(n):
+        r = client.get("/incidents/filter/", params={"street_number": n})
+        assert r.status_code == 200
+        return sorted(i["fingerprint"] for i in r.json())
+
+    assert found("12") == ["ayto", "pares", "portal", "todo"]
+    assert found("13") == ["todo"]
+    assert found("41") == ["todo"]
+    assert found("2001") == []
+    assert found("s/n") == []
@@ -0,0 +1,50 @@
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from etl.orchestrate import run_load
+
+
+def _curated(root, rows_by_dt, extra=False):
+    for dt, n in rows_by_dt.items():
+        d = root / "ide" / f"dt={dt}"
+        d.mkdir(parents=True, exist_ok=True)
+        cols = {"via": [f"C/ {dt} {i}" for i in range(n)]}
+        if extra:
+            cols["paridad"] = ["todos"] * n
+        pq.write_table(pa.table(cols), d / "part-000.parquet")
+
+
+def _load(con, dts, full_tables=()):
+    rel = run_load._read(run_load._dataset(run_load.CURATED / "ide"))
+    sql = run_load._table_sql("electricity", rel, dts, full="electricity" in full_tables)
+    con.execute(sql)
+
+
+def test_backfill_falls_back_to_full_load_on_schema_drift(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_load, "CURATED", tmp_path / "curated")
+    _curated(run_load.CURATED, {"2025-10-22": 2, "2025-10-25": 3})
+    con = duckdb.connect()
+    con.execute(f"ATTACH '{tmp_path / 'pg.duckdb'}' AS pg")
+    con.execute("CREATE SCHEMA pg.staging")
+    assert run_load.schema_drift(con, ["ide"]) == {}
+
+    # tabla de antes de la columna dt
+    con.execute("CREATE TABLE pg.staging.electricity AS SELECT 'C/ vieja' AS via")
+    assert run_load.schema_drift(con, ["ide"]) == {"electricity": "sin columna dt"}
+    dts = ("2025-10-25", "2025-10-25")
+    _load(con, dts, full_tables=run_load.schema_drift(con, ["ide"]))
+    assert con.sql("SELECT count(*) FROM pg.staging.electricity").fetchone() == (5,)
+
+    # el curado gana una columna: el backfill no puede insertar por nombre
+    _curated(run_load.CURATED, {"2025-10-25": 1}, extra=True)
+    assert run_load.schema_drift(con, ["ide"]) == {"electricity": "faltan columnas: paridad"}
+    _load(con, dts, full_tables=run_load.schema_drift(con, ["ide"]))
+    assert con.sql("SELECT count(*), count(paridad) FROM pg.staging.electricity").fetchone() == (3, 1)
+
+    # sin deriva, el backfill sólo toca los dt seleccionados
+    assert run_load.schema_drift(con, ["ide"]) == {}
+    _curated(run_load.CURATED, {"2025-10-22": 4}, extra=True)
+    _load(con, ("2025-10-22", "2025-10-22"))
+    assert con.sql("SELECT dt::text, count(*) FROM pg.staging.electricity GROUP BY 1 ORDER BY 1").fetchall() == [
+        ("2025-10-22", 4), ("2025-10-25", 1)]
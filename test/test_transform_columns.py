@@ -0,0 +1,462 @@
+import hashlib
+import io
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from etl.transform import columns as cols
+from etl.transform import numbers
+from etl.transform import schemas
+from etl.transform import stream
+from etl.transform import run_transform as rt
+
+RAW = Path(rt.__file__).resolve().parents[1] / "data_raw"
+
+EDGE_TEXT = [None, "", " ", "  Madrid ", "MADRID (Capital)", "Madrid(capital)", "Móstoles", "madrid\tcentro",
+             "C/ Real de Arganda", "Obras en Calle  Mayor", "Av. Alberto Alcocer", "avda de la Paz", "Pza.\nMayor",
+             "12 B", "7º", "3ª izq", "5 Madrid", "2 25/10/2025", "4 10:30", "clMayor:12", "s/n", "0012", 12, 0, 4.5]
+EDGE_TS = [None, "", "2025-10-30T10:00:00Z", "2025-10-30T10:00:00+02:00", "2025-10-30 10:00", "2025-10-30",
+           "2025-10-26T02:30:00", "2025-03-30T02:30:00", "2025-10-30T10:00:00.123456", "2025-02-30T10:00:00",
+           "20251030T1000", "30/10/2025", "garbage", 1730000000]
+EDGE_DATES = [("30/10/2025", "15:30"), ("26/10/2025", "02:30"), ("30/03/2025", "02:30"), ("1/2/2025", "9:05"),
+              ("30/10/2025", None), (None, "10:00"), ("", "10:00"), ("31/02/2025", "10:00"), ("30-10-2025", "10:00")]
+
+
+# Camino por registro de antes de columns.py: sólo lo usan estos tests como oráculo de las
+# versiones de columna.
+def _read_json(fp: Path) -> List[Dict]:
+    return list(stream.iter_records(fp))
+
+
+def _is_madrid_strict(s: Optional[str]) -> bool:
+    if not s:
+        return False
+    t = rt._strip_accents(str(s)).lower().strip()
+    t = cols.RE_WS.sub(" ", t)
+    return bool(cols.RE_MADRID.fullmatch(t))
+
+
+def _is_madrid_soft(s: Optional[str]) -> bool:
+    if not s:
+        return False
+    return "madrid" in str(s).casefold()
+
+
+def _in_bbox(lat: Optional[float], lon: Optional[float]) -> bool:
+    try:
+        if lat is None or lon is None:
+            return False
+        return 40.2 <= float(lat) <= 40.6 and -3.9 <= float(lon) <= -3.4
+    except:
+        return False
+
+
+def _clean_via(v: Optional[str]) -> Optional[str]:
+    if not v:
+        return None
+    s = str(v).strip()
+    s = cols.RE_WS.sub(" ", s)
+    m = cols.RE_VIA.search(s)
+    if m:
+        return m.group(1)
+    return s
+
+
+def _to_float(x):
+    try:
+        return float(x)
+    except:
+        return None
+
+
+def _now_utc_iso():
+    return datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00","Z")
+
+
+def _ts_from_date_time(date_str: Optional[str], time_str: Optional[str]) -> Optional[str]:
+    if not date_str:
+        return None
+    t = time_str or "00:00"
+    try:
+        d = datetime.strptime(f"{date_str} {t}", "%d/%m/%Y %H:%M")
+    except:
+        return None
+    dt = d.replace(tzinfo=cols.TZ_MAD).astimezone(timezone.utc)
+    return dt.replace(microsecond=0).isoformat().replace("+00:00","Z")
+
+
+def _to_utc_iso(ts_like: Optional[str]) -> Optional[str]:
+    if not ts_like:
+        return None
+    try:
+        dt = datetime.fromisoformat(ts_like.replace("Z","+00:00"))
+    except:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=cols.TZ_MAD)
+    dt = dt.astimezone(timezone.utc)
+    return dt.replace(microsecond=0).isoformat().replace("+00:00","Z")
+
+
+def _fp(city, street, number, category, source, start_iso) -> str:
+    base = "|".join([
+        (city or "").lower(),
+        (street or "").lower(),
+        (number or "").lower(),
+        (category or "").lower(),
+        (source or "").lower(),
+        (start_iso or "")
+    ])
+    return hashlib.sha1(base.encode("utf-8")).hexdigest()
+
+
+def _clean_ide_record(rec: Dict) -> Optional[Dict]:
+    m = str(rec.get("municipio") or "").strip()
+    if not _is_madrid_strict(m):
+        return None
+    out = dict(rec)
+    out.pop("fuente", None)
+    out.pop("source", None)
+    via_raw = out.get("via")
+    num_raw = out.get("numero")
+    via = _clean_via(via_raw)
+    desde, hasta, paridad = _ide_interval(out, num_raw)
+    num = numbers.label(desde, hasta, paridad) if numbers.is_range(desde, hasta) else rt._clean_num(num_raw)
+    out["via"] = via
+    out["numero"] = num
+    out["numero_desde"], out["numero_hasta"], out["paridad"] = desde, hasta, paridad
+    return out
+
+
+def _ide_interval(rec: Dict, num_raw) -> numbers.Interval:
+    # el extract ya trae el intervalo; los raw anteriores sólo el número (o el rango) como texto
+    if rec.get("numero_desde") is None:
+        return numbers.parse_token(num_raw)
+    desde = int(rec["numero_desde"])
+    hasta = int(rec["numero_hasta"]) if rec.get("numero_hasta") is not None else desde
+    return desde, hasta, rec.get("paridad") or "todos"
+
+
+def _ide_geocode_number(rec: Dict) -> Optional[str]:
+    # un rango se geocodifica por su primer portal
+    desde, hasta = rec.get("numero_desde"), rec.get("numero_hasta")
+    return str(desde) if numbers.is_range(desde, hasta) else rec.get("numero")
+
+
+def _ayto_extract_from_desc(desc: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    if not desc:
+        return None, None
+    t = desc.strip()
+    mnum = cols.RE_DESC_NUM.search(t)
+    number = mnum.group(2) if mnum else None
+    street = None
+    if mnum:
+        head = t[:mnum.start()].strip(" .,:;")
+        head = cols.RE_WS.sub(" ", head)
+        street = head if head else None
+    return (street or None), (number or None)
+
+
+def _ayto_enrich_with_desc(records: List[Dict]) -> List[Dict]:
+    out = []
+    for r in records:
+        rec = dict(r)
+        if (not rec.get("via")) or (not rec.get("numero")):
+            street, num = _ayto_extract_from_desc(rec.get("descripcion") or rec.get("mensaje"))
+            if (not rec.get("via")) and street:
+                rec["via"] = street
+            if (not rec.get("numero")) and num:
+                rec["numero"] = num
+        out.append(rec)
+    return out
+
+
+def _clean_generic_madrid(rec: Dict, city_keys: List[str], addr_keys: List[str], lat_key: str = "lat", lon_key: str = "lon") -> Optional[Dict]:
+    out = dict(rec)
+    out.pop("fuente", None)
+    out.pop("source", None)
+    city = None
+    for ck in city_keys:
+        if ck in rec and rec[ck] is not None:
+            city = str(rec[ck]).strip()
+            break
+    if _is_madrid_strict(city) or _is_madrid_soft(city):
+        return out
+    lat = rec.get(lat_key)
+    lon = rec.get(lon_key)
+    if _in_bbox(lat, lon):
+        return out
+    addr_text = " ".join(str(rec.get(k) or "") for k in addr_keys)
+    if _is_madrid_soft(addr_text):
+        return out
+    return None
+
+
+def _df_ide(rows: List[Dict]) -> pd.DataFrame:
+    df = pd.DataFrame(rows)
+    for c in rt.IDE_COLUMNS:
+        if c not in df.columns:
+            df[c] = None
+    df = df[df["municipio"].apply(_is_madrid_strict)]
+    return df.reset_index(drop=True)
+
+
+def _df_passthrough(rows: List[Dict], required: List[str] | None = None) -> pd.DataFrame:
+    df = pd.DataFrame(rows)
+    if required:
+        for c in required:
+            if c not in df.columns:
+                df[c] = None
+    return df.reset_index(drop=True)
+
+
+def _unify_ide(rec: Dict) -> Dict:
+    street = rec.get("via")
+    number = rec.get("numero")
+    lat = _to_float(rec.get("lat"))
+    lon = _to_float(rec.get("lon"))
+    start_iso = _ts_from_date_time(rec.get("fecha"), rec.get("hora_inicio"))
+    end_iso = _ts_from_date_time(rec.get("fecha"), rec.get("hora_fin"))
+    out = {
+        "source": "ide",
+        "category": "electricity",
+        "status": "planned",
+        "city": "Madrid",
+        "street": street,
+        "street_number": number,
+        "lat": lat,
+        "lon": lon,
+        "start_ts_utc": start_iso,
+        "end_ts_utc": end_iso,
+        "description": None,
+        "event_id": None,
+        "ingested_at_utc": _now_utc_iso()
+    }
+    out["fingerprint"] = _fp(out["city"], out["street"], out["street_number"], out["category"], out["source"], out["start_ts_utc"])
+    return out
+
+
+def _unify_canal(rec: Dict) -> Dict:
+    street = rec.get("via") or rec.get("street") or rec.get("direccion")
+    number = rec.get("numero") or rec.get("street_number")
+    lat = _to_float(rec.get("lat") or rec.get("latitude"))
+    lon = _to_float(rec.get("lon") or rec.get("longitude"))
+    start_iso = _to_utc_iso(rec.get("start_ts_utc") or rec.get("start_ts") or rec.get("start") or rec.get("inicio"))
+    end_iso = _to_utc_iso(rec.get("end_ts_utc") or rec.get("end_ts") or rec.get("end") or rec.get("fin"))
+    status = str(rec.get("status") or rec.get("estado") or "active")
+    out = {
+        "source": "canal",
+        "category": "water",
+        "status": status,
+        "city": "Madrid",
+        "street": street,
+        "street_number": number,
+        "lat": lat,
+        "lon": lon,
+        "start_ts_utc": start_iso,
+        "end_ts_utc": end_iso,
+        "description": rec.get("mensaje"),
+        "event_id": rec.get("event_id"),
+        "ingested_at_utc": _now_utc_iso()
+    }
+    out["fingerprint"] = _fp(out["city"], out["street"], out["street_number"], out["category"], out["source"], out["start_ts_utc"])
+    return out
+
+
+def _unify_ayto(rec: Dict) -> Dict:
+    street = rec.get("via") or rec.get("street") or rec.get("calle") or rec.get("direccion")
+    number = rec.get("numero") or rec.get("street_number")
+    lat = _to_float(rec.get("lat") or rec.get("latitude"))
+    lon = _to_float(rec.get("lon") or rec.get("longitude"))
+    start_iso = _to_utc_iso(rec.get("start_ts") or rec.get("start_ts_utc") or rec.get("inicio"))
+    end_iso = _to_utc_iso(rec.get("end_ts") or rec.get("end_ts_utc") or rec.get("fin"))
+    status = str(rec.get("status") or rec.get("estado") or "active")
+    event_id = rec.get("event_id") or rec.get("id_incidencia") or rec.get("codigo")
+    out = {
+        "source": "ayto",
+        "category": "road",
+        "status": status,
+        "city": "Madrid",
+        "street": street,
+        "street_number": number,
+        "lat": lat,
+        "lon": lon,
+        "start_ts_utc": start_iso,
+        "end_ts_utc": end_iso,
+        "description": rec.get("descripcion"),
+        "event_id": event_id,
+        "ingested_at_utc": _now_utc_iso()
+    }
+    out["fingerprint"] = _fp(out["city"], out["street"], out["street_number"], out["category"], out["source"], out["start_ts_utc"])
+    return out
+
+
+def _unify_gas(rec: Dict) -> Dict:
+    street = rec.get("via") or rec.get("street") or rec.get("direccion")
+    number = rec.get("numero") or rec.get("street_number")
+    lat = _to_float(rec.get("lat"))
+    lon = _to_float(rec.get("lon"))
+    start_iso = _to_utc_iso(rec.get("start_ts_utc") or rec.get("start_ts") or rec.get("start"))
+    end_iso   = _to_utc_iso(rec.get("end_ts_utc")   or rec.get("end_ts")   or rec.get("end"))
+    status = str(rec.get("status") or ("planned" if rec.get("programado") else "unplanned"))
+    out = {
+        "source": "gas",
+        "category": "gas",
+        "status": status,
+        "city": "Madrid",
+        "street": street,
+        "street_number": number,
+        "lat": lat,
+        "lon": lon,
+        "start_ts_utc": start_iso,
+        "end_ts_utc": end_iso,
+        "description": rec.get("descripcion") or rec.get("mensaje"),
+        "event_id": rec.get("event_id"),
+        "ingested_at_utc": _now_utc_iso()
+    }
+    out["fingerprint"] = _fp(out["city"], out["street"], out["street_number"], out["category"], out["source"], out["start_ts_utc"])
+    return out
+
+
+def _raw_rows(source):
+    rows = []
+    for fp in sorted((RAW / source).glob("*/*.json")):
+        rows += _read_json(fp)
+    return rows
+
+
+def _none(values):
+    return [None if isinstance(v, float) and v != v else v for v in values]
+
+
+def test_string_cleaners_match_per_record():
+    values = EDGE_TEXT + [r.get(k) for r in _raw_rows("ide") for k in ("via", "numero", "municipio")]
+    s = pd.Series(values, dtype=object)
+    assert _none(cols.clean_via(s)) == [_clean_via(v) for v in values]
+    assert _none(cols.clean_num(s)) == [rt._clean_num(v) for v in values]
+    assert cols.is_madrid_strict(s).tolist() == [_is_madrid_strict(v) for v in values]
+    assert cols.is_madrid_soft(s).tolist() == [_is_madrid_soft(v) for v in values]
+
+
+def test_timestamps_match_per_record():
+    s = pd.Series(EDGE_TS + [r.get("start_ts") for r in _raw_rows("ayto")], dtype=object)
+    assert _none(cols.to_utc_iso(s)) == [_to_utc_iso(v) for v in s]
+    dates = EDGE_DATES + [(r.get("fecha"), r.get("hora_inicio")) for r in _raw_rows("ide")]
+    d = pd.Series([x[0] for x in dates], dtype=object)
+    t = pd.Series([x[1] for x in dates], dtype=object)
+    assert _none(cols.iso_z(cols.ts_from_date_time(d, t))) == [_ts_from_date_time(*x) for x in dates]
+
+
+def test_ide_numbers_match_per_record():
+    rows = [
+        {"municipio": "Madrid", "via": "C/ Mayor", "numero": "1-2000"},
+        {"municipio": "Madrid", "via": "C/ Mayor", "numero": "12 B"},
+        {"municipio": "Madrid", "via": "C/ Mayor", "numero": "2-40 pares", "numero_desde": 2,
+         "numero_hasta": 40, "paridad": "par"},
+        {"municipio": "Madrid", "via": "C/ Mayor", "numero": "7", "numero_desde": 7,
+         "numero_hasta": 7, "paridad": None},
+        {"municipio": "Madrid", "via": "C/ Mayor", "numero": "s/n"},
+        {"municipio": "Madrid", "via": "C/ Mayor", "numero": None},
+    ]
+    ref = [_clean_ide_record(r) for r in rows]
+    df = cols.ide_numbers(pd.DataFrame(rows))
+    for c in ("numero", "numero_desde", "numero_hasta", "paridad"):
+        assert cols.column(df, c).tolist() == [r[c] for r in ref], c
+    assert df["numero"].tolist()[:3] == ["1-2000", "12B", "2-40 pares"]
+    assert cols.geocode_number(df).tolist()[:3] == ["1", "12B", "2"]
+    assert [_ide_geocode_number(r) for r in ref][:3] == ["1", "12B", "2"]
+
+
+def test_madrid_dst_edges_are_utc_aware():
+    d = pd.Series(["26/10/2025", "26/10/2025", "30/03/2025", "30/03/2025"], dtype=object)
+    t = pd.Series(["01:59", "02:30", "01:59", "02:30"], dtype=object)
+    ts = cols.ts_from_date_time(d, t)
+    assert str(ts.dtype) == "datetime64[us, UTC]"
+    # octubre: la hora repetida se toma en verano (+02); marzo: la inexistente con el offset de invierno
+    assert cols.iso_z(ts).tolist() == ["2025-10-25T23:59:00Z", "2025-10-26T00:30:00Z",
+                                       "2025-03-30T00:59:00Z", "2025-03-30T01:30:00Z"]
+
+
+def test_desc_split_matches_per_record():
+    descs = [None, "", "Calle Mayor nº 5 corte", "  Obras en Gran Vía, num. 12B", "Sin número", "numero: 7",
+             "Paseo  del Prado N° 3"] + [r.get("descripcion") for r in _raw_rows("ayto")]
+    street, number = cols.ayto_split_desc(pd.Series(descs, dtype=object))
+    assert list(zip(_none(street), _none(number))) == [_ayto_extract_from_desc(d) for d in descs]
+
+
+def _fill_from_coords(rt, records):
+    """Relleno de vía/número por coordenadas registro a registro (oráculo de
+    ``_ayto_fill_from_coords_df``)."""
+    todo = []
+    for rec in records:
+        st = rec.get("via") or rec.get("street")
+        num = rec.get("numero") or rec.get("street_number")
+        if not st or not num:
+            lat = _to_float(rec.get("lat") or rec.get("latitude"))
+            lon = _to_float(rec.get("lon") or rec.get("longitude"))
+            if lat is not None and lon is not None:
+                todo.append((rec, st, num, (lat, lon)))
+    found = rt._geocoder().reverse_many(c for _, _, _, c in todo) if todo else {}
+    for rec, st, num, coords in todo:
+        via_rc, num_rc = found.get(coords, (None, None))
+        if not st and via_rc:
+            rec["via"] = rec["street"] = via_rc
+        if not num and num_rc:
+            rec["numero"] = rec["street_number"] = num_rc
+    return records
+
+
+def _reference(source, raw_rows):
+    """El camino por registro de antes: (registros limpios, registros unificados)."""
+    def gm(city_keys, addr_keys):
+        return [c for r in raw_rows if (c := _clean_generic_madrid(r, city_keys, addr_keys)) is not None]
+
+    if source == "ide":
+        cleaned = [c for r in raw_rows if (c := _clean_ide_record(r)) is not None]
+        unified = [_unify_ide(c) for c in cleaned]
+        return _df_ide(cleaned), unified
+    if source == "canal":
+        cleaned = gm(["municipio", "city"], ["via", "street", "direccion"])
+        return _df_passthrough(cleaned), [_unify_canal(c) for c in cleaned]
+    if source == "ayto":
+        cleaned = _fill_from_coords(rt, _ayto_enrich_with_desc(
+            gm(["municipio", "city"], ["via", "street", "calle", "direccion", "descripcion"])))
+        return _df_passthrough(cleaned), [_unify_ayto(c) for c in cleaned]
+    cleaned = gm(["city"], ["street", "direccion"])
+    return _df_passthrough(cleaned), [_unify_gas(c) for c in cleaned]
+
+
+def _roundtrip(df, source):
+    buf = io.BytesIO()
+    pq.write_table(schemas.table(df, source), buf)
+    buf.seek(0)
+    return buf
+
+
+@pytest.mark.parametrize("chunk_rows", [50000, 7])
+@pytest.mark.parametrize("source", ["ide", "canal", "ayto", "gas"])
+def test_transform_task_golden(transform_env, monkeypatch, source, chunk_rows):
+    rt = transform_env
+    monkeypatch.setattr(rt.stream, "CHUNK_ROWS", chunk_rows)
+    for fp in sorted((rt.RAW / source).glob("*/*.json")):
+        raw_rows = _read_json(fp)
+        outputs = rt._transform_task(source, fp, "2025-01-01")
+        if source == "ayto" and "events" not in fp.stem.lower():
+            assert outputs == []
+            continue
+        ref_df, ref_unified = _reference(source, raw_rows)
+        df = pd.read_parquet(outputs[0])
+        ref = pd.read_parquet(_roundtrip(ref_df, source)).drop(columns=rt.TS_COLUMNS)
+        pd.testing.assert_frame_equal(df.drop(columns=rt.TS_COLUMNS), ref)
+        for c in ("start_ts_utc", "end_ts_utc"):
+            assert _none(cols.iso_z(df[c])) == [r[c] for r in ref_unified]
+        assert df["ingested_at_utc"].nunique() == 1
+        got = json.loads(outputs[1].read_text(encoding="utf-8"))
+        for r in got + ref_unified:
+            r.pop("ingested_at_utc")
+        assert got == ref_unified
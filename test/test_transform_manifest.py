@@ -0,0 +1,92 @@
+import json
+
+
+def _count_tasks(rt, monkeypatch):
+    calls = []
+    orig = rt._transform_task
+
+    def _spy(source, fp, dt):
+        calls.append((source, fp.name))
+        return orig(source, fp, dt)
+
+    monkeypatch.setattr(rt, "_transform_task", _spy)
+    return calls
+
+
+def test_unchanged_files_are_skipped(transform_env, monkeypatch):
+    rt = transform_env
+    calls = _count_tasks(rt, monkeypatch)
+    rt.run()
+    assert len(calls) == len(rt._tasks(rt.SOURCES))
+    daily = rt.CUR / "gas" / "dt=2025-10-22" / "part-000.parquet"
+    mtime = daily.stat().st_mtime_ns
+
+    calls.clear()
+    rt.run()
+    assert calls == []
+    assert daily.stat().st_mtime_ns == mtime
+
+
+def test_only_changed_partition_is_rebuilt(transform_env, monkeypatch):
+    rt = transform_env
+    rt.run()
+    calls = _count_tasks(rt, monkeypatch)
+    untouched = rt.CUR / "gas" / "dt=2025-10-25" / "part-000.parquet"
+    mtime = untouched.stat().st_mtime_ns
+
+    fp = rt.RAW / "gas" / "20251022" / "cortes_gas_2025-10-22_al_2025-10-29.json"
+    rows = json.loads(fp.read_text(encoding="utf-8"))[:5]
+    fp.write_text(json.dumps(rows), encoding="utf-8")
+    rt.run()
+
+    assert calls == [("gas", fp.name)]
+    assert untouched.stat().st_mtime_ns == mtime
+    import pandas as pd
+    assert len(pd.read_parquet(rt.CUR / "gas" / "dt=2025-10-22" / "part-000.parquet")) == 5
+    assert len(pd.read_parquet(rt.CUR / "union" / "dt=2025-10-22" / "part-000.parquet")
+               .query("source == 'gas'")) == 5
+
+
+def test_removed_file_drops_its_partition(transform_env):
+    rt = transform_env
+    rt.run()
+    (rt.RAW / "canal" / "20251022" / "cortes_agua_canalisabelii.json").unlink()
+    rt.run()
+    assert not (rt.CUR / "canal" / "dt=2025-10-22").exists()
+
+
+def test_backfill_selection_only_touches_selected_partitions(transform_env, monkeypatch):
+    rt = transform_env
+    rt.run()
+    calls = _count_tasks(rt, monkeypatch)
+    other_dt = rt.CUR / "gas" / "dt=2025-10-25" / "part-000.parquet"
+    other_src = rt.CUR / "canal" / "dt=2025-10-22" / "part-000.parquet"
+    other_union = rt.CUR / "union" / "dt=2025-10-25" / "part-000.parquet"
+    mtimes = {fp: fp.stat().st_mtime_ns for fp in (other_dt, other_src, other_union)}
+
+    # --full con selección: sólo se reprocesa gas 2025-10-22, y no se olvida lo no seleccionado
+    rt.run(full=True, sources=["gas"], dts=("2025-10-22", "2025-10-22"))
+    assert {(s, n) for s, n in calls} == {("gas", fp.name) for s, fp, dt in rt._tasks(["gas"]) if dt == "2025-10-22"}
+    assert all(fp.stat().st_mtime_ns == m for fp, m in mtimes.items())
+    assert len(rt._load_manifest().files) == len(rt._tasks(rt.SOURCES))
+
+    calls.clear()
+    rt.run(full=True, dts=("2025-10-23", None))
+    assert sorted(calls) == sorted((s, fp.name) for s, fp, dt in rt._tasks(rt.SOURCES) if dt >= "2025-10-23")
+
+
+def test_ndjson_raw_replaces_json_of_same_name(transform_env):
+    import pandas as pd
+    rt = transform_env
+    rt.run()
+    daily = rt.CUR / "ayto" / "dt=2025-10-22" / "part-000.parquet"
+    before = pd.read_parquet(daily).drop(columns=["ingested_at_utc"])
+
+    fp = rt.RAW / "ayto" / "20251022" / "incid_ayto_events.json"
+    nd = fp.with_suffix(".ndjson")
+    nd.write_text("".join(json.dumps(e, ensure_ascii=False) + "\n"
+                          for e in json.loads(fp.read_text(encoding="utf-8"))), encoding="utf-8")
+    names = [p.name for p, dt in rt._iter_json_files("ayto") if dt == "2025-10-22"]
+    assert nd.name in names and fp.name not in names
+    rt.run()
+    pd.testing.assert_frame_equal(pd.read_parquet(daily).drop(columns=["ingested_at_utc"]), before)
@@ -0,0 +1,24 @@
+import json
+
+
+def test_run_writes_metrics_report(transform_env):
+    rt = transform_env
+    report_fp = rt.run(profile=True)
+    rep = json.loads(report_fp.read_text(encoding="utf-8"))
+    assert json.loads((rt.REPORTS / "transform_latest.json").read_text(encoding="utf-8")) == rep
+
+    ide = rep["sources"]["ide"]
+    assert {"read", "clean", "geocode", "unify", "write"} <= set(ide["stages"])
+    assert "history" not in ide["stages"]
+    c = ide["counters"]
+    assert c["files"] == 3 and c["rows_in"] == 63 and 0 < c["rows_out"] <= c["rows_in"]
+    assert c["bytes_written"] > 0 and "gazetteer_hits" in c
+    assert set(rep["sources"]["union"]["stages"]) == {"union"}
+    assert rep["partitions"]["gas"] == ["2025-10-22", "2025-10-25"]
+
+    profiles = {p.name for p in rt.REPORTS.glob("profile_*/*.prof")}
+    assert "ide.geocode.cortes_ide_events.prof" in profiles and "union.union.prof" in profiles
+
+    # sin cambios: no hay tareas, sólo queda el informe
+    rep = json.loads(rt.run().read_text(encoding="utf-8"))
+    assert rep["sources"] == {"union": rep["sources"]["union"]} and rep["partitions"] == {}
@@ -0,0 +1,12 @@
+from etl.transform import numbers
+
+
+def test_parse_and_expand_intervals():
+    assert numbers.parse_numbers("1-2000, 7 B, 2-40 pares, 9 - 3, s/n") == [
+        ("1-2000", 1, 2000, "todos"), ("7B", 7, 7, "todos"), ("2-40pares", 2, 40, "par"),
+        ("9-3", None, None, "todos"), ("s/n", None, None, "todos")]
+    assert numbers.expand(1, 6) == [1, 2, 3, 4, 5, 6]
+    assert numbers.expand(1, 9, "par") == [2, 4, 6, 8]
+    assert numbers.expand(2, 9, "impar") == [3, 5, 7, 9]
+    assert numbers.expand(1, 5000) == []
+    assert numbers.label(2, 40, "par") == "2-40 pares"
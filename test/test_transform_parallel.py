@@ -0,0 +1,32 @@
+import pandas as pd
+
+
+def _snapshot(cur):
+    # la marca de ingesta es la hora de cada ejecución
+    return {p.relative_to(cur).as_posix(): pd.read_parquet(p).drop(columns="ingested_at_utc", errors="ignore")
+            for p in sorted(cur.rglob("*.parquet"))}
+
+
+def test_parallel_run_matches_serial(transform_env, tmp_path):
+    rt = transform_env
+    rt.run(workers=1)
+    serial = _snapshot(rt.CUR)
+    assert "union/dt=2025-10-22/part-000.parquet" in serial
+    assert not any(k.endswith("history.parquet") for k in serial)
+
+    rt.CUR.rename(tmp_path / "serial")
+    rt.run(workers=3)
+    parallel = _snapshot(rt.CUR)
+
+    assert serial.keys() == parallel.keys()
+    for key in serial:
+        pd.testing.assert_frame_equal(serial[key], parallel[key])
+
+
+def test_files_of_same_day_are_merged_without_duplicates(transform_env):
+    rt = transform_env
+    rt.run()
+    ide = pd.read_parquet(rt.CUR / "ide" / "dt=2025-10-25" / "part-000.parquet")
+    # cortes_ide_events.json es copia de uno de los simulados: no debe duplicar filas
+    assert len(ide) == len(ide.drop_duplicates())
+    assert len(ide) > 21
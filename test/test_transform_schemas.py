@@ -0,0 +1,34 @@
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from etl.transform import schemas
+
+
+def test_table_follows_source_schema():
+    df = pd.DataFrame({"tipo": ["obras", "obras"], "lat": ["40,41", "x"], "estado": [None, None],
+                       "es_obras": ["1", None], "extra": [1, 2]})
+    t = schemas.table(df, "ayto")
+    assert t.schema.names == schemas.SCHEMAS["ayto"].names + ["extra"]
+    assert t.schema.field("tipo").type == schemas.DICT
+    assert t.schema.field("estado").type == schemas.DICT
+    assert t.column("lat").to_pylist() == [40.41, None]
+    assert t.column("es_obras").to_pylist() == [True, None]
+    assert t.column("extra").type == pa.int64()
+
+
+def test_written_parquet_is_zstd_with_stats_and_pushdown(tmp_path):
+    for dt, city in (("2025-10-22", "Madrid"), ("2025-10-23", "Getafe")):
+        df = pd.DataFrame({"municipio": [city] * 3, "via": ["a", "b", "c"], "lat": [40.1, 40.2, 40.3]})
+        fp = tmp_path / f"dt={dt}" / "part-000.parquet"
+        fp.parent.mkdir()
+        pq.write_table(schemas.table(df, "ide"), fp, **schemas.WRITE_OPTS)
+    col = pq.read_metadata(fp).row_group(0).column(0)
+    assert col.compression == "ZSTD" and col.is_stats_set and col.has_dictionary_page
+    assert col.statistics.min == col.statistics.max == "Getafe"
+
+    glob = (tmp_path / "dt=*" / "part-*.parquet").as_posix()
+    rel = f"read_parquet('{glob}', union_by_name=true, hive_partitioning=true)"
+    rows = duckdb.sql(f"select dt::varchar, via from {rel} where municipio = 'Madrid' and lat > 40.15 order by via").fetchall()
+    assert rows == [("2025-10-22", "b"), ("2025-10-22", "c")]
@@ -0,0 +1,72 @@
+import json
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from etl.transform import stream
+
+
+def _dump(tmp_path, name, data):
+    fp = tmp_path / name
+    fp.write_text(json.dumps(data), encoding="utf-8")
+    return fp
+
+
+def test_iter_records_layouts(tmp_path):
+    rows = [{"a": 1, "b": 2.5}, {"a": 2, "b": None}]
+    assert list(stream.iter_records(_dump(tmp_path, "l.json", rows))) == rows
+    # la clave con más prioridad gana aunque aparezca después
+    wrapped = {"meta": {"n": 2}, "events": [{"x": 0}], "items": rows}
+    assert list(stream.iter_records(_dump(tmp_path, "d.json", wrapped))) == rows
+    assert list(stream.iter_records(_dump(tmp_path, "e.json", {"events": rows, "items": "no"}))) == rows
+    assert list(stream.iter_records(_dump(tmp_path, "o.json", {"a": 1}))) == [{"a": 1}]
+    assert list(stream.iter_records(_dump(tmp_path, "s.json", 3))) == []
+
+
+def test_json_array_writer_matches_dumps(tmp_path):
+    recs = [{"a": "ñ", "b": [1, {"c": None}]}, {"a": 1.5, "b": {}}, {"a": True, "b": 1}, {"a": None, "b": "1"}]
+    with stream.JsonArrayWriter(tmp_path / "out.json") as w:
+        w.write(recs[:1])
+        w.write([])
+        w.write(recs[1:2])
+        # por columnas, sin construir los dicts
+        w.write_columns(["a", "b"], [[r["a"] for r in recs[2:]], [r["b"] for r in recs[2:]]])
+    assert (tmp_path / "out.json").read_text(encoding="utf-8") == json.dumps(recs, ensure_ascii=False, indent=2)
+    with stream.JsonArrayWriter(tmp_path / "out.json") as w:
+        w.write([])
+    assert not (tmp_path / "out.json").exists()
+
+
+def test_row_group_writer_fixed_sizes(tmp_path):
+    schema = pa.schema([("n", pa.int64())])
+    with stream.RowGroupWriter(tmp_path / "rg.parquet", schema, rows=4) as w:
+        for start in (0, 3, 5, 11):
+            w.write(pa.table({"n": list(range(start, start + 3))}, schema=schema))
+    md = pq.ParquetFile(tmp_path / "rg.parquet").metadata
+    assert [md.row_group(i).num_rows for i in range(md.num_row_groups)] == [4, 4, 4]
+    assert not (tmp_path / "rg.parquet.tmp").exists()
+
+
+def test_concat_parquet_unifies_and_dedupes(tmp_path):
+    a, b = tmp_path / "a.parquet", tmp_path / "b.parquet"
+    pd.DataFrame({"x": [1, 2, 1], "y": ["p", "q", "p"]}).to_parquet(a, index=False)
+    pd.DataFrame({"x": [2.5, 2.0], "z": [True, None], "y": [None, "q"]}).to_parquet(b, index=False)
+    out = tmp_path / "out.parquet"
+    assert stream.concat_parquet([a, b], out, dedupe=True, rows=2) == 3
+    df = pd.read_parquet(out)
+    assert list(df.columns) == ["x", "y", "z"]
+    assert df["x"].tolist() == [1.0, 2.0, 2.5]
+    assert df["z"].isna().tolist() == [True, True, False]
+
+    assert stream.concat_parquet([a, b], out, constants=[{"source": "s1"}, {"source": "s2"}]) == 5
+    assert pd.read_parquet(out)["source"].tolist() == ["s1"] * 3 + ["s2"] * 2
+
+
+def test_concat_parquet_dedupe_ignores_columns(tmp_path):
+    a, b = tmp_path / "a.parquet", tmp_path / "b.parquet"
+    pd.DataFrame({"x": [1, 2], "ing": ["t0", "t0"]}).to_parquet(a, index=False)
+    pd.DataFrame({"x": [2, 3], "ing": ["t1", "t1"]}).to_parquet(b, index=False)
+    out = tmp_path / "out.parquet"
+    assert stream.concat_parquet([a, b], out, dedupe=True, dedupe_ignore=["ing"]) == 3
+    assert pd.read_parquet(out)["ing"].tolist() == ["t0", "t0", "t1"]
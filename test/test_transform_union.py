@@ -0,0 +1,26 @@
+import pandas as pd
+
+from etl.transform import schemas, union
+
+
+def _part(cur, source, dt, df):
+    d = cur / source / f"dt={dt}"
+    d.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(d / "part-000.parquet", index=False)
+
+
+def test_union_with_duckdb(tmp_path):
+    _part(tmp_path, "ide", "2025-10-22", pd.DataFrame({"municipio": ["Madrid"] * 2, "via": ["b", "a"]}))
+    _part(tmp_path, "gas", "2025-10-22", pd.DataFrame({"via": ["c"], "lat": [40.4], "nuevo": [7]}))
+    _part(tmp_path, "gas", "2025-10-23", pd.DataFrame({"via": ["d"]}))
+
+    outs = union.build_union(tmp_path, ["ide", "canal", "gas"], ["2025-10-22", "2025-10-24"])
+    df = pd.read_parquet(outs[0])
+    assert df.columns.tolist() == schemas.UNION.names + ["nuevo"]
+    assert df["source"].tolist() == ["ide", "ide", "gas"]
+    assert df["via"].tolist() == ["b", "a", "c"]
+    assert df["nuevo"].tolist()[2] == 7
+    # dt sin datos: parquet vacío con el esquema de union; el 23 no se ha pedido
+    assert pd.read_parquet(outs[1]).empty
+    assert not (tmp_path / "union" / "dt=2025-10-23").exists()
+